@@ -1,4 +1,5 @@
-from GimelStudio.datatypes import RenderImage
+from GimelStudio.datatypes import (RenderImage, PointTransform,
+                                   GeometricTransform)
 from GimelStudio.node import (
     NodeBase,
     Parameter, RenderImageParam,
@@ -27,17 +27,19 @@ import webbrowser
 
 import wx
 import wx.lib.agw.aui as aui
-import wx.lib.delayedresult as delayedresult
 import wx.lib.agw.flatmenu as flatmenu
 
 from GimelStudio import utils
 from GimelStudio import meta
 from GimelStudio.interface import (NodeGraph, NodePropertyPanel,
                                    ImageViewport, NodeGraphDropTarget,
-                                   DeveloperLog, DarkMenuRenderer, ExportImageAs)
+                                   DeveloperLog, DarkMenuRenderer, ExportImageAs,
+                                   ExportNodeGraphAs)
 from GimelStudio.program import (AboutDialog, LicenseDialog)
 from GimelStudio.project import GimelStudioProject
-from GimelStudio.renderer import Renderer, RenderThread, EVT_RENDER_RESULT
+from GimelStudio.node.thumbnails import GetThumbnailThread
+from GimelStudio.renderer import Renderer, OpenPersistentCache
+from GimelStudio.renderer.thread import RenderThread, EVT_RENDER_RESULT
 from GimelStudio.registry import REGISTERED_NODES
 from GimelStudio.datafiles import *
 
@@ -62,8 +64,13 @@ class MainApplication(wx.Frame):
         #     pass
 
         # Threading
-        self._jobID = 0
-        self._abortEvent = delayedresult.AbortEvent()
+        self._renderThread = None
+        self._thumbsRedrawPending = False
+
+        # Preview quality. Renders below full quality are followed by a
+        # full resolution render once the edits stop.
+        self._renderQuality = 1.0
+        self._fullRenderCall = None
 
         # Set the program icon
         self.SetIcon(ICON_GIMELSTUDIO_ICO.GetIcon())
@@ -82,7 +89,14 @@ class MainApplication(wx.Frame):
     def _InitProgramBackend(self):
         # Init project, renderer and user preferences manager
         self._project = GimelStudioProject(self)
-        self._renderer = Renderer(self)
+        store = None
+        if meta.ENABLE_PERSISTENT_CACHE is True:
+            store = OpenPersistentCache()
+        self._renderer = Renderer(self, store=store)
+        if meta.ENABLE_THREADING is True:
+            self._renderThread = RenderThread(self, self._renderer)
+            EVT_RENDER_RESULT(self, self.OnRenderResult)
+        GetThumbnailThread().SetCallback(self.OnThumbnailsReady)
         # self._userPrefManager = UserPreferencesManager(self)
 
         # Load the user preferences from the .json file
@@ -170,6 +184,15 @@ class MainApplication(wx.Frame):
             subMenu=None
         )
 
+        self.exportnodegraph_menuitem = flatmenu.FlatMenuItem(
+            file_menu,
+            id=wx.ID_ANY,
+            label="Export Node Graph As...",
+            helpString="Export the node graph to a file for the gimelstudio-render command",
+            kind=wx.ITEM_NORMAL,
+            subMenu=None
+        )
+
         self._menubar.AddSeparator()
 
         self.quit_menuitem = flatmenu.FlatMenuItem(
@@ -230,6 +253,40 @@ class MainApplication(wx.Frame):
             subMenu=None
         )
 
+        quality_menu = flatmenu.FlatMenu()
+        self._qualityMenuItems = {}
+        for label, quality in [("Full", 1.0), ("Half (1/2)", 0.5),
+                               ("Quarter (1/4)", 0.25)]:
+            item = flatmenu.FlatMenuItem(
+                quality_menu,
+                id=wx.ID_ANY,
+                label=label,
+                helpString="Preview renders at {} resolution while editing".format(label.lower()),
+                kind=wx.ITEM_RADIO,
+                subMenu=None
+            )
+            quality_menu.AppendItem(item)
+            self._qualityMenuItems[item.GetId()] = (item, quality)
+
+        self.renderquality_menuitem = flatmenu.FlatMenuItem(
+            render_menu,
+            id=wx.ID_ANY,
+            label="Preview Quality",
+            helpString="Set the resolution of the renders while editing",
+            kind=wx.ITEM_NORMAL,
+            subMenu=quality_menu
+        )
+
+        self.clearcache_menuitem = flatmenu.FlatMenuItem(
+            render_menu,
+            id=wx.ID_ANY,
+            label="Clear Cache",
+            helpString="Delete the node outputs kept for re-rendering, "
+                       "including the ones kept on disk between sessions",
+            kind=wx.ITEM_NORMAL,
+            subMenu=None
+        )
+
         # Window
         self.togglefullscreen_menuitem = flatmenu.FlatMenuItem(
             window_menu,
@@ -324,6 +381,7 @@ class MainApplication(wx.Frame):
         # file_menu.AppendItem(self.saveprojectfile_menuitem)
         # file_menu.AppendItem(self.saveprojectfileas_menuitem)
         file_menu.AppendItem(self.exportasimage_menuitem)
+        file_menu.AppendItem(self.exportnodegraph_menuitem)
         file_menu.AppendItem(self.quit_menuitem)
 
         view_menu.AppendItem(self.togglenodegraphgrid_menuitem)
@@ -332,6 +390,8 @@ class MainApplication(wx.Frame):
 
         render_menu.AppendItem(self.toggleautorender_menuitem)
         render_menu.AppendItem(self.renderimage_menuitem)
+        render_menu.AppendItem(self.renderquality_menuitem)
+        render_menu.AppendItem(self.clearcache_menuitem)
 
         window_menu.AppendItem(self.togglefullscreen_menuitem)
         window_menu.AppendItem(self.maximizewindow_menuitem)
@@ -356,6 +416,8 @@ class MainApplication(wx.Frame):
         self.toggleautorender_menuitem.Check(True)
         self.toggleimageviewport_menuitem.Check(True)
         self.renderasbackground_menuitem.Check(False)
+        for item, quality in self._qualityMenuItems.values():
+            item.Check(quality == 1.0)
 
         # Add menubar to main sizer
         self.mainSizer.Add(self._menubar, 0, wx.EXPAND)
@@ -365,6 +427,8 @@ class MainApplication(wx.Frame):
         # Bind events
         self.Bind(flatmenu.EVT_FLAT_MENU_SELECTED,
                   self.OnExportImage, self.exportasimage_menuitem)
+        self.Bind(flatmenu.EVT_FLAT_MENU_SELECTED,
+                  self.OnExportNodeGraph, self.exportnodegraph_menuitem)
         self.Bind(flatmenu.EVT_FLAT_MENU_SELECTED,
                   self.OnQuit, self.quit_menuitem)
 
@@ -379,6 +443,11 @@ class MainApplication(wx.Frame):
                   self.OnToggleAutoRender, self.toggleautorender_menuitem)
         self.Bind(flatmenu.EVT_FLAT_MENU_SELECTED,
                   self.OnRender, self.renderimage_menuitem)
+        for item, quality in self._qualityMenuItems.values():
+            self.Bind(flatmenu.EVT_FLAT_MENU_SELECTED,
+                      self.OnRenderQuality, item)
+        self.Bind(flatmenu.EVT_FLAT_MENU_SELECTED,
+                  self.OnClearCache, self.clearcache_menuitem)
 
         self.Bind(flatmenu.EVT_FLAT_MENU_SELECTED,
                   self.OnToggleFullscreen, self.togglefullscreen_menuitem)
@@ -539,8 +608,14 @@ class MainApplication(wx.Frame):
 
 
     def OnExportImage(self, event):
+        # Never export a lower quality preview render
+        if self._renderer.GetScale() != 1.0:
+            self._renderer.Render(self._nodeGraph.GetNodes())
         ExportImageAs(self, self._renderer.GetRender())
 
+    def OnExportNodeGraph(self, event):
+        ExportNodeGraphAs(self, self._nodeGraph.GetNodes())
+
     def OnToggleLiveNodePreviewUpdate(self, event):
         if self.livenodepreviewupdate_menuitem.IsChecked() is False:
             self._nodeGraph.SetLiveNodePreviewUpdate(False)
@@ -605,7 +680,19 @@ class MainApplication(wx.Frame):
 
     def OnRender(self, event):
         """ Event handler for rendering the current Node Graph. """
-        self.Render()
+        self.Render(1.0)
+
+    def OnRenderQuality(self, event):
+        """ Event handler for setting the preview quality. """
+        item, quality = self._qualityMenuItems[event.GetId()]
+        for other, other_quality in self._qualityMenuItems.values():
+            other.Check(other is item)
+        self._renderQuality = quality
+
+    def OnClearCache(self, event):
+        """ Event handler for clearing the node output cache. """
+        self._renderer.ClearCache()
+        print("[INFO] Cleared the node output cache")
 
     def OnQuit(self, event):
         quitdialog = wx.MessageDialog(self,
@@ -615,6 +702,8 @@ class MainApplication(wx.Frame):
 
         if quitdialog.ShowModal() is wx.ID_YES:
             quitdialog.Destroy()
+            if self._renderThread is not None:
+                self._renderThread.Stop()
             self._mgr.UnInit()
             del self._mgr
             self.Destroy()
@@ -645,61 +734,66 @@ class MainApplication(wx.Frame):
         dialog = LicenseDialog(self)
         dialog.ShowDialog()
 
-    def Render(self):
+    def Render(self, scale=None):
         """ Callable render method. This is intended to be the 'master' render
         method, called when the Node Graph image is to be rendered. After this is
         complete, the result event will be called.
+
+        :param scale: scale of the render relative to the full resolution,
+        defaults to the preview quality
         """
+        if scale is None:
+            scale = self._renderQuality
+
+        # Refine lower quality renders at full resolution once
+        # no more edits have been made for a while.
+        if self._fullRenderCall is not None:
+            self._fullRenderCall.Stop()
+        if scale != 1.0:
+            self._fullRenderCall = wx.CallLater(meta.FULL_RENDER_DELAY,
+                                                self.Render, 1.0)
+
+        self._imageViewport.UpdateInfoText(True)
         if meta.ENABLE_THREADING is True:
-            self._abortEvent.clear()
-            self._jobID += 1
-            delayedresult.startWorker(
-                self._PostRender,
-                self._Render,
-                wargs=(self._jobID, self._abortEvent),
-                jobID=self._jobID
-            )
+            # Only the newest state of the node graph is rendered, the
+            # render in progress (if any) is cancelled. The result is
+            # handled by OnRenderResult on the main thread.
+            self._renderThread.Request(self._nodeGraph.GetNodes(), scale)
         else:
-            self._imageViewport.UpdateInfoText(True)
-            self._renderer.Render(self._nodeGraph.GetNodes())
+            self._renderer.Render(self._nodeGraph.GetNodes(), scale=scale)
             render_image = self._renderer.GetRender()
             if render_image is not None:
                 self._imageViewport.UpdateViewerImage(utils.ConvertImageToWx(render_image),
-                                                      self._renderer.GetTime())
+                                                      self._renderer.GetTime(),
+                                                      scale)
             self._imageViewport.UpdateInfoText(False)
             self._nodeGraph.UpdateAllNodes()
 
-    def _Render(self, jobID, abort_event):
-        """ Internal rendering method. """
-        if not abort_event():
-            self._imageViewport.UpdateRenderText(True)
-            self._renderer.Render(self._nodeGraph.GetNodes())
-            render_time = self._renderer.GetTime()
-            render_image = self._renderer.GetRender()
-            if render_image is not None:
-                self._imageViewport.UpdateViewerImage(utils.ConvertImageToWx(render_image),
-                                                      render_time)
-                self._abortEvent.set()
-        else:
-            self._abortEvent.clear()
-
-        self._imageViewport.UpdateRenderText(False)
-        return jobID
-
-    def _PostRender(self, delayed_result):
-        """ Internal post-render misc. """
-        try:
-            result = delayed_result.get()
-
-            self._imageViewport.UpdateViewerImage(utils.ConvertImageToWx(self._renderer.GetRender()),
-                                                  self._renderer.GetTime())
-            self._imageViewport.UpdateRenderText(False)
-            self._statusBar.SetStatusText("Render Finished in {} sec.".format(self._renderer.GetTime()))
+    def OnRenderResult(self, event):
+        """ Event handler for the renders finished by the render
+        thread. This is always called on the main thread.
+        """
+        job_id, render_image, render_time, scale = event.data
+        if job_id != self._renderThread.GetJobID():
+            # A newer render has been requested since
+            return
 
-            self._nodeGraph.UpdateAllNodes()
+        self._imageViewport.UpdateViewerImage(utils.ConvertImageToWx(render_image),
+                                              render_time, scale)
+        self._imageViewport.UpdateInfoText(False)
+        self._statusBar.SetStatusText("Render Finished in {} sec.".format(round(render_time, 3)))
+        self._nodeGraph.UpdateAllNodes()
 
-            self._abortEvent.clear()
-            return result
-        except Exception as exc:
-            print('ERROR: PLEASE REPORT THE FOLLOWING ERROR TO THE DEVELOPERS: \n', exc)
-            return
+    def OnThumbnailsReady(self):
+        """ Called on the thumbnail thread once the node thumbnails made in
+        the background are ready. The nodes are re-drawn on the main thread,
+        once for all the thumbnails made in the meantime.
+        """
+        if self._thumbsRedrawPending != True:
+            self._thumbsRedrawPending = True
+            wx.CallAfter(self.RedrawThumbnails)
+
+    def RedrawThumbnails(self):
+        """ Re-draw the nodes with their new thumbnails. """
+        self._thumbsRedrawPending = False
+        self._nodeGraph.UpdateAllNodes()
@@ -0,0 +1,427 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: cli.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Render node graph files from the command line, without the UI
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import glob
+import json
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
+
+from GimelStudio import meta
+
+
+def ParseOverride(override):
+    """ Split a property override from the command line.
+
+    :param override: string in the form "node.Property Name=value",
+    where node is a node type (e.g: corenode_image) or a node id
+    :returns: tuple of (node, property name, value string)
+    :raises: ValueError if the override is malformed
+    """
+    target, sep, value = override.partition("=")
+    node, dot, name = target.partition(".")
+    if sep == "" or dot == "" or node == "" or name == "":
+        raise ValueError("Invalid property override: {}".format(override))
+    return node, name, value
+
+
+def ConvertValue(current, value):
+    """ Convert a value given on the command line to the type of
+    the current value of the property.
+
+    :param current: current value of the property
+    :param value: value string
+    :returns: converted value
+    """
+    if isinstance(current, bool):
+        return value.lower() in ("1", "true", "yes", "on")
+    elif isinstance(current, int):
+        return int(value)
+    elif isinstance(current, float):
+        return float(value)
+    elif isinstance(current, (list, tuple)):
+        if value.startswith("["):
+            items = json.loads(value)
+        else:
+            items = [item.strip() for item in value.split(",")]
+        if len(current) > 0:
+            items = [ConvertValue(current[0], str(item)) for item in items]
+        return type(current)(items)
+    return value
+
+
+def ApplyOverrides(nodes, overrides):
+    """ Set property values of the nodes of a node graph.
+
+    :param nodes: dictionary of nodes of the Node Graph
+    :param overrides: list of override strings (see ParseOverride)
+    :raises: ValueError if an override doesn't match any property
+    """
+    for override in overrides:
+        target, name, value = ParseOverride(override)
+        matched = False
+        for node_id in nodes:
+            node = nodes[node_id]
+            if target not in (node.GetType(), str(node_id)):
+                continue
+            if name not in node.Properties:
+                raise ValueError("The node {} has no property {}".format(
+                    target, name))
+            prop = node.Properties[name]
+            prop.value = ConvertValue(prop.GetValue(), value)
+            node.Model.MarkDirty()
+            matched = True
+
+        if matched != True:
+            raise ValueError("No node matches {}".format(target))
+
+
+def CheckInputFiles(nodes):
+    """ Check that the files the nodes of the node graph read exist.
+    The nodes render an empty image in place of a missing file, which
+    is fine in the UI but would be exported without notice here.
+
+    :param nodes: dictionary of nodes of the Node Graph
+    :raises: FileNotFoundError if a file doesn't exist
+    """
+    from GimelStudio.node import OpenFileChooserProp
+
+    for node_id in nodes:
+        for prop in nodes[node_id].Properties.values():
+            if not isinstance(prop, OpenFileChooserProp):
+                continue
+            path = prop.GetValue()
+            if path != "" and not os.path.isfile(path):
+                raise FileNotFoundError("Could not find the input file "
+                                        "{}".format(path))
+
+
+def RenderGraphToFile(renderer, nodes, output_path, scale=1.0, quality=75):
+    """ Render the node graph and export the image.
+
+    :param renderer: Renderer object
+    :param nodes: dictionary of nodes of the Node Graph
+    :param output_path: file path to export the image to
+    :param scale: scale of the render relative to the full resolution
+    :param quality: the image export quality (0 to 95)
+    :returns: the render time in seconds
+    :raises: FileNotFoundError if an input file doesn't exist
+    """
+    from GimelStudio.utils import ExportRenderedImageToFile
+
+    CheckInputFiles(nodes)
+    image = renderer.Render(nodes, scale=scale)
+    ExportRenderedImageToFile(image, output_path, quality)
+    return renderer.GetTime()
+
+
+# Node graph and renderer of a batch worker process. These are set up
+# once per process by InitBatchWorker and re-used for every file.
+_batchState = None
+
+
+def InitBatchWorker(snapshot, input_property, scale=1.0, quality=75,
+                    tile_size=None, cache_dir=None):
+    """ Set up a batch worker process: register the nodes and restore
+    the node graph, which is then re-used for all the files the process
+    renders. Nodes upstream of the input property stay cached between
+    files.
+
+    :param snapshot: snapshot of the node graph (see SnapshotNodeGraph)
+    :param input_property: "node.Property Name" to set to each input file
+    :param cache_dir: directory of the node outputs kept between
+    sessions or None to not keep them
+    """
+    global _batchState
+
+    from GimelStudio import node_importer
+    from GimelStudio.node.thumbnails import SetThumbnailsEnabled
+    from GimelStudio.project import RestoreNodeGraph
+    from GimelStudio.renderer import Renderer, OpenPersistentCache
+
+    SetThumbnailsEnabled(False)
+    nodes = RestoreNodeGraph(snapshot)
+
+    store = None
+    if cache_dir is not None:
+        store = OpenPersistentCache(cache_dir)
+
+    # The batch is spread over the processes, so each one renders
+    # its files serially.
+    renderer = Renderer(None, store=store)
+    renderer.SetWorkerCount(1)
+    renderer.SetTileSize(tile_size)
+
+    # Worker processes don't run the atexit handlers, so delete the
+    # node outputs spilled to disk when the process is shut down.
+    Finalize(renderer, renderer.GetCache().Clear, exitpriority=10)
+    _batchState = (nodes, renderer, input_property, scale, quality)
+
+
+def RenderBatchFile(input_path, output_path):
+    """ Render one file of a batch in a worker process set up by
+    InitBatchWorker. Errors are returned rather than raised so that
+    one bad file doesn't stop the batch.
+
+    :param input_path: file path to set the input property to
+    :param output_path: file path to export the image to
+    :returns: tuple of (input path, output path, render time in
+    seconds, error message or None)
+    """
+    nodes, renderer, input_property, scale, quality = _batchState
+    try:
+        ApplyOverrides(nodes, ["{}={}".format(input_property, input_path)])
+        output_dir = os.path.dirname(output_path)
+        if output_dir != "":
+            os.makedirs(output_dir, exist_ok=True)
+        render_time = RenderGraphToFile(renderer, nodes, output_path,
+                                        scale, quality)
+        return input_path, output_path, render_time, None
+    except Exception as error:
+        return input_path, output_path, 0.0, str(error) or repr(error)
+
+
+def GetBatchOutputPath(pattern, input_path, index):
+    """ Get the output path of a file of a batch.
+
+    :param pattern: output path pattern with {name} (file name without
+    the extension), {ext} (extension of the input file) and {index}
+    (position of the file in the batch) fields, e.g: "out/{name}_n.png"
+    :param input_path: file path of the input file
+    :param index: position of the file in the batch
+    :returns: output file path
+    """
+    name, ext = os.path.splitext(os.path.basename(input_path))
+    return pattern.format(name=name, ext=ext, index=index)
+
+
+def CheckOutputPattern(pattern):
+    """ Check that the output path pattern of a batch only uses the
+    fields GetBatchOutputPath fills in.
+
+    :param pattern: output path pattern (see GetBatchOutputPath)
+    :raises: ValueError if the pattern is invalid
+    """
+    try:
+        GetBatchOutputPath(pattern, "input.png", 0)
+    except KeyError as error:
+        raise ValueError("Unknown field {{{}}} in the output pattern {} "
+                         "(use {{name}}, {{ext}} or {{index}})".format(
+                             error.args[0], pattern))
+    except (IndexError, ValueError) as error:
+        raise ValueError("Invalid output pattern {}: {}".format(
+            pattern, error))
+
+
+def RenderBatch(graph_path, input_pattern, output_pattern, overrides=[],
+                input_property="corenode_image.File Path", jobs=None,
+                scale=1.0, quality=75, tile_size=None, cache_dir=None,
+                report=print):
+    """ Render the node graph once for each file matching the input
+    pattern, over a pool of worker processes.
+
+    :param graph_path: node graph file (JSON) to render
+    :param input_pattern: glob pattern of the input files
+    :param output_pattern: output path pattern (see GetBatchOutputPath)
+    :param overrides: list of property override strings
+    :param input_property: "node.Property Name" to set to each input file
+    :param jobs: number of worker processes, defaults to the CPU count
+    :param cache_dir: directory of the node outputs kept between
+    sessions or None to not keep them
+    :param report: callable, called with a line for each finished file
+    :returns: tuple of (number of rendered files, list of failures as
+    (input path, error message) tuples)
+    :raises: ValueError if the output pattern is invalid
+    """
+    CheckOutputPattern(output_pattern)
+
+    from GimelStudio import node_importer
+    from GimelStudio.project import LoadNodeGraph, SnapshotNodeGraph
+
+    # Load the graph once and send the workers a snapshot of it, so
+    # that errors in the graph or overrides are reported right away.
+    nodes = LoadNodeGraph(graph_path)
+    ApplyOverrides(nodes, overrides)
+    snapshot = SnapshotNodeGraph(nodes)
+
+    input_paths = sorted(glob.glob(input_pattern))
+    failures = []
+    rendered = 0
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=InitBatchWorker,
+        initargs=(snapshot, input_property, scale, quality, tile_size,
+                  cache_dir)
+    ) as executor:
+        futures = [
+            executor.submit(RenderBatchFile, input_path,
+                            GetBatchOutputPath(output_pattern, input_path,
+                                               index))
+            for index, input_path in enumerate(input_paths)
+        ]
+        for future in as_completed(futures):
+            input_path, output_path, render_time, error = future.result()
+            if error is None:
+                rendered += 1
+                report("[INFO] {} -> {} in {} sec.".format(
+                    input_path, output_path, round(render_time, 3)))
+            else:
+                failures.append((input_path, error))
+                report("[ERROR] {} failed: {}".format(input_path, error))
+
+    return rendered, failures
+
+
+def ClearPersistentCache(cache_dir=None):
+    """ Delete the node outputs kept on disk between sessions, which
+    are shared with the UI.
+
+    :param cache_dir: directory of the node outputs, defaults to
+    ``meta.PERSISTENT_CACHE_DIRECTORY``
+    """
+    from GimelStudio.renderer import OpenPersistentCache
+
+    OpenPersistentCache(cache_dir).Clear()
+    print("[INFO] Cleared the node output cache")
+
+
+def CreateParser():
+    parser = argparse.ArgumentParser(
+        prog="gimelstudio-render",
+        description="Render a {} node graph file without the UI".format(
+            meta.APP_NAME)
+    )
+    parser.add_argument("graph", help="node graph file (JSON) to render")
+    parser.add_argument("-o", "--output", required=True,
+                        help="file path to export the rendered image to, or "
+                        "the output path pattern in batch mode (e.g: "
+                        "'out/{name}_normal.png')")
+    parser.add_argument("-i", "--input", default=None, metavar="GLOB",
+                        help="render the graph once for each matching file "
+                        "(batch mode)")
+    parser.add_argument("--input-property",
+                        default="corenode_image.File Path",
+                        metavar="NODE.PROPERTY",
+                        help="property set to each input file in batch mode")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of render processes in batch mode, "
+                        "defaults to the number of CPUs")
+    parser.add_argument("--set", dest="overrides", action="append",
+                        default=[], metavar="NODE.PROPERTY=VALUE",
+                        help="override a property of the nodes of the given "
+                        "type or id (e.g: 'corenode_image.File Path=a.png')")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="render scale relative to the full resolution")
+    parser.add_argument("--quality", type=int, default=75,
+                        help="image export quality from 0 to 95")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of render threads (1 for serial)")
+    parser.add_argument("--tile-size", type=int, default=None,
+                        help="render in tiles of the given size in pixels")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="delete the node outputs kept on disk between "
+                        "sessions before rendering")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="don't read or write the node outputs kept on "
+                        "disk between sessions")
+    parser.add_argument("--cache-dir", default=None, metavar="DIR",
+                        help="directory of the node outputs kept between "
+                        "sessions (default: {})".format(
+                            meta.PERSISTENT_CACHE_DIRECTORY))
+    return parser
+
+
+def main(argv=None):
+    """ Entry-point of the gimelstudio-render command.
+
+    :param argv: list of command line arguments, defaults to sys.argv
+    :returns: exit status
+    """
+    args = CreateParser().parse_args(argv)
+
+    if args.clear_cache == True:
+        ClearPersistentCache(args.cache_dir)
+
+    cache_dir = None
+    if args.no_cache != True:
+        cache_dir = args.cache_dir or meta.PERSISTENT_CACHE_DIRECTORY
+
+    # Register the core and custom nodes
+    from GimelStudio import node_importer
+    from GimelStudio.node.thumbnails import SetThumbnailsEnabled
+    from GimelStudio.project import LoadNodeGraph
+    from GimelStudio.renderer import Renderer, OpenPersistentCache
+    from GimelStudio.utils.exceptions import NodeNotFoundError
+
+    # There is no UI to show the node thumbnails in
+    SetThumbnailsEnabled(False)
+
+    if args.input is not None:
+        try:
+            CheckOutputPattern(args.output)
+        except ValueError as error:
+            print("[ERROR] {}".format(error), file=sys.stderr)
+            return 1
+
+        start_time = time.time()
+        try:
+            rendered, failures = RenderBatch(
+                args.graph, args.input, args.output, args.overrides,
+                args.input_property, args.jobs, args.scale, args.quality,
+                args.tile_size, cache_dir
+            )
+        except (OSError, ValueError, KeyError, NodeNotFoundError) as error:
+            print("[ERROR] Could not load {}: {}".format(args.graph, error),
+                  file=sys.stderr)
+            return 1
+        print("[INFO] Rendered {} files in {} sec. ({} failed)".format(
+            rendered, round(time.time() - start_time, 3), len(failures)))
+        return 1 if failures != [] else 0
+
+    try:
+        nodes = LoadNodeGraph(args.graph)
+        ApplyOverrides(nodes, args.overrides)
+    except (OSError, ValueError, KeyError, NodeNotFoundError) as error:
+        print("[ERROR] Could not load {}: {}".format(args.graph, error),
+              file=sys.stderr)
+        return 1
+
+    store = None
+    if cache_dir is not None:
+        store = OpenPersistentCache(cache_dir)
+    renderer = Renderer(None, cache=False, store=store)
+    if args.workers is not None:
+        renderer.SetWorkerCount(args.workers)
+    renderer.SetTileSize(args.tile_size)
+
+    try:
+        render_time = RenderGraphToFile(renderer, nodes, args.output,
+                                        args.scale, args.quality)
+    except FileNotFoundError as error:
+        print("[ERROR] Could not render {}: {}".format(args.graph, error),
+              file=sys.stderr)
+        return 1
+    print("[INFO] Rendered {} in {} sec.".format(args.output,
+                                                 round(render_time, 3)))
+    return 0
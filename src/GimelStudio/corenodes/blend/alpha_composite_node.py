@@ -18,6 +18,7 @@
 from PIL import Image, ImageOps
 
 from GimelStudio import api
+from GimelStudio.utils.image import GetConstantPixels
 
 
 class AlphaCompositeNode(api.NodeBase):
@@ -43,15 +44,25 @@ class AlphaCompositeNode(api.NodeBase):
         self.NodeAddParam(p1)
         self.NodeAddParam(p2)
 
+    def NodeHalo(self, eval_info):
+        return 0
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image 1')
         image2 = eval_info.EvaluateParameter('Image 2')
 
         image = api.RenderImage()
-        main_image = image1.GetImage()
-        layer_image = ImageOps.fit(image2.GetImage(), main_image.size)
-        image.SetAsImage(Image.alpha_composite(main_image, layer_image))
-        self.NodeSetThumb(image.GetImage())
+        pixels = GetConstantPixels([image1, image2])
+        if pixels is None:
+            main_image = image1.GetImage()
+            layer_image = ImageOps.fit(image2.GetImage(), main_image.size)
+            image.SetAsImage(Image.alpha_composite(main_image, layer_image),
+                             owned=True)
+        else:
+            # Composite the colours of solid colour images alone
+            pixel = Image.alpha_composite(*pixels)
+            image.SetAsConstant(image1.GetSize(), pixel.getpixel((0, 0)))
+        self.NodeSetThumb(image)
         return image
 
 
@@ -18,6 +18,7 @@
 from PIL import Image, ImageOps
 
 from GimelStudio import api
+from GimelStudio.utils.image import GetConstantPixels
 
 
 class CompositeNode(api.NodeBase):
@@ -45,18 +46,28 @@ class CompositeNode(api.NodeBase):
         self.NodeAddParam(p2)
         self.NodeAddParam(p3)
 
+    def NodeHalo(self, eval_info):
+        return 0
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image 1')
         image2 = eval_info.EvaluateParameter('Image 2')
         mask = eval_info.EvaluateParameter('Alpha Mask')
 
         image = api.RenderImage()
-        main_image = image1.GetImage()
-        layer_image = ImageOps.fit(image2.GetImage(), main_image.size)
-        mask_image = ImageOps.fit(mask.GetImage(), main_image.size).convert('RGBA')
+        pixels = GetConstantPixels([image1, image2, mask])
+        if pixels is None:
+            main_image = image1.GetImage()
+            layer_image = ImageOps.fit(image2.GetImage(), main_image.size)
+            mask_image = ImageOps.fit(mask.GetImage(), main_image.size).convert('RGBA')
 
-        image.SetAsImage(Image.composite(main_image, layer_image, mask_image))
-        self.NodeSetThumb(image.GetImage())
+            image.SetAsImage(Image.composite(main_image, layer_image, mask_image),
+                             owned=True)
+        else:
+            # Composite the colours of solid colour images alone
+            pixel = Image.composite(*pixels)
+            image.SetAsConstant(image1.GetSize(), pixel.getpixel((0, 0)))
+        self.NodeSetThumb(image)
         return image
 
 
@@ -18,6 +18,7 @@
 from PIL import ImageChops, ImageOps
 
 from GimelStudio import api
+from GimelStudio.utils.image import GetConstantPixels
 
 
 class MixNode(api.NodeBase):
@@ -66,14 +67,22 @@ class MixNode(api.NodeBase):
         self.NodeAddParam(p1)
         self.NodeAddParam(p2)
 
+    def NodeHalo(self, eval_info):
+        return 0
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
         image2 = eval_info.EvaluateParameter('Overlay')
         blendmode = eval_info.EvaluateProperty('Blend Mode')
 
         image = api.RenderImage()
-        main_image = image1.GetImage()
-        layer_image = ImageOps.fit(image2.GetImage(), main_image.size)
+        pixels = GetConstantPixels([image1, image2])
+        if pixels is None:
+            main_image = image1.GetImage()
+            layer_image = ImageOps.fit(image2.GetImage(), main_image.size)
+        else:
+            # Blend the colours of solid colour images alone
+            main_image, layer_image = pixels
 
         if blendmode == 'Add':
             img = ImageChops.add(main_image, layer_image)
@@ -111,8 +120,11 @@ class MixNode(api.NodeBase):
         elif blendmode == 'Overlay':
             img = ImageChops.overlay(main_image, layer_image)
 
-        image.SetAsImage(img)
-        self.NodeSetThumb(image.GetImage())
+        if pixels is None:
+            image.SetAsImage(img, owned=True)
+        else:
+            image.SetAsConstant(image1.GetSize(), img.getpixel((0, 0)))
+        self.NodeSetThumb(image)
         return image
 
 
@@ -18,6 +18,7 @@
 from PIL import ImageEnhance
 
 from GimelStudio import api
+from GimelStudio.utils.image import ConvertImageMode, EnhanceTable
 
 
 class BrightnessNode(api.NodeBase):
@@ -52,13 +53,24 @@ class BrightnessNode(api.NodeBase):
 
         self.NodeAddParam(p)
 
+    def NodeHalo(self, eval_info):
+        return 0
+
+    def NodePointTransform(self, eval_info, image):
+        # The image is blended with black, keeping its alpha channel
+        table = EnhanceTable(0, eval_info.EvaluateProperty('Amount'))
+        transform = api.PointTransform()
+        transform.SetAsTable((table, table, table, None))
+        return transform
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
         amount = eval_info.EvaluateProperty('Amount')
 
         image = api.RenderImage()
         enhancer = ImageEnhance.Brightness(image1.GetImage())
-        image.SetAsImage(enhancer.enhance(amount).convert('RGBA'))
+        image.SetAsImage(ConvertImageMode(enhancer.enhance(amount), 'RGBA'),
+                         owned=True)
 
         self.NodeSetThumb(image.GetImage())
         return image
@@ -18,6 +18,7 @@
 from PIL import ImageEnhance
 
 from GimelStudio import api
+from GimelStudio.utils.image import ConvertImageMode
 
 
 class ColorBalanceNode(api.NodeBase):
@@ -52,13 +53,30 @@ class ColorBalanceNode(api.NodeBase):
 
         self.NodeAddParam(p)
 
+    def NodeHalo(self, eval_info):
+        return 0
+
+    def NodePointTransform(self, eval_info, image):
+        # The image is blended with its grey-scale version, keeping
+        # its alpha channel
+        amount = eval_info.EvaluateProperty('Amount')
+        transform = api.PointTransform()
+        transform.SetAsMatrix([
+            [amount, 0, 0, 0, 1 - amount],
+            [0, amount, 0, 0, 1 - amount],
+            [0, 0, amount, 0, 1 - amount],
+            [0, 0, 0, 1, 0]
+        ])
+        return transform
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
         amount = eval_info.EvaluateProperty('Amount')
 
         image = api.RenderImage()
         enhancer = ImageEnhance.Color(image1.GetImage())
-        image.SetAsImage(enhancer.enhance(amount).convert('RGBA'))
+        image.SetAsImage(ConvertImageMode(enhancer.enhance(amount), 'RGBA'),
+                         owned=True)
         self.NodeSetThumb(image.GetImage())
         return image
 
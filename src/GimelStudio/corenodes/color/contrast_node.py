@@ -15,9 +15,11 @@
 # limitations under the License.
 # ----------------------------------------------------------------------------
 
-from PIL import ImageEnhance
+from PIL import ImageEnhance, ImageStat
 
 from GimelStudio import api
+from GimelStudio.utils.image import (ConvertImageMode, EnhanceTable,
+                                     GetConstantPixels)
 
 
 class ContrastNode(api.NodeBase):
@@ -52,13 +54,30 @@ class ContrastNode(api.NodeBase):
 
         self.NodeAddParam(p)
 
+    def NodePointTransform(self, eval_info, image):
+        # The image is blended with its mean grey level, keeping
+        # its alpha channel
+        if image is None:
+            return None
+        pixels = GetConstantPixels([image])
+        if pixels is None:
+            grey = image.GetImage().convert("L")
+        else:
+            grey = pixels[0].convert("L")
+        mean = int(ImageStat.Stat(grey).mean[0] + 0.5)
+        table = EnhanceTable(mean, eval_info.EvaluateProperty('Amount'))
+        transform = api.PointTransform()
+        transform.SetAsTable((table, table, table, None))
+        return transform
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
         amount = eval_info.EvaluateProperty('Amount')
 
         image = api.RenderImage()
         enhancer = ImageEnhance.Contrast(image1.GetImage())
-        image.SetAsImage(enhancer.enhance(amount).convert('RGBA'))
+        image.SetAsImage(ConvertImageMode(enhancer.enhance(amount), 'RGBA'),
+                         owned=True)
 
         self.NodeSetThumb(image.GetImage())
         return image
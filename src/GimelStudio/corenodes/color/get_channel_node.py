@@ -63,6 +63,9 @@ class GetChannelNode(api.NodeBase):
         image = api.RenderImageParam("Image")
         self.NodeAddParam(image)
 
+    def NodeHalo(self, eval_info):
+        return 0
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
         channel = eval_info.EvaluateProperty('Image Channel')
@@ -92,7 +95,7 @@ class GetChannelNode(api.NodeBase):
         else:
             final_img = channel_img
 
-        image.SetAsImage(final_img.convert("RGBA"))
+        image.SetAsImage(final_img.convert("RGBA"), owned=True)
 
         self.NodeSetThumb(image.GetImage())
         return image
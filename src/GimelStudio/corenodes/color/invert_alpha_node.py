@@ -16,8 +16,10 @@
 # ----------------------------------------------------------------------------
 
 from PIL import ImageChops
+import numpy
 
 from GimelStudio import api
+from GimelStudio.utils.image import ConvertImageMode
 
 
 class InvertAlphaNode(api.NodeBase):
@@ -41,11 +43,24 @@ class InvertAlphaNode(api.NodeBase):
 
         self.NodeAddParam(p)
 
+    def NodeHalo(self, eval_info):
+        return 0
+
+    def NodePointTransform(self, eval_info, image):
+        # All of the channels are inverted
+        table = numpy.arange(255, -1, -1)
+        transform = api.PointTransform()
+        transform.SetAsTable((table, table, table, table))
+        return transform
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
 
         image = api.RenderImage()
-        image.SetAsImage(ImageChops.invert(image1.GetImage()).convert('RGBA'))
+        image.SetAsImage(
+            ConvertImageMode(ImageChops.invert(image1.GetImage()), 'RGBA'),
+            owned=True
+        )
         self.NodeSetThumb(image.GetImage())
         return image
 
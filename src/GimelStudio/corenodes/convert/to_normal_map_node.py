@@ -22,26 +22,25 @@ from PIL import ImageFilter
 
 from GimelStudio import api
 
-# FIXME: hack!
-from GimelStudio.utils.image import ArrayFromImage, ArrayToImage
-
 
 class ToNormalMapNode(api.NodeBase):
     def __init__(self, _id):
         api.NodeBase.__init__(self, _id)
 
-    def SmoothGaussian(self, im, sigma):
-        """ Blurs the normals. """
+    def SmoothGaussian(self, im, sigma, output=float, temp=float):
+        """ Blurs the normals. The convolutions are done in floating
+        point into the given output and temporary arrays. """
         if sigma == 0:
             return im
 
-        im_smooth = im.astype(float)
         kernel_x = np.arange(-3 * sigma, 3 * sigma + 1).astype(float)
         kernel_x = np.exp((-(kernel_x**2)) / (2 * (sigma**2)))
 
-        im_smooth = scipy.ndimage.convolve(im_smooth, kernel_x[np.newaxis])
+        im_smooth = scipy.ndimage.convolve(im, kernel_x[np.newaxis],
+                                           output=temp)
 
-        im_smooth = scipy.ndimage.convolve(im_smooth, kernel_x[np.newaxis].T)
+        im_smooth = scipy.ndimage.convolve(im_smooth, kernel_x[np.newaxis].T,
+                                           output=output)
 
         return im_smooth
 
@@ -58,20 +57,22 @@ class ToNormalMapNode(api.NodeBase):
 
         return gradient_x, gradient_y
 
-    def Sobel(self, im_smooth):
-        """ Calculates another type of gradient for the normal map. """
-        gradient_x = im_smooth.astype(float)
-        gradient_y = im_smooth.astype(float)
-
+    def Sobel(self, im_smooth, output_x=float, output_y=float):
+        """ Calculates another type of gradient for the normal map. The
+        convolutions are done in floating point into the given arrays. """
         kernel = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
 
-        gradient_x = scipy.ndimage.convolve(gradient_x, kernel)
-        gradient_y = scipy.ndimage.convolve(gradient_y, kernel.T)
+        gradient_x = scipy.ndimage.convolve(im_smooth, kernel,
+                                            output=output_x)
+        gradient_y = scipy.ndimage.convolve(im_smooth, kernel.T,
+                                            output=output_y)
 
         return gradient_x, gradient_y
 
-    def ComputeNormalMap(self, gradient_x, gradient_y, intensity=1):
-        """ Calculates the normals of an image and returns a normal map. """
+    def ComputeNormalMap(self, gradient_x, gradient_y, intensity=1,
+                         output=None):
+        """ Calculates the normals of an image and returns a normal map,
+        optionally in the given (height, width, 3) float32 array. """
         width = gradient_x.shape[1]
         height = gradient_x.shape[0]
         max_x = np.max(gradient_x)
@@ -82,7 +83,10 @@ class ToNormalMapNode(api.NodeBase):
         if max_y > max_x:
             max_value = max_y
 
-        normal_map = np.zeros((height, width, 3), dtype=np.float32)
+        if output is None:
+            normal_map = np.zeros((height, width, 3), dtype=np.float32)
+        else:
+            normal_map = output
 
         intensity = 1 / intensity
 
@@ -124,6 +128,7 @@ class ToNormalMapNode(api.NodeBase):
             max_val=25,
             widget=api.SLIDER_WIDGET,
             label="Sigma:",
+            scalable=True,
         )
         p2 = api.PositiveIntegerProp(
             idname="Intensity",
@@ -148,28 +153,35 @@ class ToNormalMapNode(api.NodeBase):
         intensity_val = eval_info.EvaluateProperty('Intensity')
 
         # Convert the current image data to an array that scipy can use
-        im = ArrayFromImage(image1.GetImage())
+        im = image1.GetArray()
+
+        # The float arrays are taken from the buffer pool
+        shape = im.shape[:2]
+        temp = eval_info.NewArray(shape, float)
 
         # Create the image
         if im.ndim == 3:
-            im_grey = np.zeros((im.shape[0], im.shape[1])).astype(float)
-            im_grey = (im[..., 0] * 0.3 + im[..., 1] * 0.6 + im[..., 2] * 0.1)
+            im_grey = eval_info.NewArray(shape, float)
+            np.multiply(im[..., 0], 0.3, out=im_grey)
+            im_grey += im[..., 1] * 0.6
+            im_grey += im[..., 2] * 0.1
             im = im_grey
 
-        im_smooth = self.SmoothGaussian(im, sigma_val)
-        sobel_x, sobel_y = self.Sobel(im_smooth)
+        im_smooth = self.SmoothGaussian(im, sigma_val,
+                                        eval_info.NewArray(shape, float), temp)
+        sobel_x, sobel_y = self.Sobel(im_smooth, temp,
+                                      eval_info.NewArray(shape, float))
 
         # Calculate the normal map
         generated_normal_map = self.ComputeNormalMap(
             sobel_x,
             sobel_y,
-            intensity_val
+            intensity_val,
+            eval_info.NewArray(shape + (3,), np.float32)
         )
 
         image = api.RenderImage()
-        image.SetAsImage(
-            ArrayToImage(generated_normal_map).convert('RGBA')
-        )
+        image.SetAsArray(generated_normal_map, owned=True)
         self.NodeSetThumb(image.GetImage())
         return image
 
@@ -58,9 +58,6 @@ except ImportError:
 
 from GimelStudio import api
 
-# FIXME: hack!
-from GimelStudio.utils.image import ArrayFromImage, ArrayToImage
-
 
 class ToSpecularMapNode(api.NodeBase):
     def __init__(self, _id):
@@ -150,7 +147,7 @@ class ToSpecularMapNode(api.NodeBase):
 
         # Convert the current image data to an array
         # that we can use and greyscale it.
-        im = ArrayFromImage(image1.GetImage())
+        im = image1.GetArray()
         gray_scale_img = cv2.equalizeHist(cv2.cvtColor(im, cv2.COLOR_BGR2GRAY))
 
         generated_specular_map = self.ComputeSpecularMap(
@@ -162,9 +159,7 @@ class ToSpecularMapNode(api.NodeBase):
         )
 
         image = api.RenderImage()
-        image.SetAsImage(
-            ArrayToImage(generated_specular_map).convert('RGBA')
-        )
+        image.SetAsArray(generated_specular_map, owned=True)
         self.NodeSetThumb(image.GetImage())
         return image
 
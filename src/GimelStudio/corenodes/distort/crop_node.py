@@ -17,10 +17,8 @@
 
 
 import cv2
-import numpy as np
 
 from GimelStudio import api
-from GimelStudio.utils.image import ArrayToImage, ArrayFromImage
 
 
 class CropNode(api.NodeBase):
@@ -56,28 +54,32 @@ class CropNode(api.NodeBase):
                                          min_val=0,
                                          max_val=100000,
                                          widget=api.SPINBOX_WIDGET,
-                                         label="X:")
+                                         label="X:",
+                                         scalable=True)
 
         self.y = api.PositiveIntegerProp(idname="Y",
                                          default=0,
                                          min_val=0,
                                          max_val=100000,
                                          widget=api.SPINBOX_WIDGET,
-                                         label="Y:")
+                                         label="Y:",
+                                         scalable=True)
 
         self.width = api.PositiveIntegerProp(idname="Width",
                                              default=255,
                                              min_val=1,
                                              max_val=100000,
                                              widget=api.SPINBOX_WIDGET,
-                                             label="Width:")
+                                             label="Width:",
+                                             scalable=True)
 
         self.height = api.PositiveIntegerProp(idname="Height",
                                               default=255,
                                               min_val=1,
                                               max_val=100000,
                                               widget=api.SPINBOX_WIDGET,
-                                              label="Height:")
+                                              label="Height:",
+                                              scalable=True)
 
         self.NodeAddProp(self.x)
         self.NodeAddProp(self.y)
@@ -90,7 +92,8 @@ class CropNode(api.NodeBase):
                                    min_val=0,
                                    max_val=100000,
                                    label="Center:",
-                                   visible=False)
+                                   visible=False,
+                                   scalable=True)
 
         self.radius = api.PositiveIntegerProp(idname="Radius",
                                               default=255,
@@ -98,7 +101,8 @@ class CropNode(api.NodeBase):
                                               max_val=100000,
                                               widget=api.SPINBOX_WIDGET,
                                               label="Radius:",
-                                              visible=False)
+                                              visible=False,
+                                              scalable=True)
 
         self.NodeAddProp(self.center)
         self.NodeAddProp(self.radius)
@@ -132,6 +136,48 @@ class CropNode(api.NodeBase):
 
         self.NodeAddParam(p)
 
+    def NodeInputRegion(self, eval_info, region):
+        # Only the rectangle method supports rendering a region
+        if eval_info.EvaluateProperty("Method") != "Rectangle":
+            return None
+
+        x = eval_info.EvaluateProperty("X")
+        y = eval_info.EvaluateProperty("Y")
+        width = eval_info.EvaluateProperty("Width")
+        height = eval_info.EvaluateProperty("Height")
+        return (
+            max(region[0], 0) + x,
+            max(region[1], 0) + y,
+            min(region[2], width) + x,
+            min(region[3], height) + y
+        )
+
+    def NodeOutputRegion(self, eval_info, region):
+        x = eval_info.EvaluateProperty("X")
+        y = eval_info.EvaluateProperty("Y")
+        width = eval_info.EvaluateProperty("Width")
+        height = eval_info.EvaluateProperty("Height")
+
+        left = max(region[0], x) - x
+        top = max(region[1], y) - y
+        return (
+            left,
+            top,
+            max(min(region[2], x + width) - x, left),
+            max(min(region[3], y + height) - y, top)
+        )
+
+    def NodeGeometricTransform(self, eval_info, region):
+        # The circle method masks the image as well
+        if eval_info.EvaluateProperty("Method") != "Rectangle":
+            return None
+
+        x = eval_info.EvaluateProperty("X")
+        y = eval_info.EvaluateProperty("Y")
+        return api.GeometricTransform(
+            (1, 0, x, 0, 1, y), self.NodeOutputRegion(eval_info, region)
+        )
+
     def NodeEvaluation(self, eval_info):
         # TODO: Add a circle crop option
         input_image = eval_info.EvaluateParameter('Image')
@@ -146,12 +192,19 @@ class CropNode(api.NodeBase):
         center = eval_info.EvaluateProperty("Center")
         radius = eval_info.EvaluateProperty("Radius")
 
-        input_image_array = ArrayFromImage(input_image.GetImage())
+        input_image_array = input_image.GetArray()
         if method == "Rectangle":
-            output_image_array = input_image_array[y:y + height, x:x + width]
+            # The input may only be the region of the image which is
+            # needed for the crop, starting at the origin.
+            ox, oy = input_image.GetOrigin()
+            output_image_array = input_image_array[
+                max(y - oy, 0):max(y + height - oy, 0),
+                max(x - ox, 0):max(x + width - ox, 0)
+            ]
         else:
             # Create a blank mask
-            mask = np.zeros(shape=input_image_array.data.shape, dtype=np.uint8)
+            mask = eval_info.NewArray(input_image_array.shape)
+            mask.fill(0)
             # Create the circle
             circle_mask_colour = cv2.circle(mask, tuple(center), radius, (255, 255, 255), -1)
             # Convert the mask to gray scale
@@ -165,9 +218,9 @@ class CropNode(api.NodeBase):
 
         image = api.RenderImage()
 
-        image.SetAsImage(ArrayToImage(output_image_array).convert("RGBA"))
+        image.SetAsArray(output_image_array)
 
-        self.NodeSetThumb(image.GetImage().convert("RGBA"))
+        self.NodeSetThumb(image.GetImage())
         return image
 
 api.RegisterNode(CropNode, "corenode_crop")
\ No newline at end of file
@@ -50,6 +50,15 @@ class FlipNode(api.NodeBase):
 
         self.NodeAddParam(p)
 
+    def NodeGeometricTransform(self, eval_info, region):
+        # Mirror the pixels around the centre of the image
+        left, top, right, bottom = region
+        if eval_info.EvaluateProperty('Direction') == 'Horizontal':
+            matrix = (-1, 0, left + right, 0, 1, 0)
+        else:
+            matrix = (1, 0, 0, 0, -1, top + bottom)
+        return api.GeometricTransform(matrix, region)
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
         direction = eval_info.EvaluateProperty('Direction')
@@ -57,11 +66,11 @@ class FlipNode(api.NodeBase):
         image = api.RenderImage()
 
         if direction == 'Horizontal':
-            image.SetAsImage(ImageOps.mirror(image1.GetImage()))
+            image.SetAsImage(ImageOps.mirror(image1.GetImage()), owned=True)
         else:
-            image.SetAsImage(ImageOps.flip(image1.GetImage()))
+            image.SetAsImage(ImageOps.flip(image1.GetImage()), owned=True)
 
-        self.NodeSetThumb(image.GetImage().convert("RGBA"))
+        self.NodeSetThumb(image.GetImage())
         return image
 
 
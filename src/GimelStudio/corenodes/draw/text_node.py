@@ -50,7 +50,8 @@ class TextNode(api.NodeBase):
         pos_prop = api.SizeProp(
             idname="Text Position",
             default=[0, 0],
-            label="Text Position:"
+            label="Text Position:",
+            scalable=True
         )
 
         text_prop = api.StringProp(
@@ -71,7 +72,8 @@ class TextNode(api.NodeBase):
             min_val=0,
             max_val=10000,
             widget=api.SPINBOX_WIDGET,
-            label="Font Size:"
+            label="Font Size:",
+            scalable=True
         )
 
         color_prop = api.ColorProp(
@@ -137,7 +139,7 @@ class TextNode(api.NodeBase):
         # Composite the two images together
         composited_image = Image.alpha_composite(main_image.GetImage(), text_image)
 
-        image.SetAsImage(composited_image)
+        image.SetAsImage(composited_image, owned=True)
         self.NodeSetThumb(image.GetImage())
         print("yes-past")
         return image
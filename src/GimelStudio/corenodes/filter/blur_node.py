@@ -18,7 +18,6 @@
 import cv2
 
 from GimelStudio import api
-from GimelStudio.utils.image import ArrayFromImage, ArrayToImage
 
 
 class BlurNode(api.NodeBase):
@@ -51,6 +50,7 @@ class BlurNode(api.NodeBase):
             max_val=500,
             widget=api.SLIDER_WIDGET,
             label="Kernel X:",
+            scalable=True,
         )
         self.kernel_y = api.PositiveIntegerProp(
             idname="Kernel Y",
@@ -59,6 +59,7 @@ class BlurNode(api.NodeBase):
             max_val=500,
             widget=api.SLIDER_WIDGET,
             label="Kernel Y:",
+            scalable=True,
         )
         self.NodeAddProp(self.filter_type)
         self.NodeAddProp(self.kernel_x)
@@ -69,6 +70,17 @@ class BlurNode(api.NodeBase):
 
         self.NodeAddParam(image)
 
+    def NodeHalo(self, eval_info):
+        kernel_x = eval_info.EvaluateProperty('Kernel X')
+        kernel_y = eval_info.EvaluateProperty('Kernel Y')
+        filter_type = eval_info.EvaluateProperty('Filter Type')
+
+        if filter_type == "Gaussian":
+            # The kernel values are used as the sigma and
+            # the Gaussian kernel extends to about 3 sigma.
+            return 4 * (max(kernel_x, kernel_y) + 1)
+        return max(kernel_x, kernel_y) // 2 + 1
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
         kernel_x = eval_info.EvaluateProperty('Kernel X')
@@ -77,10 +89,11 @@ class BlurNode(api.NodeBase):
 
         image = api.RenderImage()
 
-        img = ArrayFromImage(image1.GetImage())
+        img = image1.GetArray()
+        output_img = eval_info.NewArray(img.shape, img.dtype)
 
         if filter_type == "Box":
-            output_img = cv2.boxFilter(img, -1, (kernel_x, kernel_y))
+            cv2.boxFilter(img, -1, (kernel_x, kernel_y), output_img)
         elif filter_type == "Gaussian":
 
             # Both values must be odd
@@ -88,11 +101,11 @@ class BlurNode(api.NodeBase):
                 kernel_y += 1
                 kernel_x += 1
 
-            output_img = cv2.GaussianBlur(
-                img, (0, 0), sigmaX=kernel_x, sigmaY=kernel_y
+            cv2.GaussianBlur(
+                img, (0, 0), sigmaX=kernel_x, sigmaY=kernel_y, dst=output_img
             )
 
-        image.SetAsImage(ArrayToImage(output_img).convert('RGBA'))
+        image.SetAsArray(output_img, owned=True)
 
         self.NodeSetThumb(image.GetImage())
         return image
@@ -18,7 +18,6 @@
 import cv2
 
 from GimelStudio import api
-from GimelStudio.utils.image import ArrayFromImage, ArrayToImage
 
 
 class DilateErodeNode(api.NodeBase):
@@ -56,7 +55,8 @@ class DilateErodeNode(api.NodeBase):
             min_val=1,
             max_val=100,
             widget=api.SLIDER_WIDGET,
-            label="Kernel Size:"
+            label="Kernel Size:",
+            scalable=True
         )
         self.NodeAddProp(operation)
         self.NodeAddProp(kernel_shape)
@@ -67,6 +67,10 @@ class DilateErodeNode(api.NodeBase):
 
         self.NodeAddParam(image)
 
+    def NodeHalo(self, eval_info):
+        # Opening, Closing, etc apply the kernel twice
+        return eval_info.EvaluateProperty('Kernel Size')
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
         kernel_shape = eval_info.EvaluateProperty('Kernel Shape')
@@ -75,7 +79,8 @@ class DilateErodeNode(api.NodeBase):
 
         image = api.RenderImage()
 
-        img = ArrayFromImage(image1.GetImage())
+        img = image1.GetArray()
+        output_img = eval_info.NewArray(img.shape, img.dtype)
 
         if kernel_shape == "Rectangle":
             kshape = cv2.MORPH_RECT
@@ -87,19 +92,19 @@ class DilateErodeNode(api.NodeBase):
         kernel_img = cv2.getStructuringElement(kshape, (kernel_size, kernel_size))
 
         if operation == "Erode":
-            output_img = cv2.erode(img, kernel_img, iterations=1)
+            cv2.erode(img, kernel_img, output_img, iterations=1)
         elif operation == "Dilate":
-            output_img = cv2.dilate(img, kernel_img, iterations=1)
+            cv2.dilate(img, kernel_img, output_img, iterations=1)
         elif operation == "Opening":
-            output_img = cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel_img)
+            cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel_img, output_img)
         elif operation == "Closing":
-            output_img = cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel_img)
+            cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel_img, output_img)
         elif operation == "Top Hat":
-            output_img = cv2.morphologyEx(img, cv2.MORPH_TOPHAT, kernel_img)
+            cv2.morphologyEx(img, cv2.MORPH_TOPHAT, kernel_img, output_img)
         elif operation == "Black Hat":
-            output_img = cv2.morphologyEx(img, cv2.MORPH_BLACKHAT, kernel_img)
+            cv2.morphologyEx(img, cv2.MORPH_BLACKHAT, kernel_img, output_img)
 
-        image.SetAsImage(ArrayToImage(output_img).convert("RGBA"))
+        image.SetAsArray(output_img, owned=True)
 
         self.NodeSetThumb(image.GetImage())
         return image
@@ -44,9 +44,14 @@ class EffectSpreadNode(api.NodeBase):
             max_val=50,
             widget=api.SLIDER_WIDGET,
             label="Distance:",
+            scalable=True,
         )
         self.NodeAddProp(p)
 
+    def NodeIsDeterministic(self):
+        # The pixels are spread at random
+        return False
+
     def NodeInitParams(self):
         p = api.RenderImageParam('Image')
 
@@ -57,7 +62,7 @@ class EffectSpreadNode(api.NodeBase):
         distance = eval_info.EvaluateProperty('Distance')
 
         image = api.RenderImage()
-        image.SetAsImage(image1.GetImage().effect_spread(distance))
+        image.SetAsImage(image1.GetImage().effect_spread(distance), owned=True)
         self.NodeSetThumb(image.GetImage())
         return image
 
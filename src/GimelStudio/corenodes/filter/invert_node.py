@@ -17,6 +17,7 @@
 
 
 from PIL import ImageOps
+import numpy
 
 from GimelStudio import api
 
@@ -41,12 +42,24 @@ class InvertNode(api.NodeBase):
         image = api.RenderImageParam("Image")
         self.NodeAddParam(image)
 
+    def NodeHalo(self, eval_info):
+        return 0
+
+    def NodePointTransform(self, eval_info, image):
+        # The colour channels are inverted and the alpha
+        # channel is dropped (i.e: the image is opaque)
+        table = numpy.arange(255, -1, -1)
+        transform = api.PointTransform()
+        transform.SetAsTable((table, table, table, numpy.full(256, 255)))
+        return transform
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
 
         image = api.RenderImage()
         image.SetAsImage(
-            ImageOps.invert(image1.GetImage().convert("RGB")).convert("RGBA")
+            ImageOps.invert(image1.GetImage().convert("RGB")).convert("RGBA"),
+            owned=True
         )
 
         self.NodeSetThumb(image.GetImage())
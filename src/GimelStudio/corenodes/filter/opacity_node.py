@@ -18,6 +18,7 @@
 from PIL import ImageEnhance
 
 from GimelStudio import api
+from GimelStudio.utils.image import EnhanceTable
 
 
 class OpacityNode(api.NodeBase):
@@ -52,11 +53,23 @@ class OpacityNode(api.NodeBase):
 
         self.NodeAddParam(p)
 
+    def NodeHalo(self, eval_info):
+        return 0
+
+    def NodePointTransform(self, eval_info, image):
+        # The alpha channel is scaled down (see below)
+        opacity = eval_info.EvaluateProperty('Opacity')
+        transform = api.PointTransform()
+        transform.SetAsTable((None, None, None,
+                              EnhanceTable(0, opacity * 0.01)))
+        return transform
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
         opacity = eval_info.EvaluateProperty('Opacity')
 
-        img = image1.GetImage().convert("RGBA")
+        # The alpha channel is replaced in place
+        img = image1.GetWritableImage("RGBA")
 
         # Make correction for slider range of 1-100
         image_opacity = (opacity * 0.01)
@@ -67,7 +80,7 @@ class OpacityNode(api.NodeBase):
             img.putalpha(alpha)
 
         image = api.RenderImage()
-        image.SetAsImage(img)
+        image.SetAsImage(img, owned=True)
         self.NodeSetThumb(image.GetImage())
         return image
 
@@ -18,6 +18,7 @@
 from PIL import ImageEnhance
 
 from GimelStudio import api
+from GimelStudio.utils.image import ConvertImageMode
 
 
 class SharpnessNode(api.NodeBase):
@@ -52,13 +53,20 @@ class SharpnessNode(api.NodeBase):
 
         self.NodeAddParam(p)
 
+    def NodeHalo(self, eval_info):
+        # Sharpness blends the image with a 3x3 smoothed copy of it
+        return 2
+
     def NodeEvaluation(self, eval_info):
         image1 = eval_info.EvaluateParameter('Image')
         sharpness_amount = eval_info.EvaluateProperty('Amount')
 
         image = api.RenderImage()
         enhancer = ImageEnhance.Sharpness(image1.GetImage())
-        image.SetAsImage(enhancer.enhance(sharpness_amount).convert('RGBA'))
+        image.SetAsImage(
+            ConvertImageMode(enhancer.enhance(sharpness_amount), 'RGBA'),
+            owned=True
+        )
         self.NodeSetThumb(image.GetImage())
         return image
 
@@ -16,7 +16,6 @@
 # ----------------------------------------------------------------------------
 
 import os
-from PIL import Image
 
 from GimelStudio import api
 from GimelStudio.renderer import EvalInfo
@@ -47,7 +46,8 @@ class ColorImageNode(api.NodeBase):
         self.size_prop = api.SizeProp(
             idname="Size",
             default=[255, 255],
-            label="Image Size:"
+            label="Image Size:",
+            scalable=True
         )
 
         self.NodeAddProp(self.color_prop)
@@ -55,17 +55,18 @@ class ColorImageNode(api.NodeBase):
 
     def WidgetEventHook(self, idname, value):
         if idname == "Color":
-            img = self.NodeEvaluation(EvalInfo(self)).GetImage()
-            self.NodeSetThumb(img, force_refresh=True)
+            image = self.NodeEvaluation(EvalInfo(self))
+            self.NodeSetThumb(image, force_refresh=True)
             self.RefreshPropertyPanel()
 
     def NodeEvaluation(self, eval_info):
         color = eval_info.EvaluateProperty('Color')
         imgsize = eval_info.EvaluateProperty('Size')
 
+        # The pixels are only created if a node needs them
         image = api.RenderImage()
-        image.SetAsImage(Image.new("RGBA", (imgsize[0], imgsize[1]), color))
-        self.NodeSetThumb(image.GetImage())
+        image.SetAsConstant((imgsize[0], imgsize[1]), color)
+        self.NodeSetThumb(image)
         return image
 
 
@@ -21,6 +21,8 @@ from PIL import Image, ImageOps
 
 from GimelStudio import api
 from GimelStudio.renderer import EvalInfo
+from GimelStudio.utils.image import ScaleImage
+from GimelStudio.utils.misc import GetFileStamp
 
 
 class ImageFromBlenderNode(api.NodeBase):
@@ -66,6 +68,13 @@ class ImageFromBlenderNode(api.NodeBase):
 
         self.NodeAddProp(self.layer_prop)
 
+    def NodeCacheKey(self):
+        # The Blender add-on writes the layers to the same files
+        layer_path = self._layers.get(self.layer_prop.GetValue())
+        if layer_path is None:
+            return None
+        return GetFileStamp(layer_path)
+
     def WidgetEventHook(self, idname, value):
         if idname in ["Layer"]:
             self.RefreshLayers()
@@ -88,6 +97,11 @@ class ImageFromBlenderNode(api.NodeBase):
 
         image.SetAsOpenedImage(layer_path)
 
+        # Proxy renders work on a scaled down copy of the image
+        scale = eval_info.GetRenderScale()
+        if scale != 1.0:
+            image.SetAsImage(ScaleImage(image.GetImage(), scale))
+
         self.NodeSetThumb(image.GetImage())
         return image
 
@@ -52,7 +52,8 @@ class GradientImageNode(api.NodeBase):
         self.size_prop = api.SizeProp(
             idname="Size",
             default=[255, 255],
-            label="Image Size:"
+            label="Image Size:",
+            scalable=True
         )
 
         self.NodeAddProp(self.color1_prop)
@@ -82,7 +83,7 @@ class GradientImageNode(api.NodeBase):
             color1, color2
         )
         image = api.RenderImage()
-        image.SetAsImage(gradient_image.convert('RGBA'))
+        image.SetAsImage(gradient_image.convert('RGBA'), owned=True)
         self.NodeSetThumb(image.GetImage())
         return image
 
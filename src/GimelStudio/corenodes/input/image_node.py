@@ -20,13 +20,17 @@ from PIL import Image
 
 from GimelStudio import api
 from GimelStudio.renderer import EvalInfo
+from GimelStudio.utils.image import ScaleImage
+from GimelStudio.utils.misc import GetFileStamp
 
 
 class ImageNode(api.NodeBase):
     def __init__(self, _id):
         api.NodeBase.__init__(self, _id)
 
-        self._cachedPath = ""
+        self._cachedKey = None
+        self._cachedImage = None
+        self._cachedHash = None
 
     @property
     def NodeMeta(self):
@@ -56,7 +60,8 @@ class ImageNode(api.NodeBase):
             dlg_msg="Choose image...",
             wildcard=wildcard,
             btn_lbl="Choose...",
-            label="Image path:"
+            label="Image path:",
+            stamp=False
         )
         self.lbl_prop = api.LabelProp(
             idname="Meta Info",
@@ -87,21 +92,45 @@ class ImageNode(api.NodeBase):
 
         # print(">>>", time.time() - t)
 
+    def LoadImage(self, path):
+        """ Read the image file, unless it has not changed since it
+        was last read.
+
+        :param path: image file path
+        """
+        key = (path,) + GetFileStamp(path)
+        if self._cachedKey == key:
+            return
+        if not os.path.isfile(path):
+            # Render an empty image rather than the last file read
+            print("[WARNING] Could not find the image file {}".format(path))
+            self._cachedKey = key
+            self._cachedImage = None
+            self._cachedHash = None
+            return
+        image = api.RenderImage()
+        image.SetAsOpenedImage(path)
+        image.SetAsImage(image.GetImage().convert('RGBA'))
+        self._cachedKey = key
+        self._cachedImage = image.GetImage()
+        self._cachedHash = image.GetHash()
+
+    def NodeCacheKey(self):
+        # The output only changes with the pixels of the file, so saving
+        # it again unchanged doesn't render the node graph again.
+        path = self.fp_prop.GetValue()
+        if path == "":
+            return None
+        self.LoadImage(path)
+        return self._cachedHash
+
     def NodeEvaluation(self, eval_info):
         path = eval_info.EvaluateProperty('File Path')
         image = api.RenderImage()
 
         if path != "":
-            if self._cachedPath != path:
-                try:
-                    image.SetAsOpenedImage(path)
-                    img = image.GetImage().convert('RGBA')
-                    self._cachedPath = path
-                    self._cachedImage = img
-                    image.SetAsImage(img)
-                except FileNotFoundError:
-                    print("FILE NOT FOUND")
-            else:
+            self.LoadImage(path)
+            if self._cachedImage is not None:
                 image.SetAsImage(self._cachedImage)
 
         # if path != '':
@@ -111,6 +140,11 @@ class ImageNode(api.NodeBase):
         #     except FileNotFoundError:
         #         pass
 
+        # Proxy renders work on a scaled down copy of the image
+        scale = eval_info.GetRenderScale()
+        if scale != 1.0:
+            image.SetAsImage(ScaleImage(image.GetImage(), scale))
+
         self.NodeSetThumb(image.GetImage())
         return image
 
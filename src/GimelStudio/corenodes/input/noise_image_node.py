@@ -50,12 +50,17 @@ class NoiseImageNode(api.NodeBase):
         self.size_prop = api.SizeProp(
             idname="Size",
             default=[255, 255],
-            label="Image Size:"
+            label="Image Size:",
+            scalable=True
         )
 
         self.NodeAddProp(self.sigma_prop)
         self.NodeAddProp(self.size_prop)
 
+    def NodeIsDeterministic(self):
+        # Each noise node generates its own noise
+        return False
+
     def WidgetEventHook(self, idname, value):
         img = self.NodeEvaluation(EvalInfo(self)).GetImage()
         self.NodeSetThumb(img, force_refresh=True)
@@ -66,7 +71,8 @@ class NoiseImageNode(api.NodeBase):
 
         image = api.RenderImage()
         image.SetAsImage(
-            Image.effect_noise((imgsize[0], imgsize[1]), sigma).convert("RGBA")
+            Image.effect_noise((imgsize[0], imgsize[1]), sigma).convert("RGBA"),
+            owned=True
         )
         self.NodeSetThumb(image.GetImage())
         return image
@@ -20,7 +20,6 @@ import cv2
 from PIL import ImageFilter
 
 from GimelStudio import api
-from GimelStudio.utils.image import ArrayFromImage, ArrayToImage
 
 
 class EdgeDetectNode(api.NodeBase):
@@ -83,6 +82,15 @@ class EdgeDetectNode(api.NodeBase):
             self.higher_threshold.SetIsVisible(True)
             self.RefreshPropertyPanel()
 
+    def NodeHalo(self, eval_info):
+        method = eval_info.EvaluateProperty("Method")
+        if method == "Find Edges":
+            return 1
+        elif method == "Canny":
+            # The hysteresis step follows edges across the whole image
+            return None
+        return 0
+
     def NodeEvaluation(self, eval_info):
         input_image = eval_info.EvaluateParameter("Image")
         method = eval_info.EvaluateProperty("Method")
@@ -94,11 +102,13 @@ class EdgeDetectNode(api.NodeBase):
         # Consider removing the Pillow method?
         if method == "Find Edges":
             img = input_image.GetImage().convert("L").filter(ImageFilter.FIND_EDGES)
-            image.SetAsImage(img.convert("RGBA"))
+            image.SetAsImage(img.convert("RGBA"), owned=True)
         elif method == "Canny":
-            input_image_array = ArrayFromImage(input_image.GetImage())
-            output_image_array = cv2.Canny(input_image_array, lower_threshold, higher_threshold)
-            image.SetAsImage(ArrayToImage(output_image_array).convert("RGBA"))
+            input_image_array = input_image.GetArray()
+            output_image_array = eval_info.NewArray(input_image_array.shape[:2])
+            cv2.Canny(input_image_array, lower_threshold, higher_threshold,
+                      output_image_array)
+            image.SetAsArray(output_image_array, owned=True)
         else:
             image.SetAsImage(input_image.GetImage())
 
@@ -19,29 +19,274 @@
 # ----------------------------------------------------------------------------
 
 from PIL import Image
+import numpy
+from numpy import uint8
+
+from GimelStudio.utils.image import ArrayFromImage, ArrayToImage, HashArray
 
 
 class RenderImage(object):
-    """ Represents an image data type for the renderer. """
+    """ Represents an image data type for the renderer.
+
+    The pixels are held as a PIL ``Image``, as a NumPy array or both.
+    ``GetImage`` and ``GetArray`` convert between the two only when the
+    other representation is asked for, and keep the result, so a chain of
+    NumPy (or OpenCV) based nodes passes arrays along without going through
+    PIL and back at every node.
+
+    Both representations are read-only once they have been handed to the
+    ``RenderImage``, as they may share their memory with each other and
+    with the cached outputs of the renderer. Nodes must create a new image
+    (or copy the array) instead of modifying them in place.
+
+    The exception is an image which owns its pixels (the node which
+    output it created them, see ``SetAsImage``) and which the renderer
+    hands over to its last consumer. ``GetWritableImage`` and
+    ``GetWritableArray`` then return the pixels themselves, so that node
+    can modify them in place. Otherwise they return a copy.
+
+    An image may also be a solid colour with no pixels at all (see
+    ``SetAsConstant``), such as the output of the Color Image node or the
+    default image of a parameter. Its pixels are only created when they
+    are asked for, so nodes which can work out their output from the
+    colour alone (e.g: point nodes, see ``IsConstant``) don't walk over
+    the whole image.
+    """
 
     def __init__(self, size=(100, 100), color=(0, 0, 0, 1), packed_data=None):
-        self._img = Image.new("RGBA", (size[0], size[1]), color)
+        # The default image is a constant, which is only created if no
+        # other image is set and its pixels are asked for
+        self._constant = ((size[0], size[1]), color)
+        self._img = None
+        self._array = None
+        self._owned = False
+        self._writable = False
+        self._hash = None
         self._packedData = packed_data
+        self._origin = (0, 0)
 
     def GetPILImage(self):
         """ Returns the image.
 
         :returns: PIL ``Image`` object
         """
-        return self._img
+        return self.GetImage()
 
     def GetImage(self):
-        """ Returns the image.
+        """ Returns the image, creating it from the array if the image
+        was set as an array.
 
         :returns: PIL ``Image`` object
         """
+        if self._img is None:
+            if self._array is None:
+                self._img = Image.new("RGBA", *self._constant)
+            else:
+                # RGBA arrays are wrapped without copying
+                self._img = ArrayToImage(self._array)
         return self._img
 
+    def GetArray(self):
+        """ Returns the pixels of the image as a NumPy array, with a
+        (height, width, channels) shape in the order of the image mode
+        (RGBA for node outputs). The array is read-only.
+
+        :returns: read-only NumPy array
+        """
+        if self._array is None:
+            self._array = ArrayFromImage(self.GetImage())
+        return self._array
+
+    def GetWritableImage(self, mode=None):
+        """ Returns the image for modifying it in place. This is the image
+        itself if it has been handed over to the calling node, otherwise a
+        copy of it.
+
+        :param mode: optional PIL image mode to convert the image to
+        :returns: PIL ``Image`` object
+        """
+        if self._img is None and self._array is None:
+            # A new image of the colour, rather than a copy of it
+            image = Image.new("RGBA", *self._constant)
+            if mode is not None and mode != "RGBA":
+                return image.convert(mode)
+            return image
+        image = self.GetImage()
+        if mode is not None and image.mode != mode:
+            # Converting makes a new image anyway
+            return image.convert(mode)
+        if self._writable == True and image.readonly == 0:
+            self._writable = False
+            self._owned = False
+            self._array = None
+            self._hash = None
+            return image
+        return image.copy()
+
+    def GetWritableArray(self):
+        """ Returns the pixels of the image as a NumPy array for modifying
+        it in place. This is the array itself if it has been handed over to
+        the calling node, otherwise a copy of it.
+
+        :returns: NumPy array
+        """
+        if self._writable == True and self._array is not None:
+            try:
+                self._array.flags.writeable = True
+            except ValueError:
+                # A view of a read-only array
+                pass
+            else:
+                self._writable = False
+                self._owned = False
+                self._img = None
+                self._hash = None
+                return self._array
+        if self._img is None and self._array is None:
+            size = self._constant[0]
+            array = numpy.empty((size[1], size[0], 4), uint8)
+            array[...] = self.GetColor()
+            return array
+        return numpy.array(self.GetArray())
+
+    def GetHash(self):
+        """ Returns a hash of the pixels of the image, to tell whether two
+        images are identical. It is only computed the first time, from the
+        array without copying it (see ``HashArray``).
+
+        :returns: hexadecimal hash
+        """
+        if self._hash is None:
+            if self._img is None and self._array is None:
+                # The same hash as the pixels, from a view of the colour
+                size = self._constant[0]
+                self._hash = HashArray(numpy.broadcast_to(
+                    numpy.array(self.GetColor(), uint8), (size[1], size[0], 4)
+                ))
+            else:
+                self._hash = HashArray(self.GetArray())
+        return self._hash
+
+    def IsConstant(self):
+        """ Returns whether the image is a solid colour (see
+        ``SetAsConstant``), whether or not its pixels have been created.
+
+        :returns: boolean
+        """
+        return self._constant is not None
+
+    def GetColor(self):
+        """ Returns the colour of a constant image.
+
+        :returns: tuple of the R, G, B and A values or None if the image
+        isn't a constant
+        """
+        if self._constant is None:
+            return None
+        return Image.new("RGBA", (1, 1), self._constant[1]).getpixel((0, 0))
+
+    def IsOwned(self):
+        """ Returns whether the pixels of this image belong to it alone,
+        so that they may be handed over to the node consuming it.
+
+        :returns: boolean
+        """
+        return self._owned
+
+    def IsWritable(self):
+        """ Returns whether the pixels of this image have been handed over
+        to the node it is passed to.
+
+        :returns: boolean
+        """
+        return self._writable
+
+    def HandOver(self):
+        """ Let the node this image is passed to modify it in place. This
+        is called by the renderer when that node is the last consumer of
+        the image and the image is not kept anywhere else. Images which
+        don't own their pixels stay read-only.
+        """
+        self._writable = self._owned
+
+    def HasArray(self):
+        """ Returns whether the pixels are available as a NumPy array
+        without converting the image.
+
+        :returns: boolean
+        """
+        return self._array is not None
+
+    def GetSize(self):
+        """ Returns the size of the image without converting it.
+
+        :returns: tuple of width and height
+        """
+        if self._img is not None:
+            return self._img.size
+        elif self._array is not None:
+            return (self._array.shape[1], self._array.shape[0])
+        return self._constant[0]
+
+    def GetByteSize(self):
+        """ Returns the approximate size in bytes of the pixels held by
+        this image. An image wrapping the array is only counted once.
+
+        :returns: size in bytes
+        """
+        size = 0
+        if self._array is not None:
+            size += self._array.nbytes
+            if (self._img is not None and self._img.readonly == 1
+                    and self._array.flags.c_contiguous):
+                return size
+        if self._img is not None:
+            # Pillow stores the pixels of multi-band images in 4 bytes
+            if len(self._img.getbands()) > 1 or self._img.mode in ("I", "F"):
+                size += self._img.size[0] * self._img.size[1] * 4
+            else:
+                size += self._img.size[0] * self._img.size[1]
+        return size
+
+    def GetOrigin(self):
+        """ Returns the position of the top-left pixel of this image in
+        the whole image, when only a region of it has been rendered.
+
+        :returns: tuple of x and y
+        """
+        return self._origin
+
+    def SetOrigin(self, origin):
+        """ Sets the position of the top-left pixel of this image in
+        the whole image.
+
+        :param origin: tuple of x and y
+        """
+        self._origin = (origin[0], origin[1])
+
+    def Crop(self, box):
+        """ Returns the given region of this image as a new ``RenderImage``.
+        Array-backed images are cropped to a view of the array, without
+        copying the pixels.
+
+        :param box: region (left, top, right, bottom) to crop, in pixels
+        :returns: RenderImage object
+        """
+        image = RenderImage()
+        width, height = self.GetSize()
+        inside = (box[0] >= 0 and box[1] >= 0
+                  and box[2] <= width and box[3] <= height)
+        if self._constant is not None and inside:
+            image.SetAsConstant((box[2] - box[0], box[3] - box[1]),
+                                self._constant[1])
+        elif self._array is not None and inside:
+            image._constant = None
+            image._img = None
+            image._array = self._array[box[1]:box[3], box[0]:box[2]]
+        else:
+            image.SetAsImage(self.GetImage().crop(box), owned=True)
+        return image
+
     def SetAsOpenedImage(self, path):
         """ Sets the image and opens it. If the image is non-existent,
         it will try to get packed data from the file, if possible.
@@ -49,16 +294,211 @@ class RenderImage(object):
         :param path: image filepath to be opened
         """
         try:
-            self._img = Image.open(path)
+            self.SetAsImage(Image.open(path))
         except FileNotFoundError:
             if self._packedData is not None:
-                self._img = self._packedData
+                self.SetAsImage(self._packedData)
             else:
                 print("WARNING: COULD NOT GET PACKED IMAGE DATA!")
 
-    def SetAsImage(self, image):
-        """ Sets the image.
+    def SetAsImage(self, image, owned=False):
+        """ Sets the image. The image must not be modified afterwards.
 
         :param image: PIL ``Image`` object
+        :param owned: True if the image has just been created for this
+        ``RenderImage`` and isn't kept or shared anywhere else (e.g: not
+        the input image or an image cached by the node), so it may be
+        handed over to the next node
         """
+        self._constant = None
         self._img = image
+        self._array = None
+        self._owned = owned
+        self._writable = False
+        self._hash = None
+
+    def SetAsArray(self, array, owned=False):
+        """ Sets the image from a NumPy array, as returned by OpenCV or
+        NumPy operations. RGBA uint8 arrays are kept as they are and must
+        not be modified afterwards. Other arrays (grey-scale, RGB or
+        floating point) are converted to an RGBA image, like
+        ``ArrayToImage(array, 'RGBA')`` does.
+
+        :param array: NumPy array with a (height, width) or
+        (height, width, channels) shape
+        :param owned: True if the array has just been created for this
+        ``RenderImage`` (not a view of the input array), see ``SetAsImage``
+        """
+        self._constant = None
+        if array.dtype == uint8 and array.ndim == 3 and array.shape[2] == 4:
+            array.flags.writeable = False
+            self._img = None
+            self._array = array
+            self._owned = owned
+        else:
+            # The converted image is always a new one
+            self._img = ArrayToImage(array, 'RGBA')
+            self._array = None
+            self._owned = True
+        self._writable = False
+        self._hash = None
+
+    def SetAsConstant(self, size, color):
+        """ Sets the image to a solid colour, without creating its pixels.
+        They are created when the image or the array is asked for.
+
+        :param size: size (width, height) of the image
+        :param color: colour of the image, as accepted by ``Image.new``
+        for an RGBA image
+        """
+        self._constant = ((size[0], size[1]), color)
+        self._img = None
+        self._array = None
+        self._owned = False
+        self._writable = False
+        self._hash = None
+
+
+class PointTransform(object):
+    """ Describes the effect of a node which sets each pixel of an RGBA
+    image from the value of that pixel alone (see
+    ``NodeBase.NodePointTransform``), as a lookup table per channel or as
+    an affine colour matrix. The renderer composes the transforms of a
+    chain of such nodes and applies them to the image at once.
+
+    Like ``Image.blend`` (and so ``ImageEnhance``), the values are clipped
+    to [0, 255] and truncated.
+    """
+
+    def __init__(self):
+        self._table = None
+        self._matrix = None
+        self._offset = None
+
+    def IsTable(self):
+        """ Returns whether the transform is a lookup table.
+
+        :returns: boolean
+        """
+        return self._table is not None
+
+    def GetTable(self):
+        """ Returns the lookup tables of the R, G, B and A channels.
+
+        :returns: uint8 NumPy array with a (4, 256) shape or None
+        """
+        return self._table
+
+    def GetMatrix(self):
+        """ Returns the colour matrix and the offset of each channel.
+
+        :returns: tuple of a float32 NumPy array with a (4, 5) shape and
+        one with a (4,) shape or None
+        """
+        if self._matrix is None:
+            return None
+        return (self._matrix, self._offset)
+
+    def SetAsTable(self, tables):
+        """ Sets the transform to a lookup table per channel.
+
+        :param tables: sequence of the tables of the R, G, B and A
+        channels, each with the output value of the 256 input values, or
+        None to leave the channel as it is
+        """
+        self._table = numpy.empty((4, 256), uint8)
+        for channel, table in enumerate(tables):
+            if table is None:
+                self._table[channel] = numpy.arange(256)
+            else:
+                self._table[channel] = numpy.clip(table, 0, 255)
+        self._matrix = None
+        self._offset = None
+
+    def SetAsMatrix(self, matrix, offset=None):
+        """ Sets the transform to an affine colour matrix. Each output
+        channel is the sum of the R, G, B and A values of the pixel and of
+        its grey-scale value L (as ``Image.convert('L')`` computes it)
+        weighted by a row of the matrix, plus the offset of the channel.
+
+        :param matrix: 4x5 matrix, with the R, G, B, A and L weights of
+        the R, G, B and A output channels
+        :param offset: optional sequence of the values added to the R, G,
+        B and A channels
+        """
+        self._matrix = numpy.array(matrix, numpy.float32).reshape((4, 5))
+        if offset is None:
+            self._offset = numpy.zeros(4, numpy.float32)
+        else:
+            self._offset = numpy.array(offset, numpy.float32).reshape(4)
+        self._table = None
+
+    def Then(self, transform):
+        """ Returns the transform applying this transform and then the
+        given one, if it can be described as a single transform.
+
+        :param transform: PointTransform object applied afterwards
+        :returns: PointTransform object or None
+        """
+        if self.IsTable() and transform.IsTable():
+            composed = PointTransform()
+            composed.SetAsTable(numpy.take_along_axis(
+                transform.GetTable(), self._table.astype(numpy.intp), axis=1
+            ))
+            return composed
+        return None
+
+
+class GeometricTransform(object):
+    """ Describes the effect of a node which moves the pixels of the image
+    around (see ``NodeBase.NodeGeometricTransform``), as the affine
+    transform from the coordinates of the output image to those of the
+    input image (like ``Image.transform`` with ``Image.AFFINE``) and the
+    region of the output image. The renderer composes the transforms of
+    a chain of such nodes and resamples the image once.
+
+    Coordinates are those of the corners of the pixels in the whole
+    image, i.e: the centre of the top-left pixel is at (0.5, 0.5).
+
+    :param matrix: tuple (a, b, c, d, e, f) mapping each output pixel
+    (x, y) to the input pixel (a * x + b * y + c, d * x + e * y + f)
+    :param region: region (left, top, right, bottom) of the output image
+    :param resample: PIL resampling filter used when the transform
+    doesn't map whole pixels to whole pixels
+    """
+
+    def __init__(self, matrix, region, resample=Image.NEAREST):
+        self._matrix = tuple(matrix)
+        self._region = tuple(region)
+        self._resample = resample
+
+    def GetMatrix(self):
+        return self._matrix
+
+    def GetRegion(self):
+        return self._region
+
+    def GetResample(self):
+        return self._resample
+
+    def Then(self, transform):
+        """ Returns the transform applying this transform and then the
+        given one, which must have been made for the output region of
+        this one.
+
+        :param transform: GeometricTransform object applied afterwards
+        :returns: GeometricTransform object
+        """
+        a1, b1, c1, d1, e1, f1 = self._matrix
+        a2, b2, c2, d2, e2, f2 = transform.GetMatrix()
+        matrix = (
+            a1 * a2 + b1 * d2,
+            a1 * b2 + b1 * e2,
+            a1 * c2 + b1 * f2 + c1,
+            d1 * a2 + e1 * d2,
+            d1 * b2 + e1 * e2,
+            d1 * c2 + e1 * f2 + f1
+        )
+        # NEAREST (0) < BILINEAR (2) < BICUBIC (3)
+        resample = max(self._resample, transform.GetResample())
+        return GeometricTransform(matrix, transform.GetRegion(), resample)
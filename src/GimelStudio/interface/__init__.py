@@ -4,5 +4,5 @@ from .node_property_panel import NodePropertyPanel
 from .image_viewport import ImageViewport
 from .add_node_menu import AddNodeMenu
 from .developer_log import DeveloperLog
-from .file_io import ExportImageAs
+from .file_io import ExportImageAs, ExportNodeGraphAs
 from .dark_menu_renderer import DarkMenuRenderer
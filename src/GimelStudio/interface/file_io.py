@@ -24,6 +24,7 @@ import wx
 
 from GimelStudio import utils
 from GimelStudio.file_support import SupportFTSave
+from GimelStudio.project import SaveNodeGraph
 
 
 def ExportImageAs(parent, image):
@@ -89,3 +90,42 @@ def ExportImageAs(parent, image):
             notify.Show(timeout=2)  # 1 for short timeout, 100 for long timeout
 
     dlg.Destroy()
+
+
+def ExportNodeGraphAs(parent, nodes):
+    """ Method defining node graph export, to a file which can be
+    rendered with the gimelstudio-render command.
+
+    :param parent: MainApplication class
+    :param nodes: dictionary of nodes of the Node Graph
+    """
+    dlg = wx.FileDialog(
+        parent,
+        message="Export node graph as...",
+        defaultDir=os.getcwd(),
+        defaultFile="untitled.json",
+        wildcard="Node graph file (*.json)|*.json",
+        style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT
+    )
+    dlg.Center()
+
+    if dlg.ShowModal() == wx.ID_OK:
+        path = dlg.GetPath()
+        try:
+            SaveNodeGraph(nodes, path)
+        except OSError as error:
+            dlg = wx.MessageDialog(
+                None,
+                "The node graph could not be saved: \n {}".format(error),
+                "Cannot Save Node Graph!",
+                style=wx.ICON_EXCLAMATION
+            )
+            dlg.ShowModal()
+        else:
+            notify = wx.adv.NotificationMessage(
+                title="Node Graph Exported Sucessfully",
+                message="Your node graph was exported to \n {}".format(path),
+                parent=None, flags=wx.ICON_INFORMATION)
+            notify.Show(timeout=2)
+
+    dlg.Destroy()
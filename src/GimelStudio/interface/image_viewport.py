@@ -36,6 +36,7 @@ class ImageViewport(ZoomPanel):
         self._parent = parent
         self._zoom = 100
         self._renderTime = 0.00
+        self._renderScale = 1.0
         self._rendering = False
         self._viewportImage = utils.ConvertImageToWx(
             Image.new('RGBA', (256, 256)))
@@ -50,9 +51,14 @@ class ImageViewport(ZoomPanel):
 
     def OnDrawScene(self, dc):
         image = self._viewportImage
-        x = (self.Size[0] - image.Width) / 2.0
-        y = (self.Size[1] - image.Height) / 2.0
+        scale = self._renderScale
+
+        # Lower quality renders are drawn at the size of the full image
+        dc.SetUserScale(1.0 / scale, 1.0 / scale)
+        x = (self.Size[0] * scale - image.Width) / 2.0
+        y = (self.Size[1] * scale - image.Height) / 2.0
         dc.DrawBitmap(image, x, y, useMask=False)
+        dc.SetUserScale(1.0, 1.0)
 
     def OnDrawInterface(self, dc):
         gc = wx.GraphicsContext.Create(dc)
@@ -98,6 +104,8 @@ class ImageViewport(ZoomPanel):
             info = "Render Finished in {0} sec. | Zoom {1}%".format(
                 render_time, zoom
             )
+            if self._renderScale != 1.0:
+                info += " | Preview {0}%".format(round(self._renderScale * 100))
         else:
             info = "Rendering image..."
         return info
@@ -109,13 +117,16 @@ class ImageViewport(ZoomPanel):
     def UpdateZoomValue(self):
         self._zoom = round(self.GetScaleX() * 100)
 
-    def UpdateViewerImage(self, image, render_time):
+    def UpdateViewerImage(self, image, render_time, render_scale=1.0):
         """ Update the Image Viewport. This refreshes everything
         in the Viewport.
 
         :param image: wx.Bitmap
         :param float render_time: float value of the image's render time
+        :param float render_scale: scale of the render relative to the
+        full resolution
         """
         self._renderTime = render_time
+        self._renderScale = render_scale
         self._viewportImage = image
         self.UpdateDrawing()
@@ -26,7 +26,7 @@ from PIL import Image
 
 from GimelStudio.utils import DrawGrid, ConvertImageToWx
 from GimelStudio.registry import CreateNode
-from GimelStudio.node import Wire
+from GimelStudio.node.wire import Wire
 from .add_node_menu import AddNodeMenu
 from .menu_button import MenuButton
 from GimelStudio.datafiles import *
@@ -870,7 +870,9 @@ class NodeGraph(wx.ScrolledCanvas):
                 if render_image is None:
                     img = Image.new('RGBA', (256, 256))
                 else:
-                    img = render_image
+                    # Don't resize the render itself, as it is also
+                    # the cached output of the last node.
+                    img = render_image.copy()
 
                 img.thumbnail((round((self.GetSize()[0] - 10) / 1.1), img.size[1]))
                 image = ConvertImageToWx(img)
@@ -47,5 +47,72 @@ APP_TITLE = "{0} v{1}".format(APP_NAME, FULL_APP_VERSION_STRING)
 # development and/or testing of the program.
 APP_DEBUG = False
 
-# Whether to enable the experimental renderer threading
-ENABLE_THREADING = False
+# Whether to render in a background thread, so that renders
+# don't block the UI
+ENABLE_THREADING = True
+
+# Delay (in milliseconds) after the last edit before a full resolution
+# render is run when previewing renders at a lower quality
+FULL_RENDER_DELAY = 750
+
+# Maximum size (in megabytes) of the unused image buffers the renderer
+# keeps for re-use by the next renders
+BUFFER_POOL_LIMIT = 1024
+
+# Maximum size (in megabytes) of the node outputs the renderer keeps
+# between renders for re-rendering only what changed
+NODE_CACHE_BUDGET = 2048
+
+# Which node outputs are evicted first once the cache is full: "lru" for
+# the least recently used or "cost" for the quickest to recompute per byte
+NODE_CACHE_POLICY = "lru"
+
+# Whether to write the node outputs evicted from the node cache to
+# disk, so that they are read back instead of being rendered again
+ENABLE_DISK_SPILL = True
+
+# Maximum size (in megabytes) of the node outputs written to disk
+DISK_SPILL_LIMIT = 8192
+
+# Directory in which the scratch directory for the node outputs written
+# to disk is created or None for the temporary directory of the system
+DISK_SPILL_DIRECTORY = None
+
+# Node outputs which took less than this (in seconds) to render
+# are rendered again rather than written to disk
+DISK_SPILL_MIN_COST = 0.1
+
+# Whether to evaluate identical nodes (same type, properties and
+# inputs) only once per render
+MERGE_DUPLICATE_NODES = True
+
+# Whether to apply chains of point nodes (Brightness, Contrast,
+# Invert, etc) to the image in one pass
+FUSE_POINT_NODES = True
+
+# Whether to resample the image once for chains of geometric
+# nodes (Crop, Flip)
+FUSE_GEOMETRIC_NODES = True
+
+# Whether to make the node thumbnails on a background thread, rather
+# than on the render threads as each node is evaluated
+BACKGROUND_THUMBNAILS = True
+
+# Whether the UI keeps the outputs of expensive nodes on disk between
+# sessions. The command line renderer shares them unless it is given
+# the --no-cache option.
+ENABLE_PERSISTENT_CACHE = True
+
+# Directory of the node outputs kept between sessions
+PERSISTENT_CACHE_DIRECTORY = "~/.gimelstudio/cache/"
+
+# Maximum size (in megabytes) of the node outputs kept between sessions
+PERSISTENT_CACHE_LIMIT = 4096
+
+# Node outputs which took less than this (in seconds) to render
+# are not kept between sessions
+PERSISTENT_CACHE_MIN_COST = 0.5
+
+# Whether to print the memory statistics of the renderer to the
+# developer log after each render
+LOG_RENDER_STATS = False
@@ -1,9 +1,7 @@
 from .base import NodeBase
+from .data import NodeData, NewNodeId
 from .model import NodeModel
 from .object import NodeObject
-from .view import NodeView
-from .socket import Socket
-from .wire import Wire
 from .parameter import (
     Parameter, RenderImageParam,
 )
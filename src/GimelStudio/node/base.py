@@ -18,9 +18,15 @@
 # PURPOSE: Define the base toplevel-class for subclassing to create nodes
 # ----------------------------------------------------------------------------
 
-import wx
+try:
+    import wx
+except ImportError:
+    # Nodes can be evaluated without wxPython, it is only used by the UI
+    wx = None
 
+from GimelStudio import meta
 from .object import NodeObject
+from .thumbnails import GetThumbnailThread, GetThumbnailsEnabled
 
 
 class NodeBase(NodeObject):
@@ -53,6 +59,7 @@ class NodeBase(NodeObject):
 
         Please do not override.
         """
+        self.Model.MarkDirty()
         self.WidgetEventHook(idname, value)
         if render == True:
             self.NodeGraphMethods.Render()
@@ -222,11 +229,129 @@ class NodeBase(NodeObject):
     def NodeEvaluation(self, eval_info):
         """ This is the method that is called during rendering of the image. This should contain the actual code which does something to the image (e.g: blurs the image, etc.) and should return it as a ``RenderImage`` object.
 
+        Input images are read-only: use ``RenderImage.GetImage`` for Pillow
+        operations or ``RenderImage.GetArray`` for NumPy/OpenCV operations and
+        set the result on a new ``RenderImage`` with ``SetAsImage`` or
+        ``SetAsArray``. Nodes working on arrays should output arrays, so that
+        the next NumPy based node gets them without a conversion.
+
+        To modify an input in place, get it with
+        ``RenderImage.GetWritableImage`` or ``RenderImage.GetWritableArray``.
+        This returns the input itself when the renderer has handed it over to
+        the node (the node is its last consumer and it isn't cached) and a copy
+        of it otherwise. Pass ``owned=True`` to ``SetAsImage`` or
+        ``SetAsArray`` when the output was created by the node (i.e: it is not
+        one of the input images or an image the node keeps), so that it can be
+        handed over to the next node.
+
         :param eval_info: object exposing methods to get evaluated ``Parameter`` and ``Property`` values to use for evaluating this node.
         :returns: this should return a ``RenderImage`` object
         """
         pass
 
+    def NodeHalo(self, eval_info):
+        """ Declare how this node may be rendered in tiles. Return 0 if each
+        output pixel only depends on the input pixel at the same position (e.g:
+        brightness), the number of neighbouring pixels needed on each side if
+        it depends on a neighbourhood of the input (e.g: blur) or ``None`` if
+        the node needs the whole image (e.g: histogram equalization) or changes
+        its size.
+
+        :param eval_info: object exposing methods to get evaluated ``Property`` values
+        :returns: halo in pixels or ``None`` if the node cannot be tiled
+        """
+        return None
+
+    def NodeInputRegion(self, eval_info, region):
+        """ Return the region of the input images needed to render the given
+        region of the output image, so that only the pixels which reach the
+        output are rendered upstream. By default, the region is padded by the
+        halo of the node (see ``NodeHalo``).
+
+        Return ``None`` if the node needs its whole input images. Regions are
+        given as ``(left, top, right, bottom)`` tuples.
+
+        :param eval_info: object exposing methods to get evaluated ``Property`` values
+        :param region: region of the output image
+        :returns: region of the input images or ``None``
+        """
+        halo = self.NodeHalo(eval_info)
+        if halo is None:
+            return None
+        return (region[0] - halo, region[1] - halo,
+                region[2] + halo, region[3] + halo)
+
+    def NodeOutputRegion(self, eval_info, region):
+        """ Return the region of the output image rendered from the given
+        region of the input images. Override this together with
+        ``NodeInputRegion`` for nodes which move pixels around (e.g: crop). The
+        input images of the node then give their position in the whole image
+        with ``RenderImage.GetOrigin``.
+
+        :param eval_info: object exposing methods to get evaluated ``Property`` values
+        :param region: region of the input images
+        :returns: region of the output image
+        """
+        return region
+
+    def NodePointTransform(self, eval_info, image):
+        """ Describe the effect of this node as an ``api.PointTransform`` (a
+        lookup table per channel or a colour matrix) if it sets each pixel of
+        the RGBA input image from the value of that pixel alone (e.g:
+        brightness). Chains of such nodes are then applied to the image in one
+        pass, instead of each node making a full copy of it. The transform must
+        give the same image as ``NodeEvaluation``, which is still used when the
+        node is not part of a chain.
+
+        Only override this for nodes with a single ``RenderImageParam``.
+
+        :param eval_info: object exposing methods to get evaluated ``Property`` values
+        :param image: the input image of the node or ``None`` if it is only
+        rendered once the transforms of the nodes before it have been applied
+        :returns: PointTransform object or ``None`` if the transform needs the
+        input image (e.g: the mean of the image for contrast) and it isn't
+        given
+        """
+        return None
+
+    def NodeGeometricTransform(self, eval_info, region):
+        """ Describe the effect of this node as an ``api.GeometricTransform``
+        (an affine transform of the coordinates of the pixels and the region of
+        the output image) if it only moves the pixels of the RGBA input image
+        around (e.g: flip, crop). Chains of such nodes are then resampled in
+        one pass, and crops and flips only give a view of the input array. The
+        transform must give the same image as ``NodeEvaluation``, which is
+        still used when the node can't describe it.
+
+        Only override this for nodes with a single ``RenderImageParam``.
+
+        :param eval_info: object exposing methods to get evaluated ``Property`` values
+        :param region: region (left, top, right, bottom) of the whole input
+        image covered by the input image (see ``NodeInputRegion``)
+        :returns: GeometricTransform object or ``None``
+        """
+        return None
+
+    def NodeIsDeterministic(self):
+        """ Return ``False`` if this node may output different images from the
+        same properties and inputs (e.g: random noise), so that duplicates of
+        it are not merged into one evaluation.
+
+        :returns: boolean
+        """
+        return True
+
+    def NodeCacheKey(self):
+        """ Return what the output of this node depends on besides its
+        properties and inputs (e.g: the modification time of a file it reads,
+        see ``utils.misc.GetFileStamp``), so that its cached output is rendered
+        again when it changes. The outputs of expensive nodes are kept between
+        sessions, so the value must be the same from one session to the next.
+
+        :returns: immutable value or ``None``
+        """
+        return None
+
     def WidgetEventHook(self, idname, value):
         """ Property widget callback event hook. This method is called after the property widget has returned the new value. It is useful for updating the node itself or other node properties as a result of a change in the value of the property.
 
@@ -281,17 +406,24 @@ class NodeBase(NodeObject):
     def NodeSetThumb(self, image, force_refresh=False):
         """ Update the thumbnail for this node.
 
-        :param image: ``PIL Image`` to set as the thumbnail
+        :param image: ``PIL Image`` or ``RenderImage`` to set as the thumbnail.
+        The pixels of solid colour images are only created at the size of the
+        thumbnail. The thumbnail is made on a background thread (see
+        ``ThumbnailThread``), so the image must not be modified afterwards.
         :param force_refresh: if True, updates will apply and everything will be refreshed right away regardless of whether the *Live Node Previews* setting is ticked or not.
         """
         #print("SET THUMB")
-        try:
-            self.Model.UpdateThumbnail(image)
-            # live_update = self.NodeGraphMethods.GetLiveNodePreviewUpdate()
-
-            # if live_update == True or force_refresh == True:
-            #     self.Draw(self.NodeGraphMethods.GetPDC())
-            #     self.RefreshNodeGraph()
-        except Exception as e:
-            pass
-            #print("INIT", e)
+        if GetThumbnailsEnabled() != True:
+            return
+        # Nodes which are rendered in tiles get their thumbnail
+        # set once all the tiles have been rendered.
+        if self.Model.IsThumbLocked() == True:
+            return
+        # The thumbnail of a node being edited is needed right away
+        wait = force_refresh == True or meta.BACKGROUND_THUMBNAILS != True
+        GetThumbnailThread().Put(self, image, wait)
+        # live_update = self.NodeGraphMethods.GetLiveNodePreviewUpdate()
+
+        # if live_update == True or force_refresh == True:
+        #     self.Draw(self.NodeGraphMethods.GetPDC())
+        #     self.RefreshNodeGraph()
@@ -0,0 +1,82 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: data.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Define the pure-data evaluation model of a node
+# ----------------------------------------------------------------------------
+
+import itertools
+
+
+# Node ids are allocated by the program rather than by wxPython, so that
+# nodes can be created without it. The ids of the other objects drawn in
+# the Node Graph (sockets, wires, etc) are negative wxPython ids, so they
+# never clash with node ids.
+_nodeIds = itertools.count(1)
+
+
+def NewNodeId():
+    """ Allocate a new unique node id.
+
+    :returns: int node id
+    """
+    return next(_nodeIds)
+
+
+class NodeData(object):
+    """ Pure-data evaluation model of a node: the node type, its property
+    values and the ids of the nodes bound to its parameters. This is all
+    that is needed to re-create the node for evaluation, so it doesn't
+    depend on wxPython and can be pickled (e.g: to send a snapshot of the
+    node graph to worker processes).
+
+    NodeModel is the adapter between this data and the live node, see
+    NodeModel.GetData and NodeModel.SetData.
+    """
+
+    def __init__(self, node_id, node_type, version=(0, 0, 1), muted=False,
+                 properties=None, bindings=None):
+        self._id = node_id
+        self._type = node_type
+        self._version = tuple(version)
+        self._muted = muted
+        self._properties = dict(properties or {})
+        self._bindings = dict(bindings or {})
+
+    def __repr__(self):
+        return "NodeData({!r}, {!r})".format(self._id, self._type)
+
+    def GetId(self):
+        return self._id
+
+    def GetType(self):
+        return self._type
+
+    def GetVersion(self):
+        return self._version
+
+    def IsMuted(self):
+        return self._muted
+
+    def GetProperties(self):
+        """ Returns the dictionary of property values, keyed by
+        property name. """
+        return self._properties
+
+    def GetBindings(self):
+        """ Returns the dictionary of the ids of the nodes bound to the
+        parameters (or None), keyed by parameter name. """
+        return self._bindings
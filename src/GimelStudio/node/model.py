@@ -20,12 +20,16 @@
 
 import math
 
-import wx
-from wx.lib.embeddedimage import PyEmbeddedImage
 from PIL import Image
 
-from GimelStudio.datafiles import *
-from .socket import Socket
+from .data import NodeData, NewNodeId
+
+try:
+    import wx
+except ImportError:
+    # Only the UI needs wxPython, nodes can be
+    # created and evaluated without it.
+    wx = None
 
 
 # Nodes
@@ -47,11 +51,16 @@ STYLE_NODES_COLOR_DICT = {
 class NodeModel(object):
     """ Holds the data for the node. The intention is that this class
     will be THE one that you can know has the latest, updated data.
+
+    The evaluation data of the node (see NodeData) can be taken out of
+    and put back into the model with GetData and SetData. Everything else
+    here is only used by the UI.
      """
 
     def __init__(self, _id):
-        if _id == wx.ID_ANY:
-            self._id = wx.NewIdRef()
+        # -1 is wx.ID_ANY
+        if _id is None or _id == -1:
+            self._id = NewNodeId()
         else:
             self._id = _id
         self._parent = None
@@ -65,16 +74,18 @@ class NodeModel(object):
         self._label = ""
         self._category = "DEFAULT"
         self._muted = False
+        self._dirty = True
         self._selected = False
         self._active = False
-        self._size = wx.Size(160, 116)
-        self._position = wx.Point(0, 0)
-        self._sockets = []
+        self._size = (160, 116)
+        self._position = (0, 0)
+        self._sockets = None
         self._lastCoords = 0
 
         # Default thumbnail is a transparent 256x256 image
         self._thumbImage = Image.new('RGBA', (256, 256), (0, 0, 0, 1))
         self._thumbCache = None
+        self._thumbLocked = False
 
         self._properties = {}
         self._parameters = {}
@@ -189,8 +200,36 @@ class NodeModel(object):
         return self._muted
 
     def SetMuted(self, state=False):
+        if state != self._muted:
+            self.MarkDirty()
         self._muted = state
 
+    def IsDirty(self):
+        return self._dirty
+
+    def SetDirty(self, dirty=True):
+        self._dirty = dirty
+
+    def MarkDirty(self):
+        """ Mark this node and all the nodes downstream of it as dirty,
+        so that they are re-evaluated on the next render.
+        """
+        visited = set()
+        models = [self]
+        while models != []:
+            model = models.pop()
+            if model.GetId() in visited:
+                continue
+            visited.add(model.GetId())
+            model.SetDirty(True)
+
+            # Nodes which are not shown in the UI have no sockets
+            # (and so no wires) to follow.
+            for socket in model._sockets or []:
+                if socket.IsOutputType() == True:
+                    for wire in socket.GetWires():
+                        models.append(wire.dstNode)
+
     def GetSize(self):
         return self._size
 
@@ -207,6 +246,8 @@ class NodeModel(object):
         return self._isOutput
 
     def GetSockets(self):
+        if self._sockets is None:
+            self._sockets = self.CreateSockets()
         return self._sockets
 
     def GetParameters(self):
@@ -230,6 +271,12 @@ class NodeModel(object):
     def SetThumbCache(self, thumb):
         self._thumbCache = thumb
 
+    def IsThumbLocked(self):
+        return self._thumbLocked
+
+    def SetThumbLocked(self, locked):
+        self._thumbLocked = locked
+
     def GetVersion(self):
         return self._version
 
@@ -243,26 +290,50 @@ class NodeModel(object):
         self._description = desc
 
     def UpdateThumbnail(self, image):
-        """ Update the thumbnail. This saves the thumb image and creates
-        a thumbnail in the cache.
+        """ Update the thumbnail. This creates a thumbnail in the cache,
+        which is also saved as the thumb image. The full size image isn't
+        kept, as the next node may modify it in place.
 
         :param image: PIL Image
         """
-        self.SetThumbImage(image)
         thumb = self.CreateThumbnail(image)
+        self.SetThumbImage(thumb)
         self.SetThumbCache(thumb)
         self.CalcNewSize(thumb.size[1])
 
     def CreateThumbnail(self, image):
         """ Create a thumbnail sized to the correct dimensions for display
-        as the node thumbnail.
+        as the node thumbnail. The thumbnail is resized straight from the
+        image, like ``Image.thumbnail`` does on a copy of it, without
+        copying the full size image first.
 
         :param image: PIL Image
         :returns: PIL Image sized to the correct dimensions
         """
-        thumb = image.copy()
-        thumb.thumbnail((round((self.GetSize()[0] - 10) / 1.1), thumb.size[1]))
-        return thumb
+        size = self.GetThumbnailSize(image.size)
+        if size == image.size:
+            return image.copy()
+        return image.resize(size, Image.BICUBIC, reducing_gap=2.0)
+
+    def GetThumbnailSize(self, size):
+        """ Returns the size of the thumbnail of an image of the given
+        size.
+
+        :param size: size (width, height) of the image
+        :returns: size (width, height) of the thumbnail
+        """
+        width = round((self.GetSize()[0] - 10) / 1.1)
+        if size[0] <= width:
+            return tuple(size)
+
+        # Keep the aspect ratio, rounding the height the same
+        # way as Image.thumbnail
+        aspect = size[0] / size[1]
+        height = max(min(
+            math.floor(width / aspect), math.ceil(width / aspect),
+            key=lambda n: 0 if n == 0 else abs(aspect - width / n)
+        ), 1)
+        return (width, height)
 
     def CalcNewSize(self, thumb_height, set_size=True, border=20):
         """ Calculate the new size of the node based on the current
@@ -271,11 +342,11 @@ class NodeModel(object):
         :param thumb_height: height of the current thumb image
         :param set_size: whether to set the node to the calculated dimensions
         :param border: border (in pixels) to be placed above and below thumb image
-        :returns: the size of the node as wx.Size
+        :returns: the size of the node as a (width, height) tuple
         """
         width = 160  # Hard-coded value
         height = self._lastCoords + thumb_height + (border * 2)
-        size = wx.Size(width, height)
+        size = (width, height)
         if set_size == True:
             self.SetSize(size)
         return size
@@ -296,7 +367,26 @@ class NodeModel(object):
                 return socket
 
     def UpdateSockets(self):
-        """ Sets the correct sockets based on the node. """
+        """ Sets the correct sockets based on the node. The socket objects
+        are only created once they are needed by the UI (see GetSockets).
+        """
+        count = len(self.GetParameters())
+        if self.IsOutputNode() != True:
+            count += 1
+
+        # We keep track of where the last socket is placed so that
+        # we can place the thumbnail far enough below the sockets.
+        if count > 0:
+            self._lastCoords = 60 + 19 * (count - 1)
+
+        self._sockets = None
+
+    def CreateSockets(self):
+        """ Create the sockets of the node.
+
+        :returns: list of Socket objects
+        """
+        from .socket import Socket
 
         sockets = []
 
@@ -316,14 +406,50 @@ class NodeModel(object):
                 x = w - x + 1
                 socket_type = 1  # Socket type OUT
 
-            # We keep track of where the last socket is placed so that
-            # we can place the thumbnail far enough below the sockets.
-            self._lastCoords = 60 + 19 * i
-
             socket = Socket(p[0], p[1], (x, 40 + (19 * i)), 6.5, socket_type, self)
             sockets.append(socket)
 
-        self._sockets = sockets
+        return sockets
+
+    def GetData(self):
+        """ Get the evaluation data of the node.
+
+        :returns: NodeData object
+        """
+        bindings = {}
+        for name in self._parameters:
+            binding = self._parameters[name].binding
+            bindings[name] = binding.GetId() if binding else None
+
+        return NodeData(
+            self.GetId(),
+            self.GetType(),
+            self.GetVersion(),
+            self.IsMuted(),
+            dict((name, self._properties[name].GetValue())
+                 for name in self._properties),
+            bindings
+        )
+
+    def SetData(self, data):
+        """ Set the property values and muted state of the node from the
+        given evaluation data. The parameter bindings refer to other nodes,
+        so they are restored by the node graph (see RestoreNodeGraph).
+
+        :param data: NodeData object
+        :raises: ValueError if the node has no property of the data
+        """
+        for name, value in data.GetProperties().items():
+            if name not in self._properties:
+                raise ValueError("The node {} has no property {}".format(
+                    self.GetType(), name))
+            # Lists and tuples are not the same (e.g: colors are tuples,
+            # but a node graph loaded from JSON only has lists).
+            if isinstance(self._properties[name].GetValue(), tuple):
+                value = tuple(value)
+            self._properties[name].value = value
+        self.SetMuted(data.IsMuted())
+        self.MarkDirty()
 
     @property
     def NodeGraph(self):
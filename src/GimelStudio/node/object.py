@@ -19,15 +19,17 @@
 # ----------------------------------------------------------------------------
 
 from .model import NodeModel
-from .view import NodeView
 
 
 class NodeObject(object):
-    """ Base node object which ties together the model and view. """
+    """ Base node object which ties together the model and view. The
+    view is only created once the node is drawn, so that nodes can be
+    evaluated without wxPython.
+    """
 
     def __init__(self, _id):
         self._model = NodeModel(_id)
-        self._view = NodeView(_id)
+        self._view = None
 
     @property
     def Model(self):
@@ -43,6 +45,9 @@ class NodeObject(object):
 
         :returns: the node view object.
         """
+        if self._view is None:
+            from .view import NodeView
+            self._view = NodeView(self._model.GetId())
         return self._view
 
     def UpdateView(self):
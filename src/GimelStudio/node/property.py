@@ -22,9 +22,16 @@ import os
 import sys
 import glob
 
-import wx
-from wx.lib import buttons
-import wx.lib.agw.cubecolourdialog as CCD
+try:
+    import wx
+    from wx.lib import buttons
+    import wx.lib.agw.cubecolourdialog as CCD
+except ImportError:
+    # The property widgets are only created by the UI, so the
+    # property values can be evaluated without wxPython.
+    wx = None
+
+from GimelStudio.utils.misc import GetFileStamp
 
 # Enum-like constants for widgets
 SLIDER_WIDGET = "slider"
@@ -32,11 +39,14 @@ SPINBOX_WIDGET = "spinbox"
 
 
 class Property(object):
-    def __init__(self, idname, default, label, visible=True):
+    def __init__(self, idname, default, label, visible=True, scalable=False):
         self.idname = idname
         self.value = default
         self.label = label
         self.visible = visible
+        # Whether the value is a size in pixels (e.g: a blur kernel)
+        # which has to be scaled with the render scale.
+        self.scalable = scalable
         self.widget_eventhook = None
 
     def _RunErrorCheck(self):
@@ -52,6 +62,18 @@ class Property(object):
     def GetValue(self):
         return self.value
 
+    def GetCacheKey(self, value=None):
+        """ Returns what the output of the node depends on for this
+        property, to tell whether a cached output is still valid. This is
+        the property value by default.
+
+        :param value: value of the property the node is rendered with,
+        defaults to the current value
+        """
+        if value is None:
+            value = self.value
+        return value
+
     def SetValue(self, value, render=True):
         """ Set the value of the node property.
 
@@ -74,6 +96,12 @@ class Property(object):
     def SetIsVisible(self, is_visible):
         self.visible = is_visible
 
+    def GetIsScalable(self):
+        return self.scalable
+
+    def SetIsScalable(self, is_scalable):
+        self.scalable = is_scalable
+
     def SetWidgetEventHook(self, event_hook):
         self.widget_eventhook = event_hook
 
@@ -85,8 +113,9 @@ class PositiveIntegerProp(Property):
     """ Allows the user to select a positive integer. """
 
     def __init__(self, idname, default=0, min_val=0,
-                 max_val=10, widget="slider", label="", visible=True):
-        Property.__init__(self, idname, default, label, visible)
+                 max_val=10, widget="slider", label="", visible=True,
+                 scalable=False):
+        Property.__init__(self, idname, default, label, visible, scalable)
         self.min_value = min_val
         self.max_value = max_val
         self.widget = widget
@@ -301,15 +330,20 @@ class OpenFileChooserProp(Property):
     """ Allows the user to select a file to open.
 
     (e.g: use this to open an .PNG, .JPG, .JPEG image, etc.)
+
+    Cached node outputs are rendered again when the file is modified.
+    Pass ``stamp=False`` if the node covers the contents of the file in
+    its ``NodeCacheKey`` instead.
     """
 
     def __init__(self, idname, default="", dlg_msg="Choose file...",
                  wildcard="All files (*.*)|*.*", btn_lbl="Choose...",
-                 label="", visible=True):
+                 label="", visible=True, stamp=True):
         Property.__init__(self, idname, default, label, visible)
         self.dlg_msg = dlg_msg
         self.wildcard = wildcard
         self.btn_lbl = btn_lbl
+        self.stamp = stamp
 
         self._RunErrorCheck()
 
@@ -317,6 +351,14 @@ class OpenFileChooserProp(Property):
         if type(self.value) != str:
             raise TypeError("OpenFileChooserField value must be a string!")
 
+    def GetCacheKey(self, value=None):
+        if value is None:
+            value = self.value
+        # The file may have changed since it was last read
+        if self.stamp == True:
+            return (value,) + GetFileStamp(value)
+        return value
+
     def GetDlgMessage(self):
         return self.dlg_msg
 
@@ -380,6 +422,10 @@ class LabelProp(Property):
 
         self._RunErrorCheck()
 
+    def GetCacheKey(self, value=None):
+        # Labels only display information about the node
+        return None
+
     def CreateUI(self, parent, sizer):
         label = wx.StaticText(parent, label=self.GetLabel())
         label.SetForegroundColour("#fff")
@@ -394,8 +440,8 @@ class SizeProp(Property):
     """ Allows the user to select an X and Y size. """
 
     def __init__(self, idname, default=[255, 255], min_val=0,
-                 max_val=6000, label="", visible=True):
-        Property.__init__(self, idname, default, label, visible)
+                 max_val=6000, label="", visible=True, scalable=False):
+        Property.__init__(self, idname, default, label, visible, scalable)
         self.min_value = min_val
         self.max_value = max_val
 
@@ -123,6 +123,7 @@ class Socket(object):
         #dst_plug.GetNode().MakeConnection(self, dst_plug, render)
 
         dst_plug.GetNode().GetParameters()[dst_plug.GetLabel()].binding = ng.GetNodes()[self.GetNode().GetId()]
+        dst_plug.GetNode().MarkDirty()
 
         pt1 = self.GetNode().GetPosition() + self.GetPosition()
         pt2 = dst_plug.GetNode().GetPosition() + dst_plug.GetPosition()
@@ -158,6 +159,7 @@ class Socket(object):
             # Disconnect
             #self.GetNode().MakeDisconnect(wire.srcPlug, wire.dstPlug, render)
             wire.dstPlug.GetNode().GetParameters()[wire.dstPlug.GetLabel()].binding = None
+            wire.dstPlug.GetNode().MarkDirty()
 
             del wire.srcNode  # = self.GetNode()
             del wire.dstNode  # = dstPlug.GetNode()
@@ -0,0 +1,195 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# FILE: thumbnails.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Make the node thumbnails on a background thread
+# ----------------------------------------------------------------------------
+
+from threading import Thread, Condition, Lock
+
+from PIL import Image
+
+from GimelStudio.datatypes import RenderImage
+
+
+def GetThumbnailSource(node, image):
+    """ Returns the image to make the thumbnail of the node from.
+
+    :param node: node object
+    :param image: ``PIL Image`` or ``RenderImage``. The pixels of solid
+    colour images are only created at the size of the thumbnail.
+    :returns: PIL ``Image`` object
+    """
+    if isinstance(image, RenderImage):
+        if image.IsConstant():
+            size = node.Model.GetThumbnailSize(image.GetSize())
+            return Image.new("RGBA", size, image.GetColor())
+        return image.GetImage()
+    return image
+
+
+class ThumbnailThread(Thread):
+    """ Long-lived worker thread which makes the node thumbnails, so that
+    downsampling the output of each node isn't done on the critical path
+    of the render.
+
+    Thumbnail requests are latest-wins: a new image for a node replaces
+    the image waiting for that node, and a thumbnail is only set if no
+    newer image has been requested for the node since. The images are
+    read-only (see ``RenderImage``), except the ones the renderer hands
+    over to the next node, which calls ``Flush`` first.
+    """
+
+    def __init__(self):
+        Thread.__init__(self, name="GimelStudioThumbnailThread", daemon=True)
+        self._condition = Condition()
+        # Node id to (node, image, version) waiting for a thumbnail,
+        # in the order they were requested
+        self._pending = {}
+        self._versions = {}
+        self._busy = None
+        self._callback = None
+        # Starts the thread running
+        self.start()
+
+    def SetCallback(self, callback):
+        """ Set the function called (on the worker thread) once all the
+        requested thumbnails have been made, e.g: to re-draw the nodes.
+
+        :param callback: callable taking no argument or None
+        """
+        self._callback = callback
+
+    def Put(self, node, image, wait=False):
+        """ Request the thumbnail of the node to be made from the image.
+
+        :param node: node object
+        :param image: ``PIL Image`` or ``RenderImage`` to make the thumbnail
+        from, which is only referenced until the thumbnail is made
+        :param wait: if True, the thumbnail is made right away on the
+        calling thread
+        """
+        with self._condition:
+            node_id = node.GetId()
+            version = self._versions.get(node_id, 0) + 1
+            self._versions[node_id] = version
+            if wait == True:
+                self._pending.pop(node_id, None)
+            else:
+                self._pending[node_id] = (node, image, version)
+                self._condition.notify_all()
+        if wait == True:
+            self.Make(node, image, version)
+
+    def Flush(self, node_ids=None):
+        """ Make the thumbnails waiting for the given nodes right away on
+        the calling thread and wait for the worker to finish the one it is
+        making for them, if any. This must be called before an image the
+        thumbnails may be made from is modified in place.
+
+        :param node_ids: ids of the nodes or None for all the nodes
+        """
+        with self._condition:
+            if node_ids is None:
+                items = list(self._pending.values())
+                self._pending.clear()
+                while self._busy is not None:
+                    self._condition.wait()
+            else:
+                items = [
+                    self._pending.pop(node_id) for node_id in node_ids
+                    if node_id in self._pending
+                ]
+                while self._busy is not None and self._busy in node_ids:
+                    self._condition.wait()
+        for item in items:
+            self.Make(*item)
+
+    def Make(self, node, image, version):
+        """ Make the thumbnail of the node and set it, unless a newer
+        thumbnail has been requested for the node in the meantime.
+
+        :param node: node object
+        :param image: ``PIL Image`` or ``RenderImage``
+        :param version: number of the request
+        """
+        try:
+            thumb = node.Model.CreateThumbnail(GetThumbnailSource(node, image))
+            with self._condition:
+                if self._versions.get(node.GetId()) == version:
+                    node.Model.UpdateThumbnail(thumb)
+        except Exception:
+            # Same as a thumbnail which couldn't be made on the
+            # render thread, the previous one is kept
+            pass
+
+    def run(self):
+        """ Run the worker thread """
+        while True:
+            with self._condition:
+                while self._pending == {}:
+                    self._condition.wait()
+                node_id = next(iter(self._pending))
+                node, image, version = self._pending.pop(node_id)
+                self._busy = node_id
+
+            self.Make(node, image, version)
+            # Don't keep the image alive until the next request
+            image = None
+
+            with self._condition:
+                self._busy = None
+                self._condition.notify_all()
+                idle = self._pending == {}
+                callback = self._callback
+            if idle == True and callback is not None:
+                callback()
+
+
+_thread = None
+_threadLock = Lock()
+
+# Whether the node thumbnails are made at all
+_enabled = True
+
+
+def SetThumbnailsEnabled(enabled):
+    """ Turn the node thumbnails on or off for the whole process. Renders
+    without the UI (e.g: from the command line) have no use for them.
+
+    :param enabled: boolean
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def GetThumbnailsEnabled():
+    """ Returns whether the node thumbnails are made. """
+    return _enabled
+
+
+def GetThumbnailThread():
+    """ Returns the thread making the node thumbnails, which is started
+    the first time it is needed.
+
+    :returns: ThumbnailThread object
+    """
+    global _thread
+    with _threadLock:
+        if _thread is None:
+            _thread = ThumbnailThread()
+        return _thread
@@ -1 +1,4 @@
 from .io import GimelStudioProject
+from .graph import (SnapshotNodeGraph, RestoreNodeGraph,
+                    SerializeNodeGraph, DeserializeNodeGraph,
+                    SaveNodeGraph, LoadNodeGraph)
@@ -0,0 +1,155 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: graph.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Save and load the data of node graphs as JSON
+# ----------------------------------------------------------------------------
+
+import json
+
+from GimelStudio import meta
+from GimelStudio.node import NodeData
+from GimelStudio.registry import CreateNode
+
+# Version of the node graph file format
+GRAPH_FORMAT_VERSION = 1
+
+
+def SnapshotNodeGraph(nodes):
+    """ Take a snapshot of the evaluation data of the node graph. The
+    snapshot is pure data, so it can be pickled (e.g: to worker processes)
+    and turned back into nodes with RestoreNodeGraph.
+
+    :param nodes: dictionary of nodes of the Node Graph
+    :returns: list of NodeData objects
+    """
+    return [nodes[node_id].Model.GetData() for node_id in nodes]
+
+
+def RestoreNodeGraph(snapshot, parent=None, positions=None):
+    """ Create the nodes of a node graph from a snapshot. The nodes get
+    new ids, the connections between them are kept.
+
+    :param snapshot: list of NodeData objects
+    :param parent: parent of the node objects (e.g: the Node Graph)
+    :param positions: optional dictionary of node positions, keyed by
+    the node ids of the snapshot
+    :returns: dictionary of the created nodes, keyed by node id
+    :raises: ValueError if the snapshot is not a valid node graph
+    :raises: NodeNotFoundError if a node type is not registered
+    """
+    nodes = {}
+    created = {}
+    for data in snapshot:
+        position = (0, 0)
+        if positions is not None:
+            position = tuple(positions.get(data.GetId(), position))
+        node = CreateNode(parent, data.GetType(), position, None)
+        node.Model.SetData(data)
+        nodes[node.GetId()] = node
+        created[data.GetId()] = node
+
+    for data in snapshot:
+        node = created[data.GetId()]
+        for name, binding_id in data.GetBindings().items():
+            if binding_id is None:
+                continue
+            if name not in node.Parameters or binding_id not in created:
+                raise ValueError("Invalid connection to {} of node {}".format(
+                    name, data.GetType()))
+            node.Parameters[name].binding = created[binding_id]
+
+    return nodes
+
+
+def SerializeNodeGraph(nodes):
+    """ Convert the node graph into a dictionary which can be saved as
+    JSON. Nodes are stored with their type, property values and the ids
+    of the nodes connected to their parameters.
+
+    :param nodes: dictionary of nodes of the Node Graph
+    :returns: dictionary of the node graph data
+    """
+    data = []
+    for node_data in SnapshotNodeGraph(nodes):
+        bindings = node_data.GetBindings()
+        data.append({
+            "id": int(node_data.GetId()),
+            "type": node_data.GetType(),
+            "position": list(nodes[node_data.GetId()].GetPosition()),
+            "muted": node_data.IsMuted(),
+            "properties": node_data.GetProperties(),
+            "parameters": dict(
+                (name, int(bindings[name]) if bindings[name] else None)
+                for name in bindings
+            )
+        })
+
+    return {
+        "format": GRAPH_FORMAT_VERSION,
+        "version": list(meta.APP_VERSION),
+        "nodes": data
+    }
+
+
+def DeserializeNodeGraph(data, parent=None):
+    """ Create the nodes of a node graph from its data. The nodes get
+    new ids, the connections between them are kept.
+
+    :param data: dictionary of the node graph data
+    :param parent: parent of the node objects (e.g: the Node Graph)
+    :returns: dictionary of the created nodes, keyed by node id
+    :raises: ValueError if the data is not a valid node graph
+    :raises: NodeNotFoundError if a node type is not registered
+    """
+    if data.get("format") != GRAPH_FORMAT_VERSION:
+        raise ValueError("Unsupported node graph format: {}".format(
+            data.get("format")))
+
+    snapshot = []
+    positions = {}
+    for node_data in data["nodes"]:
+        snapshot.append(NodeData(
+            node_data["id"],
+            node_data["type"],
+            muted=node_data.get("muted", False),
+            properties=node_data.get("properties", {}),
+            bindings=node_data.get("parameters", {})
+        ))
+        positions[node_data["id"]] = node_data.get("position", (0, 0))
+
+    return RestoreNodeGraph(snapshot, parent, positions)
+
+
+def SaveNodeGraph(nodes, path):
+    """ Save the node graph to a JSON file.
+
+    :param nodes: dictionary of nodes of the Node Graph
+    :param path: file path to save to
+    """
+    with open(path, "w") as graph_file:
+        json.dump(SerializeNodeGraph(nodes), graph_file, indent=2)
+
+
+def LoadNodeGraph(path, parent=None):
+    """ Load a node graph from a JSON file.
+
+    :param path: file path to load from
+    :param parent: parent of the node objects
+    :returns: dictionary of the created nodes, keyed by node id
+    """
+    with open(path, "r") as graph_file:
+        return DeserializeNodeGraph(json.load(graph_file), parent)
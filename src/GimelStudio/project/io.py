@@ -4,7 +4,6 @@ import io
 import pickle
 import os.path
 
-import wx
 from PIL import Image
 import numpy as np
 
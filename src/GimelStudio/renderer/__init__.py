@@ -1,4 +1,11 @@
+from .cache import (NodeCache, SnapshotProperties, CACHE_POLICY_LRU,
+                    CACHE_POLICY_COST)
+from .cancel import CancelToken
 from .eval_info import EvalInfo
 from .output_node import OutputNode
+from .persistent import PersistentCache, OpenPersistentCache
+from .plan import RenderPlan, CompileRenderPlan
+from .pool import BufferPool
 from .renderer import Renderer
-from .thread import RenderThread, EVT_RENDER_RESULT
+from .scheduler import RenderScheduler
+from .spill import SpillCache
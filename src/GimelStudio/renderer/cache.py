@@ -0,0 +1,429 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: cache.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Keep node outputs between renders for incremental re-rendering
+# ----------------------------------------------------------------------------
+
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def FreezeValue(value):
+    """ Convert a property value into an immutable value which can be
+    compared with the value of a later render.
+
+    :param value: property value
+    :returns: immutable copy of the value
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(FreezeValue(item) for item in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((k, FreezeValue(v)) for k, v in value.items()))
+    return value
+
+
+def SnapshotProperties(nodes):
+    """ Take a copy of the property values of the nodes of the node graph.
+    A render reads the property values from the copy, so that its outputs
+    are cached with the values they were rendered with, even if the
+    properties are edited on the main thread during the render.
+
+    :param nodes: dictionary of nodes of the Node Graph
+    :returns: dictionary of node id to a dictionary of the property
+    names and values of the node
+    """
+    snapshot = {}
+    for node_id in nodes:
+        properties = nodes[node_id].Properties
+        snapshot[node_id] = dict(
+            (name, copy.deepcopy(properties[name].GetValue()))
+            for name in properties
+        )
+    return snapshot
+
+
+def FreezeProperties(node, values=None):
+    """ Get the values of the properties of the node its output depends
+    on (see ``Property.GetCacheKey``), as an immutable value.
+
+    :param node: node object
+    :param values: optional dictionary of the property values the node
+    is rendered with (see ``SnapshotProperties``)
+    :returns: tuple of property names and values
+    """
+    if values is None:
+        values = {}
+    return tuple(
+        (name, FreezeValue(
+            node.Properties[name].GetCacheKey(values.get(name))))
+        for name in sorted(node.Properties)
+    )
+
+
+def DigestSignature(signature, digests):
+    """ Get a hash of a node signature which is the same from one session
+    to the next. The signatures of the upstream nodes are nested in it, so
+    it is hashed bottom-up (without recursion, for deep node graphs) and
+    the hashes of the nested signatures are kept in ``digests`` to be
+    re-used for the downstream nodes.
+
+    :param signature: signature of a node
+    :param digests: dictionary of the id of the signatures hashed so far
+    to the signature and its hash
+    :returns: hexadecimal hash or None if the signature holds values which
+    are only unique in this session
+    """
+    stack = [(signature, False)]
+    while stack != []:
+        value, ready = stack.pop()
+        if id(value) in digests:
+            continue
+        if ready == False:
+            stack.append((value, True))
+            stack.extend((item, False) for item in value
+                         if isinstance(item, tuple))
+            continue
+
+        parts = []
+        for item in value:
+            if isinstance(item, tuple):
+                parts.append(digests[id(item)][1])
+            else:
+                parts.append(repr(item))
+        if None in parts or any(" at 0x" in part for part in parts):
+            # The default repr of an object is only unique in this session
+            digest = None
+        else:
+            digest = hashlib.sha256(
+                "({})".format(",".join(parts)).encode("utf-8")).hexdigest()
+        # Keep the signature so that its id is not re-used
+        digests[id(value)] = (value, digest)
+    return digests[id(signature)][1]
+
+
+# Eviction policies of the NodeCache
+CACHE_POLICY_LRU = "lru"
+CACHE_POLICY_COST = "cost"
+
+
+class NodeCache(object):
+    """ Keeps the last output of each node together with the signature
+    it was rendered with, so that only the nodes which changed since the
+    last render (and the nodes downstream of them) are re-evaluated.
+
+    A node signature is made of the node type and version, its property
+    values (see ``Property.GetCacheKey``), its ``NodeCacheKey`` and the
+    signatures of the nodes connected to its parameters.
+    Outputs are kept per render scale, so that switching between proxy
+    and full resolution renders does not throw the other one away.
+
+    The outputs are kept within a memory budget. Once their total size
+    goes over it, outputs are evicted either least recently used first
+    (``CACHE_POLICY_LRU``) or cheapest to recompute per byte first
+    (``CACHE_POLICY_COST``), using the time the node took to evaluate.
+    Evicted outputs are written to the optional SpillCache, from which
+    they are read back if they are needed again. The outputs of expensive
+    nodes are also written to the optional PersistentCache, to be re-used
+    by the next sessions, unless they depend on a node which isn't
+    deterministic.
+
+    With a budget of 0, no output is kept in memory, so the renderer may
+    let nodes modify their inputs in place.
+    """
+
+    def __init__(self, budget=None, policy=CACHE_POLICY_LRU, spill=None,
+                 store=None):
+        self._lock = threading.Lock()
+        self._spill = spill
+        self._store = store
+        self._entries = OrderedDict()
+        self._signatures = {}
+        self._digests = {}
+        self._missed = {}
+        self._properties = {}
+        self._scale = 1.0
+        self._budget = budget
+        self._policy = policy
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def GetBudget(self):
+        return self._budget
+
+    def SetBudget(self, budget):
+        """ Set the maximum total size of the cached outputs, evicting
+        outputs if they no longer fit.
+
+        :param budget: size in bytes or None for no limit
+        """
+        self._budget = budget
+        with self._lock:
+            evicted = self._Evict()
+        self._Spill(evicted)
+
+    def GetSpillCache(self):
+        return self._spill
+
+    def GetPersistentCache(self):
+        return self._store
+
+    def GetPolicy(self):
+        return self._policy
+
+    def SetPolicy(self, policy):
+        """ Set how outputs are chosen for eviction.
+
+        :param policy: CACHE_POLICY_LRU or CACHE_POLICY_COST
+        """
+        if policy not in (CACHE_POLICY_LRU, CACHE_POLICY_COST):
+            raise ValueError("Unknown cache policy: {}".format(policy))
+        self._policy = policy
+
+    def BeginRender(self, scale=1.0, properties=None):
+        """ Reset the render-scoped signature table. Call this before
+        every render, as the node graph may have changed since.
+
+        :param scale: render scale of the render about to start
+        :param properties: optional snapshot of the property values the
+        nodes are rendered with (see ``SnapshotProperties``)
+        """
+        self._signatures = {}
+        self._digests = {}
+        self._missed = {}
+        self._properties = properties or {}
+        self._scale = scale
+
+    def Signature(self, node):
+        """ Get the signature of the given node for the current render.
+
+        :param node: node object
+        :returns: tuple signature of the node
+        """
+        node_id = node.GetId()
+        if node_id in self._signatures:
+            return self._signatures[node_id]
+
+        props = FreezeProperties(node, self._properties.get(node_id))
+
+        inputs = []
+        for name in sorted(node.Parameters):
+            binding = node.Parameters[name].binding
+            if binding and binding.IsMuted() != True:
+                inputs.append((name, self.Signature(binding)))
+            else:
+                inputs.append((name, None))
+
+        signature = (node.GetType(), node.Model.GetVersion(), props,
+                     FreezeValue(node.NodeCacheKey()), tuple(inputs))
+        self._signatures[node_id] = signature
+        if node.NodeIsDeterministic() != True:
+            # The output (e.g: random noise) and the outputs downstream
+            # of it are only re-used within the session, so the node gets
+            # no digest for the PersistentCache (see DigestSignature).
+            self._digests[id(signature)] = (signature, None)
+        return signature
+
+    def Get(self, node, signature):
+        """ Get the cached output of the node, if it is still valid.
+
+        :param node: node object
+        :param signature: signature of the node for the current render
+        :returns: cached RenderImage object or None
+        """
+        key = (node.GetId(), self._scale)
+        with self._lock:
+            if self._missed.get(key) is signature:
+                # Already looked up during this render
+                return None
+            entry = self._entries.get(key)
+            if node.Model.IsDirty() != True and entry is not None \
+                    and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+
+        # Look for the output on disk, from an earlier render or, as
+        # the nodes of a project which has just been opened are all
+        # dirty, from an earlier session.
+        spilled = None
+        if self._spill is not None and node.Model.IsDirty() != True:
+            spilled = self._spill.Load(key, signature)
+        if spilled is None and self._store is not None:
+            digest = DigestSignature(signature, self._digests)
+            if digest is not None:
+                spilled = self._store.Load(digest, self._scale)
+        if spilled is not None:
+            image, cost = spilled
+            with self._lock:
+                self._hits += 1
+                evicted = self._Insert(key, signature, image, cost)
+            self._Spill(evicted)
+            node.Model.SetDirty(False)
+            return image
+
+        with self._lock:
+            self._misses += 1
+            self._missed[key] = signature
+        return None
+
+    def Set(self, node, signature, image, cost=0.0):
+        """ Store the output of the node and mark it as clean. Outputs
+        larger than the whole budget are only written to the SpillCache.
+
+        :param node: node object
+        :param signature: signature the node was rendered with
+        :param image: RenderImage object output by the node
+        :param cost: time in seconds it took to evaluate the node
+        """
+        key = (node.GetId(), self._scale)
+        dirty = node.Model.IsDirty()
+        with self._lock:
+            self._missed.pop(key, None)
+            if dirty == True:
+                # Outputs at other scales are out of date as well
+                for other in list(self._entries):
+                    if other[0] == node.GetId():
+                        self._Remove(other)
+            evicted = self._Insert(key, signature, image, cost)
+        if self._spill is not None:
+            self._spill.Discard(node.GetId(),
+                                None if dirty == True else signature)
+        if self._store is not None:
+            digest = DigestSignature(signature, self._digests)
+            if digest is not None:
+                self._store.Store(digest, self._scale, image, cost)
+        self._Spill(evicted)
+        node.Model.SetDirty(False)
+
+    def _Insert(self, key, signature, image, cost):
+        """ Store the entry and evict outputs to make room for it. The
+        lock must be held.
+
+        :returns: list of the evicted keys and entries
+        """
+        if key in self._entries:
+            self._Remove(key)
+        nbytes = image.GetByteSize() if image is not None else 0
+        entry = (signature, image, nbytes, cost)
+        if self._budget is not None and nbytes > self._budget:
+            return [(key, entry)]
+        self._entries[key] = entry
+        self._bytes += nbytes
+        return self._Evict(key)
+
+    def _Remove(self, key):
+        """ Drop the given entry. The lock must be held.
+
+        :returns: the dropped entry
+        """
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+        return entry
+
+    def _Spill(self, evicted):
+        """ Write the evicted outputs to the SpillCache, if any. This is
+        done without holding the lock, so that other nodes can use the
+        cache in the meantime.
+
+        :param evicted: list of the evicted keys and entries
+        """
+        if self._spill is None:
+            return
+        for key, entry in evicted:
+            if entry[1] is not None:
+                self._spill.Store(key, entry[0], entry[1], entry[3])
+
+    def _Evict(self, keep=None):
+        """ Evict outputs until they fit in the budget. The lock must be
+        held.
+
+        :param keep: key of the entry which has just been stored
+        :returns: list of the evicted keys and entries
+        """
+        evicted = []
+        while self._budget is not None and self._bytes > self._budget:
+            keys = [key for key in self._entries if key != keep]
+            if keys == []:
+                break
+            if self._policy == CACHE_POLICY_COST:
+                # Ties are broken least recently used first
+                victim = min(keys, key=lambda key: (
+                    self._entries[key][3] / max(self._entries[key][2], 1)
+                ))
+            else:
+                victim = keys[0]
+            evicted.append((victim, self._Remove(victim)))
+            self._evictions += 1
+        return evicted
+
+    def Prune(self, nodes):
+        """ Drop the cached outputs of nodes which are no longer
+        in the node graph.
+
+        :param nodes: dictionary of nodes of the Node Graph
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] not in nodes:
+                    self._Remove(key)
+        if self._spill is not None:
+            self._spill.Prune(nodes)
+
+    def Clear(self):
+        """ Drop all the cached node outputs. """
+        with self._lock:
+            self._entries = OrderedDict()
+            self._signatures = {}
+            self._digests = {}
+            self._missed = {}
+            self._bytes = 0
+        if self._spill is not None:
+            self._spill.Clear()
+
+    def GetStats(self):
+        """ Returns the statistics of the cache.
+
+        :returns: dictionary with the number of ``hits``, ``misses`` and
+        ``evictions``, the number of cached outputs (``entries``) and
+        their total size in bytes (``bytes``)
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def FormatStats(self):
+        """ Returns the statistics of the cache as a line of text for
+        the developer log.
+        """
+        stats = self.GetStats()
+        budget = "unlimited"
+        if self._budget is not None:
+            budget = "{} MB".format(round(self._budget / 2**20, 1))
+        return ("Node cache: {} hits, {} misses, {} evictions, {} outputs, "
+                "{} MB of {}").format(
+                    stats["hits"], stats["misses"], stats["evictions"],
+                    stats["entries"], round(stats["bytes"] / 2**20, 1),
+                    budget)
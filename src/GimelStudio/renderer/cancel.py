@@ -0,0 +1,54 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: cancel.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Define the token used to cancel a render which is in progress
+# ----------------------------------------------------------------------------
+
+import threading
+
+from GimelStudio.utils.exceptions import RenderCancelledError
+
+
+class CancelToken(object):
+    """ Token shared by everything taking part in a render, which is
+    checked before each node is evaluated and between tiles. Cancelling
+    it makes the render stop at the next check by raising a
+    RenderCancelledError, so a render made obsolete by a newer edit is
+    abandoned within one node's worth of work.
+
+    :param event: optional threading.Event to use as the cancelled flag
+    """
+
+    def __init__(self, event=None):
+        if event is None:
+            event = threading.Event()
+        self._event = event
+
+    def Cancel(self):
+        """ Request the render to stop. """
+        self._event.set()
+
+    def IsCancelled(self):
+        return self._event.is_set()
+
+    def Check(self):
+        """ Stop the render if it has been cancelled.
+
+        :raises: RenderCancelledError if the token has been cancelled
+        """
+        if self._event.is_set():
+            raise RenderCancelledError()
@@ -23,17 +23,80 @@
 # Copyright 2016 nfactorial
 # ----------------------------------------------------------------------------
 
+import copy
+import time
+
+import numpy
+
+
+def ScaleValue(value, scale):
+    """
+    Scales a size in pixels (or a list of them) by the render scale.
+    Positive integers are never scaled down to 0.
+    """
+    if isinstance(value, (list, tuple)):
+        return type(value)(ScaleValue(item, scale) for item in value)
+    elif isinstance(value, int):
+        return max(int(round(value * scale)), min(value, 1))
+    return value * scale
+
 
 class EvalInfo(object):
     """
     Evaluate node properties and parameters
     """
 
-    def __init__(self, node):
+    def __init__(self, node, results=None, cache=None, scale=1.0,
+                 cancel=None, pool=None, properties=None):
         if node == None:
             raise TypeError
         self.node = node
 
+        # Render-scoped table of node results, keyed by node id. This
+        # is shared by every EvalInfo of a render so that a node feeding
+        # several consumers is only evaluated once.
+        self.results = results
+
+        # Renderer-owned NodeCache which keeps node outputs between
+        # renders so that unchanged nodes are not re-evaluated.
+        self.cache = cache
+
+        # Scale of the render relative to the full resolution (e.g: 0.25
+        # for a quarter resolution proxy render).
+        self.scale = scale
+
+        # CancelToken of the render, checked before each node is
+        # evaluated so that an obsolete render stops early.
+        self.cancel = cancel
+
+        # Renderer-owned BufferPool which the nodes get their output and
+        # scratch arrays from, so that re-renders re-use them.
+        self.pool = pool
+
+        # Render-scoped snapshot of the property values of the nodes,
+        # so that properties edited during the render don't change the
+        # output of a node after its signature has been taken.
+        self.properties = properties
+
+        # Render-scoped dictionaries of the ids of the duplicate nodes
+        # merged by the render plan to the node evaluated in their place
+        # and of the id of that node to the list of its duplicates.
+        self.aliases = None
+        self.duplicates = None
+
+        # Render-scoped dictionary of the id of the last node of each
+        # chain of point nodes fused by the render plan to the chain.
+        self.chains = None
+
+    def ForNode(self, node):
+        """
+        Returns an EvalInfo for the given node which shares the
+        render state of this one.
+        """
+        info = copy.copy(self)
+        info.node = node
+        return info
+
     def EvaluateParameter(self, name):
         """
         Evaluates the value of a parameter.
@@ -43,13 +106,137 @@ class EvalInfo(object):
             # Make sure the next node is not disabled
             if p.binding.IsMuted() != True:
                 # Evaluate the next node
-                info = EvalInfo(p.binding)
-                return p.binding.EvaluateNode(info)
+                return self.EvaluateBinding(p.binding)
         return p.value
 
+    def EvaluateBinding(self, node):
+        """
+        Evaluates the given (bound) node, re-using its result if it
+        has already been evaluated during this render.
+        """
+        self.CheckCancelled()
+        if self.results is None:
+            return node.EvaluateNode(EvalInfo(node, scale=self.scale,
+                                              cancel=self.cancel,
+                                              pool=self.pool,
+                                              properties=self.properties))
+
+        if self.aliases is not None:
+            node = self.aliases.get(node.GetId(), node)
+
+        node_id = node.GetId()
+        if node_id not in self.results:
+            self.results[node_id] = self._EvaluateNode(node)
+        return self.results[node_id]
+
+    def GetChain(self, node):
+        """
+        Returns the PointChain evaluated in place of the given node
+        or None.
+        """
+        if self.chains is None:
+            return None
+        return self.chains.get(node.GetId())
+
+    def EvaluateNode(self):
+        """
+        Evaluates the node of this EvalInfo, along with the point
+        nodes fused into it.
+        """
+        chain = self.GetChain(self.node)
+        if chain is not None:
+            return chain.Evaluate(self)
+        return self.node.EvaluateNode(self)
+
+    def GetInputRegion(self, region):
+        """
+        Returns the region of the input images the node needs to
+        render the given region of its output or None.
+        """
+        chain = self.GetChain(self.node)
+        if chain is not None:
+            return chain.GetInputRegion(self, region)
+        return self.node.NodeInputRegion(self, region)
+
+    def GetOutputRegion(self, region):
+        """
+        Returns the region of the output image the node renders
+        from the given region of its input images.
+        """
+        chain = self.GetChain(self.node)
+        if chain is not None:
+            return chain.GetOutputRegion(self, region)
+        return self.node.NodeOutputRegion(self, region)
+
+    def GetDuplicates(self, node):
+        """
+        Returns the duplicate nodes merged into the given node, which
+        get its result.
+        """
+        if self.duplicates is None:
+            return []
+        return self.duplicates.get(node.GetId(), [])
+
+    def _EvaluateNode(self, node):
+        """
+        Evaluates the given node, unless its output from a previous
+        render is still valid.
+        """
+        info = self.ForNode(node)
+        if self.cache is None:
+            image = info.EvaluateNode()
+        else:
+            signature = self.cache.Signature(node)
+            image = self.cache.Get(node, signature)
+            if image is not None:
+                return image
+            start_time = time.perf_counter()
+            image = info.EvaluateNode()
+            self.cache.Set(node, signature, image,
+                           time.perf_counter() - start_time)
+
+        # The duplicates of the node show the same thumbnail
+        for duplicate in self.GetDuplicates(node):
+            duplicate.NodeSetThumb(image)
+        return image
+
     def EvaluateProperty(self, name):
         """
-        Evaluates the value of a property.
+        Evaluates the value of a property. Sizes in pixels are
+        scaled by the render scale.
         """
         p = self.node.Properties[name]
-        return p.value
+        value = p.value
+        if self.properties is not None \
+                and self.node.GetId() in self.properties:
+            value = self.properties[self.node.GetId()][name]
+        if p.GetIsScalable() == True and self.scale != 1.0:
+            return ScaleValue(value, self.scale)
+        return value
+
+    def GetRenderScale(self):
+        """
+        Returns the scale of the render relative to the full
+        resolution. Input nodes should scale their images by it.
+        """
+        return self.scale
+
+    def NewArray(self, shape, dtype=numpy.uint8):
+        """
+        Returns an uninitialized NumPy array for an output or scratch
+        buffer of the node (e.g: the ``dst`` of an OpenCV function). It
+        is taken from the buffer pool of the renderer, if there is one,
+        and goes back to it once it is no longer used.
+        """
+        if self.pool is None:
+            return numpy.empty(shape, dtype)
+        return self.pool.Acquire(shape, dtype)
+
+    def CheckCancelled(self):
+        """
+        Stops the render by raising a RenderCancelledError if it
+        has been cancelled. Nodes with long running loops may call
+        this between iterations.
+        """
+        if self.cancel is not None:
+            self.cancel.Check()
@@ -0,0 +1,520 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# FILE: fusion.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Apply chains of point and geometric nodes in one pass
+# ----------------------------------------------------------------------------
+
+import threading
+
+from PIL import Image
+import numpy
+
+from GimelStudio.datatypes import RenderImage
+from GimelStudio.node import NodeBase
+from GimelStudio.node.thumbnails import GetThumbnailThread
+
+
+# Number of rows of the image transformed at a time by a colour matrix,
+# so that the floating point copy of the pixels stays small
+MATRIX_ROWS = 64
+
+# Fixed point (16 bit) weights of the R, G and B values of
+# a pixel in its grey level, see Image.convert('L')
+LUMA = numpy.array([19595, 38470, 7471], numpy.int32)
+
+
+def IsPointNode(node):
+    """ Returns whether the node describes its effect as a transform of
+    each pixel (see ``NodeBase.NodePointTransform``).
+
+    :param node: node object
+    :returns: boolean
+    """
+    return type(node).NodePointTransform is not NodeBase.NodePointTransform
+
+
+def IsGeometricNode(node):
+    """ Returns whether the node describes its effect as a transform of
+    the coordinates of the pixels (see ``NodeBase.NodeGeometricTransform``).
+
+    :param node: node object
+    :returns: boolean
+    """
+    return (type(node).NodeGeometricTransform
+            is not NodeBase.NodeGeometricTransform)
+
+
+def IsRGBA(image):
+    """ Returns whether the image is an RGBA image, without converting it.
+
+    :param image: RenderImage object
+    :returns: boolean
+    """
+    if image.IsConstant():
+        # Solid colour images are RGBA, even without pixels
+        return True
+    if image.HasArray():
+        array = image.GetArray()
+        return (array.dtype == numpy.uint8 and array.ndim == 3
+                and array.shape[2] == 4)
+    return image.GetImage().mode == "RGBA"
+
+
+def ComposeTransforms(transforms):
+    """ Compose the consecutive transforms of the list which can be
+    described as a single transform (i.e: lookup tables).
+
+    :param transforms: list of PointTransform objects, in order
+    :returns: list of PointTransform objects
+    """
+    composed = []
+    for transform in transforms:
+        if composed != []:
+            combined = composed[-1].Then(transform)
+            if combined is not None:
+                composed[-1] = combined
+                continue
+        composed.append(transform)
+    return composed
+
+
+def TransformArray(array, matrix, offset, out):
+    """ Apply a colour matrix (see ``PointTransform.SetAsMatrix``) to the
+    pixels of an RGBA array, a few rows at a time.
+
+    :param array: uint8 NumPy array with a (height, width, 4) shape
+    :param matrix: float32 NumPy array with a (4, 5) shape
+    :param offset: float32 NumPy array with a (4,) shape
+    :param out: uint8 NumPy array of the same shape to write to
+    """
+    weights = matrix[:, :4].T
+    grey = matrix[:, 4]
+    for top in range(0, array.shape[0], MATRIX_ROWS):
+        rows = array[top:top + MATRIX_ROWS]
+        values = numpy.matmul(rows.astype(numpy.float32), weights)
+        if grey.any():
+            # The same fixed point grey level as Image.convert('L')
+            luma = numpy.matmul(rows[..., :3].astype(numpy.int32), LUMA)
+            luma += 0x8000
+            luma >>= 16
+            values += luma.astype(numpy.float32)[..., numpy.newaxis] * grey
+        values += offset
+        numpy.clip(values, 0, 255, out=values)
+        out[top:top + MATRIX_ROWS] = values
+
+
+def ApplyTransforms(image, transforms, new_array=numpy.empty):
+    """ Apply the transforms to an RGBA image. Consecutive lookup tables
+    are composed into one, which is applied with ``Image.point``.
+
+    :param image: RGBA RenderImage object
+    :param transforms: list of PointTransform objects, in order
+    :param new_array: callable returning an array for the given shape,
+    such as ``EvalInfo.NewArray``
+    :returns: new RenderImage object
+    """
+    output = image
+    for transform in ComposeTransforms(transforms):
+        result = RenderImage()
+        if transform.IsTable():
+            table = transform.GetTable().ravel().tolist()
+            result.SetAsImage(output.GetImage().point(table), owned=True)
+        else:
+            array = output.GetArray()
+            out = new_array(array.shape, numpy.uint8)
+            TransformArray(array, *transform.GetMatrix(), out)
+            result.SetAsArray(out, owned=True)
+        result.SetOrigin(image.GetOrigin())
+        output = result
+    return output
+
+
+def GetImageRegion(image):
+    """ Returns the region of the whole image covered by the image. """
+    origin = image.GetOrigin()
+    size = image.GetSize()
+    return (origin[0], origin[1], origin[0] + size[0], origin[1] + size[1])
+
+
+def AffineSlices(matrix, size, shape):
+    """ Work out the slices of an array giving the output of an affine
+    transform (see ``GeometricTransform``) when it maps whole pixels to
+    whole pixels without scaling them (i.e: a crop, flip or quarter turn).
+
+    :param matrix: tuple (a, b, c, d, e, f) from the pixels of the output
+    to the pixels of the array
+    :param size: size (width, height) of the output
+    :param shape: shape of the array
+    :returns: tuple of whether to swap the rows and columns of the array
+    and the slices of its rows and columns or None
+    """
+    a, b, c, d, e, f = matrix
+    if b == 0 and d == 0 and abs(a) == 1 and abs(e) == 1:
+        swap = False
+        axes = ((e, f, size[1], shape[0]), (a, c, size[0], shape[1]))
+    elif a == 0 and e == 0 and abs(b) == 1 and abs(d) == 1:
+        # The rows of the output are columns of the array
+        swap = True
+        axes = ((b, c, size[1], shape[1]), (d, f, size[0], shape[0]))
+    else:
+        return None
+
+    slices = []
+    for scale, offset, count, length in axes:
+        if offset != int(offset):
+            return None
+        offset = int(offset)
+        if count == 0:
+            slices.append(slice(0, 0))
+        elif scale == 1:
+            # Output pixel i is pixel offset + i of the array
+            if offset < 0 or offset + count > length:
+                return None
+            slices.append(slice(offset, offset + count))
+        else:
+            # Output pixel i is pixel offset - 1 - i of the array
+            if offset - count < 0 or offset > length:
+                return None
+            stop = offset - count - 1
+            slices.append(slice(offset - 1, stop if stop >= 0 else None, -1))
+    return (swap, slices[0], slices[1])
+
+
+def ApplyGeometricTransform(image, transform):
+    """ Apply the transform to an RGBA image. Crops, flips and quarter
+    turns give a view of the array of the image, without copying it (or
+    a solid colour image of the new size for a solid colour image), and
+    other transforms resample the image with ``Image.transform``.
+
+    :param image: RGBA RenderImage object
+    :param transform: GeometricTransform object
+    :returns: new RenderImage object
+    """
+    origin = image.GetOrigin()
+    region = transform.GetRegion()
+    size = (max(region[2] - region[0], 0), max(region[3] - region[1], 0))
+    a, b, c, d, e, f = transform.GetMatrix()
+    # From the pixels of the output to the pixels of the input image
+    matrix = (a, b, a * region[0] + b * region[1] + c - origin[0],
+              d, e, d * region[0] + e * region[1] + f - origin[1])
+
+    output = RenderImage()
+    width, height = image.GetSize()
+    slices = AffineSlices(matrix, size, (height, width))
+    if size[0] == 0 or size[1] == 0:
+        output.SetAsArray(numpy.zeros((size[1], size[0], 4), numpy.uint8))
+    elif slices is not None and image.IsConstant():
+        output.SetAsConstant(size, image.GetColor())
+    elif slices is not None:
+        array = image.GetArray()
+        if slices[0] == True:
+            array = array.swapaxes(0, 1)
+        output.SetAsArray(array[slices[1], slices[2]])
+    else:
+        output.SetAsImage(image.GetImage().transform(
+            size, Image.AFFINE, matrix, transform.GetResample()
+        ), owned=True)
+    output.SetOrigin(region[:2])
+    return output
+
+
+def GetInputBinding(node):
+    """ Returns the node bound to the image parameter of a point node. """
+    for name in node.Parameters:
+        binding = node.Parameters[name].binding
+        if binding and binding.IsMuted() != True:
+            return binding
+    return None
+
+
+class NodeChain(object):
+    """ A chain of nodes which is evaluated as one step of the render
+    plan, in place of its last node (see ``PointChain`` and
+    ``GeometricChain``). Each node of the chain has a single input, fed
+    by the node before it.
+    """
+
+    def __init__(self, nodes):
+        self._nodes = nodes
+        self._transforms = None
+
+    def GetNodes(self):
+        """ Returns the nodes of the chain, in order. """
+        return self._nodes
+
+    def GetInputRegion(self, eval_info, region):
+        """ Returns the region of the input image the chain needs to render
+        the given region of its output or None if it needs the whole image
+        (see ``NodeBase.NodeInputRegion``).
+        """
+        for node in reversed(self._nodes):
+            region = node.NodeInputRegion(eval_info.ForNode(node), region)
+            if region is None:
+                return None
+        return region
+
+    def GetOutputRegion(self, eval_info, region):
+        """ Returns the region of the output image rendered from the given
+        region of the input image (see ``NodeBase.NodeOutputRegion``).
+        """
+        for node in self._nodes:
+            region = node.NodeOutputRegion(eval_info.ForNode(node), region)
+        return region
+
+    def EvaluateAlone(self, eval_info, binding, image):
+        """ Evaluate a node of the chain on its own.
+
+        :param eval_info: EvalInfo object of the node
+        :param binding: node bound to the image parameter of the node
+        :param image: RenderImage object output by that node
+        :returns: RenderImage object
+        """
+        eval_info.results = {binding.GetId(): image}
+        eval_info.cache = None
+        eval_info.aliases = None
+        eval_info.chains = None
+        return eval_info.node.EvaluateNode(eval_info)
+
+    def GetInputThumb(self, eval_info):
+        """ Returns the thumbnail of the node feeding the chain. """
+        source = GetInputBinding(self._nodes[0])
+        if eval_info.aliases is not None:
+            source = eval_info.aliases.get(source.GetId(), source)
+        GetThumbnailThread().Flush([source.GetId()])
+        return source.Model.GetThumbImage()
+
+
+class PointChain(NodeChain):
+    """ A chain of point nodes (e.g: Brightness -> Contrast -> Invert).
+    The transforms of the nodes are composed and applied to the input
+    image of the first node at once, instead of each node walking over
+    (and making a copy of) the whole image.
+
+    Nodes which can't describe their transform (e.g: as the input image
+    isn't RGBA) are evaluated as usual within the chain. A solid colour
+    input image gives a solid colour output, worked out from the colour
+    alone.
+    """
+
+    def Evaluate(self, eval_info):
+        """ Evaluate the chain and return the output of its last node.
+
+        :param eval_info: EvalInfo object of the last node of the chain
+        :returns: RenderImage object
+        """
+        head = self._nodes[0]
+        binding = GetInputBinding(head)
+        source = eval_info.ForNode(head).EvaluateBinding(binding)
+        if source.IsConstant():
+            image = self.EvaluateConstant(eval_info, source)
+            if image is not None:
+                return image
+
+        image = source
+        pending = []
+        transforms = []
+        for node in self._nodes:
+            eval_info.CheckCancelled()
+            info = eval_info.ForNode(node)
+            transform = None
+            if IsRGBA(image):
+                if pending == []:
+                    transform = node.NodePointTransform(info, image)
+                else:
+                    transform = node.NodePointTransform(info, None)
+                    if transform is None:
+                        image = ApplyTransforms(image, pending, info.NewArray)
+                        pending = []
+                        transform = node.NodePointTransform(info, image)
+
+            if transform is None:
+                if pending != []:
+                    image = ApplyTransforms(image, pending, info.NewArray)
+                    pending = []
+                if image is not source:
+                    GetThumbnailThread().Flush([binding.GetId()])
+                    image.HandOver()
+                image = self.EvaluateAlone(info, binding, image)
+            else:
+                pending.append(transform)
+            transforms.append(transform)
+            binding = node
+
+        if pending != []:
+            image = ApplyTransforms(image, pending, eval_info.NewArray)
+            self._nodes[-1].NodeSetThumb(image.GetImage())
+        self._transforms = transforms
+        return image
+
+    def EvaluateConstant(self, eval_info, source):
+        """ Evaluate the chain on a solid colour image, by applying the
+        transforms of the nodes to a single pixel of that colour.
+
+        :param eval_info: EvalInfo object of the last node of the chain
+        :param source: constant RenderImage object fed to the chain
+        :returns: constant RenderImage object or None if a node can't
+        describe its transform
+        """
+        pixel = RenderImage()
+        pixel.SetAsConstant((1, 1), source.GetColor())
+        image = source
+        transforms = []
+        for node in self._nodes:
+            transform = node.NodePointTransform(eval_info.ForNode(node), image)
+            if transform is None:
+                return None
+            pixel = ApplyTransforms(pixel, [transform])
+            image = RenderImage()
+            image.SetAsConstant(source.GetSize(),
+                                tuple(int(v) for v in pixel.GetArray()[0, 0]))
+            image.SetOrigin(source.GetOrigin())
+            transforms.append(transform)
+
+        self._nodes[-1].NodeSetThumb(image)
+        self._transforms = transforms
+        return image
+
+    def SetThumbs(self, eval_info):
+        """ Set the thumbnails of the nodes of the chain before its last
+        node, once the whole render is done. They are made from the
+        thumbnail of the input image with the transforms of the last
+        evaluation of the chain, or by evaluating the nodes which were
+        evaluated on their own on it.
+
+        :param eval_info: EvalInfo object holding the render state
+        """
+        if self._transforms is None:
+            return
+
+        binding = GetInputBinding(self._nodes[0])
+        thumb = RenderImage()
+        thumb.SetAsImage(self.GetInputThumb(eval_info))
+        for node, transform in zip(self._nodes[:-1], self._transforms[:-1]):
+            if transform is not None and IsRGBA(thumb):
+                thumb = ApplyTransforms(thumb, [transform])
+                node.NodeSetThumb(thumb.GetImage())
+            else:
+                thumb = self.EvaluateAlone(eval_info.ForNode(node), binding,
+                                           thumb)
+            binding = node
+
+
+class GeometricChain(NodeChain):
+    """ A chain of geometric nodes (e.g: Crop -> Flip). The transforms of
+    the nodes are composed and the input image of the first node is
+    resampled once, or only viewed differently when the nodes just crop
+    and flip it. Single geometric nodes are evaluated as a chain as well,
+    for the view.
+
+    If a node can't describe its transform (e.g: a circle crop), the
+    nodes of the chain are evaluated as usual.
+    """
+
+    def __init__(self, nodes):
+        NodeChain.__init__(self, nodes)
+        self._region = None
+        self._lock = threading.Lock()
+
+    def GetTransforms(self, eval_info, region):
+        """ Returns the transforms from the input image of the chain to
+        the output of each of its nodes or None if a node can't describe
+        its transform.
+
+        :param eval_info: EvalInfo object holding the render state
+        :param region: region of the whole input image covered by the
+        input image
+        :returns: list of GeometricTransform objects or None
+        """
+        transforms = []
+        for node in self._nodes:
+            transform = node.NodeGeometricTransform(eval_info.ForNode(node),
+                                                    region)
+            if transform is None:
+                return None
+            if transforms != []:
+                transform = transforms[-1].Then(transform)
+            transforms.append(transform)
+            region = transform.GetRegion()
+        return transforms
+
+    def Evaluate(self, eval_info):
+        """ Evaluate the chain and return the output of its last node.
+
+        :param eval_info: EvalInfo object of the last node of the chain
+        :returns: RenderImage object
+        """
+        binding = GetInputBinding(self._nodes[0])
+        source = eval_info.ForNode(self._nodes[0]).EvaluateBinding(binding)
+
+        transforms = None
+        if IsRGBA(source):
+            transforms = self.GetTransforms(eval_info, GetImageRegion(source))
+        if transforms is None:
+            image = source
+            for node in self._nodes:
+                eval_info.CheckCancelled()
+                image = self.EvaluateAlone(eval_info.ForNode(node), binding,
+                                           image)
+                binding = node
+            return image
+
+        image = ApplyGeometricTransform(source, transforms[-1])
+        self._nodes[-1].NodeSetThumb(image)
+        with self._lock:
+            self._region = GetImageRegion(source)
+            self._transforms = transforms
+        return image
+
+    def SetThumbs(self, eval_info):
+        """ Set the thumbnails of the nodes of the chain before its last
+        node, once the whole render is done. They are resampled from the
+        thumbnail of the input image with the transforms of the last
+        evaluation of the chain, at the size they would have if the
+        nodes had been evaluated.
+
+        :param eval_info: EvalInfo object holding the render state
+        """
+        if self._transforms is None:
+            return
+
+        thumb = self.GetInputThumb(eval_info)
+        left, top, right, bottom = self._region
+        if right <= left or bottom <= top:
+            return
+        scale_x = thumb.size[0] / (right - left)
+        scale_y = thumb.size[1] / (bottom - top)
+        for node, transform in zip(self._nodes[:-1], self._transforms[:-1]):
+            a, b, c, d, e, f = transform.GetMatrix()
+            region = transform.GetRegion()
+            width = region[2] - region[0]
+            height = region[3] - region[1]
+            if width <= 0 or height <= 0:
+                continue
+            size = node.Model.GetThumbnailSize((width, height))
+            step_x = width / size[0]
+            step_y = height / size[1]
+            # From the pixels of the output thumbnail to the pixels
+            # of the input thumbnail
+            matrix = (
+                scale_x * a * step_x, scale_x * b * step_y,
+                scale_x * (a * region[0] + b * region[1] + c - left),
+                scale_y * d * step_x, scale_y * e * step_y,
+                scale_y * (d * region[0] + e * region[1] + f - top)
+            )
+            node.NodeSetThumb(thumb.transform(size, Image.AFFINE, matrix,
+                                              Image.BILINEAR))
@@ -23,14 +23,21 @@
 # Copyright 2016 nfactorial
 # ----------------------------------------------------------------------------
 
+from GimelStudio.node.thumbnails import GetThumbnailsEnabled
 from .eval_info import EvalInfo
+from .plan import (CompileRenderPlan, MergeDuplicates, FusePointNodes,
+                   FuseGeometricNodes)
 
 
 class OutputNode(object):
     """ Represents the evaluation of the composite output node. """
 
-    def __init__(self):
+    def __init__(self, merge=True, fuse=True, fuse_geometry=True):
         self.node = None
+        self.merge = merge
+        self.fuse = fuse
+        self.fuse_geometry = fuse_geometry
+        self.plan = None
 
     def SetNode(self, node):
         """ Set the node object connected to the output node
@@ -40,11 +47,63 @@ class OutputNode(object):
         """
         self.node = node.Parameters["Image"].binding
 
-    def RenderImage(self):
+    def Compile(self, properties=None):
+        """ Compile the render plan for the node connected to the
+        output node.
+
+        :param properties: optional snapshot of the property values the
+        nodes are rendered with (see ``SnapshotProperties``)
+        :returns: RenderPlan object or None if not connected
+        """
+        if self.node != None:
+            plan = CompileRenderPlan(self.node)
+            if self.merge == True:
+                plan = MergeDuplicates(plan, properties)
+            if self.fuse == True:
+                plan = FusePointNodes(plan)
+            if self.fuse_geometry == True:
+                plan = FuseGeometricNodes(plan)
+            return plan
+        return None
+
+    def GetPlan(self):
+        """ Returns the render plan of the last render or None. """
+        return self.plan
+
+    def RenderImage(self, results=None, cache=None, scheduler=None,
+                    progress=None, region=None, scale=1.0, cancel=None,
+                    pool=None, properties=None):
         """ Render the image for this output node. If the output
         node is not connected then the default image will be rendered.
+
+        :param results: render-scoped dictionary of node results, keyed
+        by node id, which is shared by all the nodes evaluated
+        :param cache: NodeCache object holding the node outputs of
+        previous renders
+        :param scheduler: RenderScheduler object used to evaluate
+        independent branches of the graph in parallel
+        :param progress: optional callable reporting the number of
+        evaluated nodes and the total number of nodes to evaluate
+        :param region: region (left, top, right, bottom) of the image
+        to render or None to render the whole image
+        :param scale: scale of the render relative to the full resolution
+        :param cancel: optional CancelToken to stop the render early
+        :param pool: optional BufferPool the nodes get their arrays from
+        :param properties: optional snapshot of the property values the
+        nodes are rendered with (see ``SnapshotProperties``)
+        :raises: RenderCancelledError if the render has been cancelled
         """
         if self.node != None:
-            eval_info = EvalInfo(self.node)
-            image = eval_info.node.EvaluateNode(eval_info)
-            return image
+            eval_info = EvalInfo(self.node, results, cache, scale, cancel,
+                                 pool, properties)
+            if scheduler is not None:
+                self.plan = self.Compile(properties)
+                eval_info.aliases = self.plan.GetAliases()
+                eval_info.duplicates = self.plan.GetDuplicates()
+                eval_info.chains = self.plan.GetChains()
+                image = scheduler.Run(eval_info, self.plan, progress, region)
+                if GetThumbnailsEnabled() == True:
+                    for chain in self.plan.GetChains().values():
+                        chain.SetThumbs(eval_info)
+                return image
+            return eval_info.EvaluateBinding(self.node)
@@ -0,0 +1,323 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: persistent.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Keep the outputs of expensive nodes on disk between sessions
+# ----------------------------------------------------------------------------
+
+import os
+import json
+import glob
+import hashlib
+import threading
+
+import numpy
+
+from GimelStudio import meta
+from GimelStudio.datatypes import RenderImage
+from .spill import SampleChecksum
+
+
+# Version of the file layout, part of every key so that files written
+# by an incompatible version of the renderer are never read.
+CACHE_FORMAT = 2
+
+
+def OpenPersistentCache(directory=None):
+    """ Create a PersistentCache with the size limit and minimum cost
+    of the settings.
+
+    :param directory: directory of the cache, defaults to
+    ``meta.PERSISTENT_CACHE_DIRECTORY``
+    :returns: PersistentCache object
+    """
+    if directory is None:
+        directory = meta.PERSISTENT_CACHE_DIRECTORY
+    return PersistentCache(directory, meta.PERSISTENT_CACHE_LIMIT * 2**20,
+                           meta.PERSISTENT_CACHE_MIN_COST)
+
+
+class PersistentCache(object):
+    """ Third tier of the NodeCache. The outputs of nodes which took at
+    least ``min_cost`` seconds to evaluate are written to a directory
+    which outlives the session, so that re-opening a project (in the UI
+    or from the command line) re-uses them instead of rendering the
+    node graph again.
+
+    Outputs are content-addressed: the file name is a hash of the node
+    signature and the render scale. A node signature covers the node type
+    and version, its properties and the signatures of its inputs, down to
+    the pixels of the files the Image nodes read, so an output is found
+    again whatever the id of its node or the project it is in. Several
+    processes may share the directory, as files are written under a
+    temporary name and renamed once complete.
+
+    Each output is written as a ``.npy`` file, read back memory-mapped,
+    and a ``.json`` file holding its shape, type and the checksum of
+    blocks spread over it (see ``SampleChecksum``), which are checked
+    before it is used, so that a hit only reads a few pages of the file
+    up front. Up to ``limit`` bytes are kept, least recently used first.
+    The directory is only listed once per session to find its size,
+    which is then kept up to date as outputs are written, and when the
+    limit is reached (to take the outputs written by other processes
+    into account).
+    """
+
+    def __init__(self, directory, limit=None, min_cost=0.0):
+        self._lock = threading.Lock()
+        self._directory = os.path.expanduser(directory)
+        self._limit = limit
+        self._minCost = min_cost
+        self._writes = 0
+        self._reads = 0
+        self._corrupted = 0
+        # Number and total size of the outputs in the cache or None
+        # until the directory has been listed
+        self._entries = None
+        self._bytes = None
+
+    def GetDirectory(self):
+        return self._directory
+
+    def GetLimit(self):
+        return self._limit
+
+    def SetLimit(self, limit):
+        """ Set the maximum total size of the files in the cache.
+
+        :param limit: size in bytes or None for no limit
+        """
+        self._limit = limit
+        self.Trim()
+
+    def GetKey(self, digest, scale):
+        """ Returns the key of the output of a node.
+
+        :param digest: hash of the signature of the node, see
+        ``DigestSignature``
+        :param scale: render scale
+        :returns: hexadecimal hash
+        """
+        text = repr((CACHE_FORMAT, scale, digest))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def GetPath(self, key, ext):
+        return os.path.join(self._directory, key + ext)
+
+    def Load(self, digest, scale):
+        """ Read the output of a node back from disk.
+
+        :param digest: hash of the signature of the node for the current
+        render
+        :param scale: render scale
+        :returns: tuple of a RenderImage object backed by a read-only
+        memory-mapped array and the time it took to evaluate the node or
+        None if there is no valid output on disk
+        """
+        key = self.GetKey(digest, scale)
+        try:
+            with open(self.GetPath(key, ".json"), "r") as info_file:
+                info = json.load(info_file)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            array = numpy.load(self.GetPath(key, ".npy"), mmap_mode="r",
+                               allow_pickle=False)
+            valid = (list(array.shape) == info["shape"]
+                     and array.dtype.str == info["dtype"]
+                     and SampleChecksum(array) == info["checksum"])
+        except (OSError, ValueError, KeyError):
+            valid = False
+
+        if valid != True:
+            print("[WARNING] Cached node output {} is corrupted, it will "
+                  "be rendered again".format(key))
+            self.Delete(key)
+            with self._lock:
+                self._corrupted += 1
+                # List the directory again for the size of the cache
+                self._entries = None
+                self._bytes = None
+            return None
+
+        # Keep track of the last use for the eviction
+        try:
+            os.utime(self.GetPath(key, ".npy"))
+        except OSError:
+            pass
+        with self._lock:
+            self._reads += 1
+        image = RenderImage()
+        image.SetAsArray(array)
+        image.SetOrigin(info["origin"])
+        return (image, info["cost"])
+
+    def Store(self, digest, scale, image, cost=0.0):
+        """ Write the output of a node to disk, if it was expensive
+        enough to render.
+
+        :param digest: hash of the signature the node was rendered with
+        :param scale: render scale
+        :param image: RenderImage object output by the node
+        :param cost: time in seconds it took to evaluate the node
+        """
+        if cost < self._minCost or image is None or image.IsConstant():
+            # Solid colour images cost nothing to render again
+            return
+        key = self.GetKey(digest, scale)
+        if os.path.exists(self.GetPath(key, ".json")):
+            return
+        array = image.GetArray()
+        if array.dtype != numpy.uint8 or array.ndim != 3 or array.shape[2] != 4:
+            # Only RGBA node outputs are read back as they were
+            return
+        if self._limit is not None and array.nbytes > self._limit:
+            return
+
+        with self._lock:
+            # Before the output is written, so it isn't counted twice
+            self._CountEntries()
+
+        info = {
+            "shape": list(array.shape),
+            "dtype": array.dtype.str,
+            "checksum": SampleChecksum(numpy.ascontiguousarray(array)),
+            "origin": list(image.GetOrigin()),
+            "cost": cost,
+        }
+        # Write to temporary files first, so that other processes only
+        # see complete files. The .json file is written last as it marks
+        # the output as available.
+        suffix = ".{}.{}.tmp".format(os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            with open(self.GetPath(key, ".npy") + suffix, "wb") as npy_file:
+                numpy.save(npy_file, array, allow_pickle=False)
+            os.replace(self.GetPath(key, ".npy") + suffix,
+                       self.GetPath(key, ".npy"))
+            with open(self.GetPath(key, ".json") + suffix, "w") as info_file:
+                json.dump(info, info_file)
+            os.replace(self.GetPath(key, ".json") + suffix,
+                       self.GetPath(key, ".json"))
+            size = os.path.getsize(self.GetPath(key, ".npy"))
+        except OSError as error:
+            print("[WARNING] Could not cache a node output on disk: {}".format(
+                error))
+            for ext in (".npy", ".json"):
+                self._DeleteFile(self.GetPath(key, ext) + suffix)
+            return
+
+        with self._lock:
+            self._writes += 1
+            self._entries += 1
+            self._bytes += size
+            full = self._limit is not None and self._bytes > self._limit
+        if full == True:
+            self.Trim()
+
+    def Delete(self, key):
+        """ Delete the output with the given key. """
+        # The .json file goes first so the output is no longer available
+        self._DeleteFile(self.GetPath(key, ".json"))
+        self._DeleteFile(self.GetPath(key, ".npy"))
+
+    def _DeleteFile(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            # Already gone or still mapped (on Windows)
+            pass
+
+    def _ListEntries(self):
+        """ Returns a list of the (last use, size, key) of the outputs in
+        the cache, least recently used first.
+        """
+        entries = []
+        for path in glob.glob(os.path.join(self._directory, "*.npy")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = os.path.splitext(os.path.basename(path))[0]
+            entries.append((stat.st_mtime, stat.st_size, key))
+        entries.sort()
+        return entries
+
+    def _CountEntries(self):
+        """ List the directory for the number and total size of the
+        outputs in the cache, unless it has already been done. Call
+        this with the lock held.
+        """
+        if self._bytes is None:
+            entries = self._ListEntries()
+            self._entries = len(entries)
+            self._bytes = sum(entry[1] for entry in entries)
+
+    def Trim(self):
+        """ Delete the least recently used outputs until the files fit
+        in the limit.
+        """
+        if self._limit is None:
+            return
+        with self._lock:
+            entries = self._ListEntries()
+            total = sum(entry[1] for entry in entries)
+            count = len(entries)
+            for _, size, key in entries:
+                if total <= self._limit:
+                    break
+                self.Delete(key)
+                total -= size
+                count -= 1
+            self._entries = count
+            self._bytes = total
+
+    def Clear(self):
+        """ Delete all the outputs in the cache. """
+        with self._lock:
+            for ext in ("*.npy", "*.json", "*.tmp"):
+                for path in glob.glob(os.path.join(self._directory, ext)):
+                    self._DeleteFile(path)
+            self._entries = 0
+            self._bytes = 0
+
+    def GetStats(self):
+        """ Returns the statistics of the cache.
+
+        :returns: dictionary with the number of ``writes``, ``reads`` and
+        ``corrupted`` files of this session, the number of outputs in the
+        cache (``entries``) and their total size in bytes (``bytes``)
+        """
+        with self._lock:
+            self._CountEntries()
+            return {
+                "writes": self._writes,
+                "reads": self._reads,
+                "corrupted": self._corrupted,
+                "entries": self._entries,
+                "bytes": self._bytes,
+            }
+
+    def FormatStats(self):
+        """ Returns the statistics of the cache as a line of text for
+        the developer log.
+        """
+        stats = self.GetStats()
+        return ("Persistent cache: {} writes, {} reads, {} corrupted, "
+                "{} outputs, {} MB").format(
+                    stats["writes"], stats["reads"], stats["corrupted"],
+                    stats["entries"], round(stats["bytes"] / 2**20, 1))
@@ -0,0 +1,382 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: plan.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Compile the node graph into a topologically sorted render plan
+# ----------------------------------------------------------------------------
+
+from GimelStudio.node.thumbnails import GetThumbnailThread
+from .cache import FreezeProperties, FreezeValue
+from .fusion import (IsPointNode, IsGeometricNode, GetInputBinding,
+                     PointChain, GeometricChain)
+
+
+class RenderPlan(object):
+    """ Execution plan for rendering a node and everything upstream of it.
+
+    The steps are topologically sorted, so every node comes after all the
+    nodes connected to its parameters. The plan also knows how many nodes
+    consume each result, so a result can be released as soon as its last
+    consumer has been evaluated.
+
+    Duplicate nodes merged by ``MergeDuplicates`` are not steps of the
+    plan. The plan maps them to the node evaluated in their place. Nodes
+    fused by ``FuseChains`` are not steps of the plan either, they are
+    evaluated with the chain of the last node they feed.
+    """
+
+    def __init__(self, root, steps, depends, consumers=None, aliases=None,
+                 duplicates=None, chains=None):
+        self._root = root
+        self._steps = steps
+        self._depends = depends
+        self._aliases = aliases or {}
+        self._duplicates = duplicates or {}
+        self._chains = chains or {}
+
+        if consumers is None:
+            consumers = {}
+            for node_id in depends:
+                for dep_id in depends[node_id]:
+                    consumers[dep_id] = consumers.get(dep_id, 0) + 1
+        self._consumers = consumers
+
+    def __len__(self):
+        return len(self._steps)
+
+    def GetRoot(self):
+        return self._root
+
+    def GetSteps(self):
+        """ Returns the list of nodes in evaluation order. """
+        return self._steps
+
+    def GetDependencies(self, node_id):
+        """ Returns the ids of the nodes the given node depends on. """
+        return self._depends[node_id]
+
+    def GetConsumerCount(self, node_id):
+        """ Returns the number of nodes consuming the given node's result. """
+        return self._consumers.get(node_id, 0)
+
+    def GetAliases(self):
+        """ Returns a dictionary of the id of each merged duplicate node
+        to the node evaluated in its place.
+        """
+        return self._aliases
+
+    def GetDuplicates(self):
+        """ Returns a dictionary of node id to the list of the duplicate
+        nodes merged into the node.
+        """
+        return self._duplicates
+
+    def GetChains(self):
+        """ Returns a dictionary of node id to the PointChain evaluated
+        in place of the node.
+        """
+        return self._chains
+
+    def Subset(self, node_ids):
+        """ Returns a plan for only the given nodes of this plan, keeping
+        their order. The consumer counts are those of the whole plan, so
+        results needed by nodes outside of the subset are not released.
+
+        :param node_ids: set of node ids
+        :returns: RenderPlan object without a root
+        """
+        steps = [step for step in self._steps if step.GetId() in node_ids]
+        depends = {}
+        for step in steps:
+            depends[step.GetId()] = [
+                dep_id for dep_id in self._depends[step.GetId()]
+                if dep_id in node_ids
+            ]
+        return RenderPlan(None, steps, depends, self._consumers)
+
+
+def CompileRenderPlan(node):
+    """ Build the render plan for the given node from the parameter
+    bindings of the node graph. Muted nodes are left out, as their
+    consumers use the default parameter value instead.
+
+    :param node: node object to render
+    :returns: RenderPlan object
+    :raises: ValueError if the node graph contains a cycle
+    """
+    steps = []
+    depends = {}
+    visiting = set()
+
+    stack = [(node, False)]
+    while stack != []:
+        current, expanded = stack.pop()
+        node_id = current.GetId()
+
+        if expanded == True:
+            visiting.discard(node_id)
+            steps.append(current)
+            continue
+
+        if node_id in depends:
+            if node_id in visiting:
+                raise ValueError("The node graph contains a cycle!")
+            continue
+
+        visiting.add(node_id)
+        depends[node_id] = []
+        stack.append((current, True))
+
+        bindings = []
+        for name in current.Parameters:
+            binding = current.Parameters[name].binding
+            if binding and binding.IsMuted() != True:
+                if binding.GetId() not in depends[node_id]:
+                    depends[node_id].append(binding.GetId())
+                    bindings.append(binding)
+
+        # Reversed, so that the parameters are evaluated in order
+        for binding in reversed(bindings):
+            stack.append((binding, False))
+
+    return RenderPlan(node, steps, depends)
+
+
+def MergeDuplicates(plan, properties=None):
+    """ Merge the nodes of the plan which compute the same image, so that
+    it is only evaluated once per render (e.g: two identical Image -> Blur
+    branches made with a duplicated node). Nodes are duplicates if they
+    have the same type, version, property values and ``NodeCacheKey`` and
+    their parameters are connected to the same (or duplicate) nodes.
+    Nodes which are not deterministic (see ``NodeBase.NodeIsDeterministic``)
+    are never merged.
+
+    :param plan: RenderPlan object
+    :param properties: optional snapshot of the property values the
+    nodes are rendered with (see ``SnapshotProperties``)
+    :returns: RenderPlan object without the duplicate nodes, see
+    ``RenderPlan.GetAliases``
+    """
+    if properties is None:
+        properties = {}
+    aliases = {}
+    duplicates = {}
+    originals = {}
+    steps = []
+    depends = {}
+    for node in plan.GetSteps():
+        node_id = node.GetId()
+
+        # The steps are in order, so the inputs of the node have already
+        # been replaced by the nodes evaluated in their place.
+        inputs = []
+        for name in sorted(node.Parameters):
+            binding = node.Parameters[name].binding
+            if binding and binding.IsMuted() != True:
+                inputs.append((name, aliases.get(binding.GetId(), binding).GetId()))
+            else:
+                inputs.append((name, None))
+
+        key = None
+        if node is not plan.GetRoot() and node.NodeIsDeterministic():
+            key = (node.GetType(), node.Model.GetVersion(),
+                   FreezeProperties(node, properties.get(node.GetId())),
+                   FreezeValue(node.NodeCacheKey()),
+                   tuple(inputs))
+            try:
+                original = originals.get(key)
+            except TypeError:
+                # A property value which can't be compared
+                key = None
+                original = None
+            if original is not None:
+                aliases[node_id] = original
+                duplicates.setdefault(original.GetId(), []).append(node)
+                continue
+            if key is not None:
+                originals[key] = node
+
+        steps.append(node)
+        depends[node_id] = []
+        for dep_id in plan.GetDependencies(node_id):
+            if dep_id in aliases:
+                dep_id = aliases[dep_id].GetId()
+            if dep_id not in depends[node_id]:
+                depends[node_id].append(dep_id)
+
+    if aliases == {}:
+        return plan
+    return RenderPlan(plan.GetRoot(), steps, depends, aliases=aliases,
+                      duplicates=duplicates)
+
+
+def FuseChains(plan, fusable, chain_class, single=False):
+    """ Fuse the chains of nodes of the plan for which ``fusable`` returns
+    True into one step each, evaluated by a ``chain_class`` object in
+    place of the last node of the chain. A node is fused with the node
+    consuming its image if that node is its only consumer and neither of
+    them has another input.
+
+    :param plan: RenderPlan object
+    :param fusable: callable returning whether a node may be fused
+    :param chain_class: NodeChain subclass evaluating the chains
+    :param single: whether to make chains of a single node as well
+    :returns: RenderPlan object without the fused nodes, see
+    ``RenderPlan.GetChains``
+    """
+    root = plan.GetRoot()
+    duplicates = plan.GetDuplicates()
+    nodes = {}
+    chains = {}
+    for node in plan.GetSteps():
+        node_id = node.GetId()
+        nodes[node_id] = node
+        depends = plan.GetDependencies(node_id)
+        if (fusable(node) != True or len(depends) != 1
+                or node_id in plan.GetChains()
+                or GetInputBinding(node) is None):
+            continue
+
+        previous = nodes[depends[0]]
+        if (fusable(previous) == True and previous is not root
+                and plan.GetConsumerCount(depends[0]) == 1
+                and len(plan.GetDependencies(depends[0])) == 1
+                and depends[0] not in plan.GetChains()
+                and depends[0] not in duplicates):
+            chains[node_id] = chains.pop(depends[0], [previous]) + [node]
+        elif single == True:
+            chains[node_id] = [node]
+
+    if chains == {}:
+        return plan
+
+    fused = set()
+    for chain in chains.values():
+        fused.update(node.GetId() for node in chain[:-1])
+    steps = []
+    depends = {}
+    for node in plan.GetSteps():
+        node_id = node.GetId()
+        if node_id in fused:
+            continue
+        steps.append(node)
+        if node_id in chains:
+            head = chains[node_id][0]
+            depends[node_id] = list(plan.GetDependencies(head.GetId()))
+        else:
+            depends[node_id] = list(plan.GetDependencies(node_id))
+
+    for node_id in chains:
+        chains[node_id] = chain_class(chains[node_id])
+    chains.update(plan.GetChains())
+    return RenderPlan(root, steps, depends, aliases=plan.GetAliases(),
+                      duplicates=duplicates, chains=chains)
+
+
+def FusePointNodes(plan):
+    """ Fuse the chains of point nodes of the plan (see
+    ``NodeBase.NodePointTransform``) into one step each, so that a chain
+    such as Brightness -> Contrast -> Invert walks over the image once.
+    Single point nodes are evaluated as a chain as well, so that they
+    work out a solid colour output from the colour of their input.
+
+    :param plan: RenderPlan object
+    :returns: RenderPlan object
+    """
+    return FuseChains(plan, IsPointNode, PointChain, single=True)
+
+
+def FuseGeometricNodes(plan):
+    """ Fuse the chains of geometric nodes of the plan (see
+    ``NodeBase.NodeGeometricTransform``) into one step each, so that a
+    chain such as Crop -> Flip resamples the image once.
+
+    :param plan: RenderPlan object
+    :returns: RenderPlan object
+    """
+    return FuseChains(plan, IsGeometricNode, GeometricChain, single=True)
+
+
+def PruneCachedNodes(plan, cache, results):
+    """ Drop the steps of the plan whose output is only needed by nodes
+    whose output is still in the NodeCache. The plan is walked from the
+    root and the cached outputs it reaches are put in the results table
+    straight away. Otherwise the nodes upstream of them would be
+    evaluated first and storing their outputs could evict the very
+    outputs the render needs.
+
+    :param plan: RenderPlan object
+    :param cache: NodeCache object
+    :param results: render-scoped dictionary of node results
+    :returns: RenderPlan object
+    """
+    root = plan.GetRoot()
+    needed = set([root.GetId()])
+    depends = {}
+    for node in reversed(plan.GetSteps()):
+        node_id = node.GetId()
+        if node_id not in needed:
+            continue
+        depends[node_id] = []
+        # The output of the root was looked up before the plan was
+        # pruned, for the region being rendered
+        if node is not root:
+            image = cache.Get(node, cache.Signature(node))
+            if image is not None:
+                results[node_id] = image
+                continue
+        depends[node_id] = plan.GetDependencies(node_id)
+        needed.update(depends[node_id])
+
+    steps = [node for node in plan.GetSteps() if node.GetId() in needed]
+    return RenderPlan(root, steps, depends, aliases=plan.GetAliases(),
+                      duplicates=plan.GetDuplicates(),
+                      chains=plan.GetChains())
+
+
+def HandOverInputs(node, images, last, aliases=None):
+    """ Let the node modify the input images it is the last consumer of
+    in place (see ``RenderImage.HandOver``). An image bound to several
+    parameters of the node is read more than once, so it is left as is.
+    The thumbnails still to be made from the images are made first.
+
+    :param node: node object about to be evaluated
+    :param images: dictionary of node id to the input images of the node
+    :param last: ids of the nodes whose image is no longer needed once
+    the node has been evaluated
+    :param aliases: optional dictionary of merged duplicate node ids to
+    the node evaluated in their place
+    """
+    bound = {}
+    for name in node.Parameters:
+        binding = node.Parameters[name].binding
+        if binding and binding.IsMuted() != True:
+            if aliases is not None:
+                binding = aliases.get(binding.GetId(), binding)
+            bound[binding.GetId()] = bound.get(binding.GetId(), 0) + 1
+
+    for dep_id in last:
+        if bound.get(dep_id) == 1 and dep_id in images:
+            if images[dep_id].IsOwned() == True:
+                # The duplicates of the node show the same image
+                node_ids = [dep_id]
+                if aliases is not None:
+                    node_ids.extend(
+                        alias_id for alias_id in aliases
+                        if aliases[alias_id].GetId() == dep_id
+                    )
+                GetThumbnailThread().Flush(node_ids)
+            images[dep_id].HandOver()
@@ -0,0 +1,186 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: pool.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Re-use the image buffers of previous renders
+# ----------------------------------------------------------------------------
+
+import threading
+import weakref
+
+import numpy
+
+
+# Arrays smaller than this (in bytes) are not worth keeping
+MIN_POOLED_SIZE = 64 * 1024
+
+
+class PooledBuffer(numpy.ndarray):
+    """ Memory of a buffer of the pool. The arrays handed out are plain
+    views of it and NumPy doesn't collapse the views of those arrays past
+    a change of type, so every view (and every image wrapping one) keeps
+    the array handed out alive.
+    """
+
+
+class BufferPool(object):
+    """ Hands out NumPy arrays for node outputs and scratch buffers and
+    takes them back once they are no longer used, so that re-rendering
+    the same node graph re-uses the buffers of the previous render
+    instead of allocating new full size images.
+
+    The buffers are not released by the nodes. Each array handed out is
+    a lease on a buffer, which is returned once the array and everything
+    made from it (a cached node output, an image wrapping it, a view of
+    it) has been garbage collected. ``Reclaim`` takes the returned
+    buffers back. This is done at the end of each render and, so that
+    buffers are also re-used within a render (e.g: from one tile to the
+    next), whenever there is no unused buffer of the requested size. Up
+    to ``limit`` bytes of unused buffers are kept for the next renders.
+    """
+
+    def __init__(self, limit=None):
+        self._lock = threading.Lock()
+        self._limit = limit
+        self._free = {}
+        self._freeBytes = 0
+        # Returned by the finalizers of the leases, which may run on
+        # any thread at any time, so it is only appended to without
+        # taking the lock.
+        self._returned = []
+        self._lentBytes = 0
+        self._highWater = 0
+        self._allocations = 0
+        self._reuses = 0
+
+    def GetLimit(self):
+        return self._limit
+
+    def SetLimit(self, limit):
+        """ Set the maximum size of the unused buffers kept for re-use.
+
+        :param limit: size in bytes or None for no limit
+        """
+        self._limit = limit
+        with self._lock:
+            self._Trim()
+
+    def Acquire(self, shape, dtype=numpy.uint8):
+        """ Get an uninitialized array of the given shape and type,
+        re-using an unused buffer if there is one.
+
+        :param shape: shape of the array
+        :param dtype: NumPy data type of the array
+        :returns: writeable NumPy array
+        """
+        shape = tuple(shape)
+        dtype = numpy.dtype(dtype)
+        nbytes = int(numpy.prod(shape)) * dtype.itemsize
+        if nbytes < MIN_POOLED_SIZE:
+            return numpy.empty(shape, dtype)
+
+        key = (shape, dtype.str)
+        with self._lock:
+            if key not in self._free:
+                self._Reclaim()
+            buffers = self._free.get(key)
+            if buffers:
+                buffer = buffers.pop()
+                if buffers == []:
+                    del self._free[key]
+                self._freeBytes -= nbytes
+                self._reuses += 1
+            else:
+                buffer = None
+                self._allocations += 1
+            self._lentBytes += nbytes
+            self._highWater = max(self._highWater,
+                                  self._lentBytes + self._freeBytes)
+
+        if buffer is None:
+            buffer = PooledBuffer(shape, dtype)
+
+        # The buffer is only referenced by the pool and the lease, so it
+        # can't be handed out again while anything still uses the lease.
+        array = buffer.view(numpy.ndarray)
+        finalizer = weakref.finalize(array, self._returned.append, buffer)
+        finalizer.atexit = False
+        return array
+
+    def Reclaim(self):
+        """ Take back the buffers which are no longer used. Call this
+        at the end of every render.
+        """
+        with self._lock:
+            self._Reclaim()
+            self._Trim()
+
+    def _Reclaim(self):
+        """ Move the buffers whose leases have been garbage collected
+        to the unused buffers.
+        """
+        while self._returned != []:
+            buffer = self._returned.pop()
+            self._lentBytes -= buffer.nbytes
+            key = (buffer.shape, buffer.dtype.str)
+            self._free.setdefault(key, []).append(buffer)
+            self._freeBytes += buffer.nbytes
+
+    def _Trim(self):
+        """ Drop unused buffers until they fit in the limit. The
+        sizes with the most unused buffers are dropped first.
+        """
+        while self._limit is not None and self._freeBytes > self._limit:
+            key = max(self._free, key=lambda key: len(self._free[key]))
+            array = self._free[key].pop()
+            if self._free[key] == []:
+                del self._free[key]
+            self._freeBytes -= array.nbytes
+
+    def Clear(self):
+        """ Drop all the unused buffers. """
+        with self._lock:
+            self._free = {}
+            self._freeBytes = 0
+
+    def GetStats(self):
+        """ Returns the statistics of the pool.
+
+        :returns: dictionary with the number of ``allocations`` and
+        ``reuses`` of pooled buffers and the size in bytes of the buffers
+        in use (``lent``), kept for re-use (``free``) and of both at most
+        (``high_water``)
+        """
+        with self._lock:
+            return {
+                "allocations": self._allocations,
+                "reuses": self._reuses,
+                "lent": self._lentBytes,
+                "free": self._freeBytes,
+                "high_water": self._highWater,
+            }
+
+    def FormatStats(self):
+        """ Returns the statistics of the pool as a line of text for
+        the developer log.
+        """
+        stats = self.GetStats()
+        return ("Buffer pool: {} allocated, {} re-used, {} MB in use, "
+                "{} MB free, {} MB at most").format(
+                    stats["allocations"], stats["reuses"],
+                    round(stats["lent"] / 2**20, 1),
+                    round(stats["free"] / 2**20, 1),
+                    round(stats["high_water"] / 2**20, 1))
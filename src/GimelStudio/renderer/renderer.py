@@ -24,8 +24,16 @@
 # ----------------------------------------------------------------------------
 
 import time
+import threading
 
+from GimelStudio import meta
+from GimelStudio.utils.exceptions import RenderCancelledError
+from .cache import NodeCache, SnapshotProperties
 from .output_node import OutputNode
+from .pool import BufferPool
+from .spill import SpillCache
+from .scheduler import RenderScheduler
+from .tiles import ScaleRegion
 
 
 class Renderer(object):
@@ -33,10 +41,33 @@ class Renderer(object):
     outputs the final render image and render time.
     """
 
-    def __init__(self, parent):
+    def __init__(self, parent, cache=True, store=None):
         self._parent = parent
         self._render = None
         self._time = 0.00
+        self._scale = 1.0
+        # One-off renders (e.g: from the command line) don't need to keep
+        # the node outputs, which also lets the nodes modify the images
+        # they are the last consumer of in place. They still use the
+        # outputs kept on disk between sessions by the optional
+        # PersistentCache (store).
+        self._cache = None
+        if cache == True:
+            spill = None
+            if meta.ENABLE_DISK_SPILL == True:
+                spill = SpillCache(meta.DISK_SPILL_LIMIT * 2**20,
+                                   meta.DISK_SPILL_DIRECTORY,
+                                   meta.DISK_SPILL_MIN_COST)
+            self._cache = NodeCache(meta.NODE_CACHE_BUDGET * 2**20,
+                                    meta.NODE_CACHE_POLICY, spill, store)
+        elif store is not None:
+            self._cache = NodeCache(0, store=store)
+        self._scheduler = RenderScheduler()
+        self._pool = BufferPool(meta.BUFFER_POOL_LIMIT * 2**20)
+        self._progress = None
+        self._merged = 0
+        self._fused = 0
+        self._lock = threading.Lock()
 
     def GetParent(self):
         return self._parent
@@ -47,6 +78,74 @@ class Renderer(object):
     def SetRender(self, render):
         self._render = render
 
+    def GetMergedCount(self):
+        """ Returns the number of duplicate nodes which were merged into
+        another node by the last render, i.e: the number of node
+        evaluations it saved.
+        """
+        return self._merged
+
+    def GetFusedCount(self):
+        """ Returns the number of point and geometric nodes which were
+        fused into the chain of the node they feed by the last render, i.e:
+        the number of passes over the image it saved.
+        """
+        return self._fused
+
+    def GetScale(self):
+        """ Returns the render scale of the last render. """
+        return self._scale
+
+    def GetCache(self):
+        return self._cache
+
+    def ClearCache(self):
+        """ Drop the node outputs kept in memory and delete the ones
+        written to disk, including those kept between sessions.
+        """
+        with self._lock:
+            if self._cache is not None:
+                self._cache.Clear()
+                if self._cache.GetPersistentCache() is not None:
+                    self._cache.GetPersistentCache().Clear()
+
+    def GetBufferPool(self):
+        return self._pool
+
+    def GetWorkerCount(self):
+        return self._scheduler.GetWorkerCount()
+
+    def SetWorkerCount(self, workers):
+        """ Set the number of threads used to evaluate independent
+        branches of the node graph. A value of 1 renders serially.
+
+        :param workers: maximum number of worker threads
+        """
+        self._scheduler.SetWorkerCount(workers)
+
+    def GetTileSize(self):
+        return self._scheduler.GetTileSize()
+
+    def SetTileSize(self, tile_size):
+        """ Render the node graph in tiles of the given size, so that
+        huge images can be rendered with bounded memory. Only nodes which
+        declare a halo are tiled, the others are rendered on the whole
+        image.
+
+        :param tile_size: width and height of a tile in pixels or None
+        to render the whole image at once (the default)
+        """
+        self._scheduler.SetTileSize(tile_size)
+
+    def SetProgressCallback(self, callback):
+        """ Set the callable which is called after each node has been
+        evaluated with the number of evaluated nodes and the total
+        number of nodes to evaluate.
+
+        :param callback: callable or None
+        """
+        self._progress = callback
+
     def GetTime(self, exact=False):
         if exact == True:
             return self._time
@@ -56,45 +155,130 @@ class Renderer(object):
     def SetTime(self, time):
         self._time = time
 
-    def Render(self, nodes):
+    def Render(self, nodes, region=None, scale=1.0, cancel=None,
+               properties=None):
         """ Render method for evaluating the Node Graph
-        to render an image.
+        to render an image. If the render is cancelled, the last
+        render is kept and None is returned.
 
         :param nodes: dictionary of nodes of the Node Graph
-        :returns: rendered image
+        :param region: region (left, top, right, bottom) of the full
+        resolution image to render or None to render the whole image
+        :param scale: scale of the render relative to the full resolution
+        (e.g: 0.25 for a quarter resolution proxy render)
+        :param cancel: optional CancelToken to stop the render early
+        :param properties: snapshot of the property values to render with
+        (see ``SnapshotProperties``), defaults to the current values
+        :returns: rendered image or None if the render was cancelled
         """
-        # Start timing the render
-        start_time = time.time()
+        # Renders may be started from the render thread and the main
+        # thread (e.g: exporting), so only run one at a time.
+        with self._lock:
+            # Start timing the render
+            start_time = time.time()
 
-        # Render the image
-        output_node = self.GetOutputNode(nodes)
-        rendered_image = self.RenderNodeGraph(output_node, nodes)
+            # Render the image. The results table only lives for the
+            # duration of this render so that each node is evaluated
+            # exactly once, no matter how many nodes it is connected to.
+            output_node = self.GetOutputNode(nodes)
+            results = {}
+            if properties is None:
+                properties = SnapshotProperties(nodes)
 
-        # Get rendered image, otherwise use
-        # the default transparent image.
-        if rendered_image != None:
-            image = rendered_image.GetImage()
-        else:
-            image = output_node.Parameters["Image"].value.GetImage()
+            # The nodes render at the scale of the render, so the
+            # region is scaled along with them.
+            if region is not None and scale != 1.0:
+                region = ScaleRegion(region, scale)
 
-        output_node.NodeSetThumb(image)
-        self.SetRender(image)
+            # Nodes whose signature has not changed since the last render
+            # re-use their cached output instead of being re-evaluated.
+            if self._cache is not None:
+                self._cache.Prune(nodes)
+                self._cache.BeginRender(scale, properties)
 
-        # Set rendertime
-        self.SetTime(time.time() - start_time)
+            try:
+                rendered_image = self.RenderNodeGraph(output_node, nodes,
+                                                      results, region, scale,
+                                                      cancel, properties)
+            except RenderCancelledError:
+                # The nodes which finished are in the cache, so
+                # the next render picks up from where this one stopped.
+                self.ReclaimBuffers()
+                self.LogStats()
+                return None
+            self._scale = scale
 
-        return image
+            # Get rendered image, otherwise use
+            # the default transparent image.
+            if rendered_image != None:
+                image = rendered_image.GetImage()
+            else:
+                image = output_node.Parameters["Image"].value.GetImage()
+
+            output_node.NodeSetThumb(image)
+            self.SetRender(image)
+
+            # Set rendertime
+            self.SetTime(time.time() - start_time)
+
+            self.ReclaimBuffers()
+            self.LogStats()
+            return image
+
+    def ReclaimBuffers(self):
+        """ Take back the buffers of the buffer pool which are no
+        longer used, for re-use by the next render.
+        """
+        self._pool.Reclaim()
+
+    def LogStats(self):
+        """ Print the statistics of the node cache and the buffer pool
+        to the developer log, if enabled.
+        """
+        if meta.LOG_RENDER_STATS == True:
+            print("[INFO] Duplicate nodes: {} evaluations saved".format(
+                self._merged))
+            print("[INFO] Fused nodes: {} passes saved".format(self._fused))
+            if self._cache is not None:
+                print("[INFO] {}".format(self._cache.FormatStats()))
+                if self._cache.GetSpillCache() is not None:
+                    print("[INFO] {}".format(
+                        self._cache.GetSpillCache().FormatStats()))
+                if self._cache.GetPersistentCache() is not None:
+                    print("[INFO] {}".format(
+                        self._cache.GetPersistentCache().FormatStats()))
+            print("[INFO] {}".format(self._pool.FormatStats()))
 
-    def RenderNodeGraph(self, output_node, nodes):
+    def RenderNodeGraph(self, output_node, nodes, results=None, region=None,
+                        scale=1.0, cancel=None, properties=None):
         """ Render the image, starting from the output node.
 
         :param output_node: the output node object
         :param nodes: dictionary of nodes of the Node Graph
+        :param results: render-scoped dictionary of node results
+        :param region: region of the image to render or None
+        :param scale: scale of the render relative to the full resolution
+        :param cancel: optional CancelToken to stop the render early
+        :param properties: snapshot of the property values to render with
         :returns: RenderImage object
         """
-        output_data = OutputNode()
+        output_data = OutputNode(meta.MERGE_DUPLICATE_NODES,
+                                 meta.FUSE_POINT_NODES,
+                                 meta.FUSE_GEOMETRIC_NODES)
         output_data.SetNode(output_node)
-        return output_data.RenderImage()
+        try:
+            return output_data.RenderImage(results, self._cache,
+                                           self._scheduler, self._progress,
+                                           region, scale, cancel, self._pool,
+                                           properties)
+        finally:
+            self._merged = 0
+            self._fused = 0
+            plan = output_data.GetPlan()
+            if plan is not None:
+                self._merged = len(plan.GetAliases())
+                for chain in plan.GetChains().values():
+                    self._fused += len(chain.GetNodes()) - 1
 
     def GetOutputNode(self, nodes):
         """ Get the output composite node.
@@ -0,0 +1,217 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: scheduler.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Evaluate independent branches of the node graph in parallel
+# ----------------------------------------------------------------------------
+
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .plan import HandOverInputs
+from .tiles import RenderRegions
+
+
+class RenderScheduler(object):
+    """ Evaluates the independent branches of the node graph at the same
+    time on a bounded thread pool.
+
+    A node is handed to the pool as soon as all of the nodes connected to
+    its parameters have been evaluated, so the inputs of multi-input nodes
+    (Mix, Composite, etc) are computed side by side. Most of the work in
+    the nodes is done by Pillow, NumPy and OpenCV, which release the GIL.
+
+    With a worker count of 1, the steps of the plan are evaluated in order
+    on the calling thread. The results are the same in both modes.
+    """
+
+    def __init__(self, workers=None, tile_size=None):
+        if workers is None:
+            workers = min(8, os.cpu_count() or 1)
+        self._workers = workers
+        self._tileSize = tile_size
+        self._executor = None
+
+    def GetWorkerCount(self):
+        return self._workers
+
+    def SetWorkerCount(self, workers):
+        """ Set the number of threads used to evaluate nodes.
+
+        :param workers: maximum number of worker threads (1 for serial)
+        """
+        if workers < 1:
+            raise ValueError("The worker count must be at least 1")
+        if workers != self._workers:
+            self.Shutdown()
+            self._workers = workers
+
+    def GetTileSize(self):
+        return self._tileSize
+
+    def SetTileSize(self, tile_size):
+        """ Set the size of the tiles for tiled rendering.
+
+        :param tile_size: width and height of a tile in pixels or None
+        to render the whole image at once
+        """
+        if tile_size is not None and tile_size < 16:
+            raise ValueError("The tile size must be at least 16 pixels")
+        self._tileSize = tile_size
+
+    def GetExecutor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._workers,
+                thread_name_prefix="GimelStudioRender"
+            )
+        return self._executor
+
+    def Shutdown(self):
+        """ Stop the worker threads. They are re-created when needed. """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def HandOver(self, eval_info, plan, remaining, node):
+        """ Hand the results the given node is the last consumer of
+        over to it. Results are only handed over when the NodeCache (if
+        any) doesn't keep outputs in memory for the next render.
+
+        :param eval_info: EvalInfo object holding the render state
+        :param plan: RenderPlan object being executed
+        :param remaining: dictionary of node id to the number of
+        consumers which still have to be evaluated
+        :param node: node object about to be evaluated
+        """
+        if eval_info.cache is not None and eval_info.cache.GetBudget() != 0:
+            return
+        last = [
+            dep_id for dep_id in plan.GetDependencies(node.GetId())
+            if remaining[dep_id] == 1
+        ]
+        HandOverInputs(node, eval_info.results, last, eval_info.aliases)
+
+    def Release(self, plan, results, remaining, node_id):
+        """ Count down the consumers of the nodes the given node depends
+        on and drop the results which are no longer needed.
+
+        :param plan: RenderPlan object being executed
+        :param results: render-scoped dictionary of node results
+        :param remaining: dictionary of node id to the number of
+        consumers which still have to be evaluated
+        :param node_id: id of the node which has just been evaluated
+        """
+        for dep_id in plan.GetDependencies(node_id):
+            remaining[dep_id] -= 1
+            if remaining[dep_id] == 0:
+                results.pop(dep_id, None)
+
+    def Run(self, eval_info, plan, progress=None, region=None):
+        """ Execute the render plan and return the result of its root
+        node. Only the pixels of each node which reach the requested
+        region of the output are rendered and, in tiled mode, the nodes
+        which support it are rendered tile by tile.
+
+        :param eval_info: EvalInfo object holding the render state
+        :param plan: RenderPlan object to execute
+        :param progress: optional callable, called with the number of
+        completed steps and the total number of steps
+        :param region: region (left, top, right, bottom) of the output
+        to render or None to render the whole image
+        :returns: the evaluated value of the root node of the plan
+        """
+        if eval_info.results is None:
+            return eval_info.EvaluateBinding(plan.GetRoot())
+
+        return RenderRegions(self, eval_info, plan, self._tileSize, region,
+                             progress)
+
+    def Execute(self, eval_info, plan, progress=None):
+        """ Evaluate all the steps of the render plan. Every intermediate
+        result is dropped from the results table as soon as its last
+        consumer has been evaluated, so only the live frontier of the
+        graph is kept.
+
+        :param eval_info: EvalInfo object holding the render state
+        :param plan: RenderPlan object to execute
+        :param progress: optional callable, called with the number of
+        evaluated nodes and the total number of nodes in the plan
+        """
+        results = eval_info.results
+        steps = plan.GetSteps()
+        total = len(steps)
+        remaining = {}
+        for node in steps:
+            remaining[node.GetId()] = plan.GetConsumerCount(node.GetId())
+
+        if self._workers <= 1:
+            # Everything upstream of a step is already in the results
+            # table, so the evaluation won't recurse into other nodes.
+            for count, node in enumerate(steps, 1):
+                self.HandOver(eval_info, plan, remaining, node)
+                eval_info.EvaluateBinding(node)
+                self.Release(plan, results, remaining, node.GetId())
+                if progress is not None:
+                    progress(count, total)
+            return
+
+        nodes = {}
+        depends = {}
+        consumers = {}
+        for node in steps:
+            node_id = node.GetId()
+            nodes[node_id] = node
+            depends[node_id] = set(plan.GetDependencies(node_id))
+            for dep_id in depends[node_id]:
+                consumers.setdefault(dep_id, []).append(node_id)
+
+        executor = self.GetExecutor()
+        running = {}
+
+        def Submit(node_id):
+            # The other consumers of its inputs may be running, so a
+            # node only gets the inputs nothing else is waiting for.
+            self.HandOver(eval_info, plan, remaining, nodes[node_id])
+            future = executor.submit(eval_info.EvaluateBinding, nodes[node_id])
+            running[future] = node_id
+
+        for node in steps:
+            if depends[node.GetId()] == set():
+                Submit(node.GetId())
+
+        count = 0
+        while running != {}:
+            done, pending = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node_id = running.pop(future)
+                try:
+                    # Re-raise any error (or cancellation) from the
+                    # node evaluation
+                    future.result()
+                except Exception:
+                    # Don't start the nodes which are still queued
+                    for future in running:
+                        future.cancel()
+                    raise
+                self.Release(plan, results, remaining, node_id)
+                count += 1
+                if progress is not None:
+                    progress(count, total)
+                for consumer_id in consumers.get(node_id, []):
+                    depends[consumer_id].discard(node_id)
+                    if depends[consumer_id] == set():
+                        Submit(consumer_id)
@@ -0,0 +1,284 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: spill.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Keep the node outputs evicted from the node cache on disk
+# ----------------------------------------------------------------------------
+
+import os
+import atexit
+import shutil
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy
+
+from GimelStudio.datatypes import RenderImage
+
+
+# Number and size in bytes of the blocks of a spilled file which are
+# checked when it is read back.
+CHECK_BLOCKS = 64
+CHECK_BLOCK_SIZE = 4096
+
+
+def SampleChecksum(array):
+    """ Returns the CRC-32 checksum of blocks spread evenly over the
+    bytes of the array, so that checking a memory-mapped array only
+    reads a few pages of its file.
+
+    :param array: C-contiguous NumPy array
+    :returns: checksum as an integer
+    """
+    data = array.reshape(-1).view(numpy.uint8)
+    if data.size <= CHECK_BLOCKS * CHECK_BLOCK_SIZE:
+        return zlib.crc32(data)
+    checksum = 0
+    for index in range(CHECK_BLOCKS):
+        # The last block ends at the end of the array
+        start = index * (data.size - CHECK_BLOCK_SIZE) // (CHECK_BLOCKS - 1)
+        checksum = zlib.crc32(data[start:start + CHECK_BLOCK_SIZE], checksum)
+    return checksum
+
+
+class SpillCache(object):
+    """ Second tier of the NodeCache. Node outputs evicted from memory
+    are written to a scratch directory as ``.npy`` files and read back
+    memory-mapped, so an output which took seconds to compute costs only
+    the time to map its file when it is needed again.
+
+    Each file is checked against the shape and type of the array it was
+    written from, and the CRC-32 checksum of blocks spread over it (see
+    ``SampleChecksum``), before it is used. Files which fail the check are
+    deleted and the node is re-evaluated. Up to ``limit`` bytes
+    are kept, least recently used files are deleted first. The scratch
+    directory is deleted on exit.
+
+    Outputs which took less than ``min_cost`` seconds to evaluate are
+    quicker to render again than to write and are not spilled.
+    """
+
+    def __init__(self, limit=None, directory=None, min_cost=0.0):
+        self._lock = threading.Lock()
+        self._limit = limit
+        self._minCost = min_cost
+        self._parent = directory
+        self._directory = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._count = 0
+        self._writes = 0
+        self._reads = 0
+        self._corrupted = 0
+        atexit.register(self.Clear)
+
+    def GetLimit(self):
+        return self._limit
+
+    def SetLimit(self, limit):
+        """ Set the maximum total size of the spilled files.
+
+        :param limit: size in bytes or None for no limit
+        """
+        self._limit = limit
+        with self._lock:
+            self._Trim()
+
+    def GetDirectory(self):
+        """ Returns the scratch directory, creating it if needed. """
+        if self._directory is None:
+            if self._parent is not None:
+                os.makedirs(self._parent, exist_ok=True)
+            self._directory = tempfile.mkdtemp(prefix="gimelstudio-spill-",
+                                               dir=self._parent)
+        return self._directory
+
+    def Has(self, key, signature):
+        """ Returns whether an output is spilled for the given key and
+        signature, without reading it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] == signature
+
+    def Store(self, key, signature, image, cost=0.0):
+        """ Write the output to the scratch directory. Outputs larger
+        than the whole limit are not stored.
+
+        :param key: key of the output in the NodeCache
+        :param signature: signature the node was rendered with
+        :param image: RenderImage object
+        :param cost: time in seconds it took to evaluate the node
+        """
+        if cost < self._minCost or image.IsConstant():
+            # Solid colour images cost nothing to render again
+            return
+        array = image.GetArray()
+        if array.dtype != numpy.uint8 or array.ndim != 3 or array.shape[2] != 4:
+            # Only RGBA node outputs are read back as they were
+            return
+        if self._limit is not None and array.nbytes > self._limit:
+            return
+        if self.Has(key, signature):
+            # Outputs read back from disk are already there
+            return
+
+        with self._lock:
+            self._count += 1
+            path = os.path.join(self.GetDirectory(),
+                                "{:08d}.npy".format(self._count))
+        try:
+            # Write to a temporary file first, so that a file is either
+            # complete or not there at all.
+            with open(path + ".tmp", "wb") as npy:
+                numpy.save(npy, array, allow_pickle=False)
+            os.replace(path + ".tmp", path)
+        except OSError as error:
+            print("[WARNING] Could not spill a node output to disk: {}".format(
+                error))
+            self._Delete(path + ".tmp")
+            return
+
+        checksum = SampleChecksum(numpy.ascontiguousarray(array))
+        with self._lock:
+            if key in self._entries:
+                self._Remove(key)
+            self._entries[key] = (signature, path, array.shape, array.dtype,
+                                  checksum, image.GetOrigin(), cost)
+            self._bytes += array.nbytes
+            self._writes += 1
+            self._Trim()
+
+    def Load(self, key, signature):
+        """ Read the output spilled for the given key back from disk.
+
+        :param key: key of the output in the NodeCache
+        :param signature: signature of the node for the current render
+        :returns: tuple of a RenderImage object backed by a read-only
+        memory-mapped array and the time it took to evaluate the node or
+        None if there is no valid output on disk
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                return None
+            self._entries.move_to_end(key)
+        _, path, shape, dtype, checksum, origin, cost = entry
+
+        try:
+            array = numpy.load(path, mmap_mode="r", allow_pickle=False)
+            valid = (array.shape == shape and array.dtype == dtype
+                     and SampleChecksum(array) == checksum)
+        except (OSError, ValueError):
+            valid = False
+
+        if valid != True:
+            print("[WARNING] Spilled node output {} is corrupted, it will "
+                  "be rendered again".format(path))
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._Remove(key)
+                self._corrupted += 1
+            return None
+
+        with self._lock:
+            self._reads += 1
+        image = RenderImage()
+        image.SetAsArray(array)
+        image.SetOrigin(origin)
+        return (image, cost)
+
+    def Discard(self, node_id, keep=None):
+        """ Delete the outputs spilled for the given node which are out
+        of date.
+
+        :param node_id: id of the node
+        :param keep: signature of the outputs which are still valid or
+        None to delete all the outputs of the node
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == node_id and self._entries[key][0] != keep:
+                    self._Remove(key)
+
+    def Prune(self, nodes):
+        """ Delete the outputs spilled for nodes which are no longer
+        in the node graph.
+
+        :param nodes: dictionary of nodes of the Node Graph
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] not in nodes:
+                    self._Remove(key)
+
+    def Clear(self):
+        """ Delete all the spilled outputs and the scratch directory. """
+        with self._lock:
+            self._entries = OrderedDict()
+            self._bytes = 0
+            if self._directory is not None:
+                shutil.rmtree(self._directory, ignore_errors=True)
+                self._directory = None
+
+    def _Remove(self, key):
+        """ Drop the given entry and its file. The lock must be held. """
+        entry = self._entries.pop(key)
+        self._bytes -= int(numpy.prod(entry[2])) * entry[3].itemsize
+        self._Delete(entry[1])
+
+    def _Delete(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            # Already gone or still mapped (on Windows), the
+            # scratch directory is deleted on exit anyway.
+            pass
+
+    def _Trim(self):
+        """ Delete the least recently used files until they fit in the
+        limit. The lock must be held.
+        """
+        while self._limit is not None and self._bytes > self._limit:
+            self._Remove(next(iter(self._entries)))
+
+    def GetStats(self):
+        """ Returns the statistics of the spill cache.
+
+        :returns: dictionary with the number of ``writes``, ``reads`` and
+        ``corrupted`` files, the number of spilled outputs (``entries``)
+        and their total size in bytes (``bytes``)
+        """
+        with self._lock:
+            return {
+                "writes": self._writes,
+                "reads": self._reads,
+                "corrupted": self._corrupted,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def FormatStats(self):
+        """ Returns the statistics of the spill cache as a line of text
+        for the developer log.
+        """
+        stats = self.GetStats()
+        return ("Spill cache: {} writes, {} reads, {} corrupted, {} outputs, "
+                "{} MB").format(stats["writes"], stats["reads"],
+                                stats["corrupted"], stats["entries"],
+                                round(stats["bytes"] / 2**20, 1))
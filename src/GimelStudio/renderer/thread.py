@@ -15,13 +15,17 @@
 #
 # FILE: thread.py
 # AUTHOR(S): Noah Rahm
-# PURPOSE: Define the thread worker for the renderer
+# PURPOSE: Define the background worker thread for the renderer
 # ----------------------------------------------------------------------------
 
-from threading import *
+
+from threading import Thread, Condition
 
 import wx
 
+from .cache import SnapshotProperties
+from .cancel import CancelToken
+
 
 # Define notification event for thread completion
 EVT_RESULT_ID = wx.NewIdRef()
@@ -43,19 +47,94 @@ class ResultEvent(wx.PyEvent):
 
 
 class RenderThread(Thread):
-    """ Thread class that executes processing """
+    """ Long-lived worker thread which renders the node graph in the
+    background, so that renders never block the wx main loop.
+
+    Render requests are latest-wins: a new request cancels the render in
+    progress and replaces any request which has not been started yet, so
+    only the newest state of the node graph is ever rendered. The worker
+    never touches the UI. Each finished render is sent to the parent
+    window as a ResultEvent (see EVT_RENDER_RESULT) with wx.PostEvent and
+    its data is a tuple of (job id, PIL image, render time, render scale).
+    """
 
-    def __init__(self, parent):
+    def __init__(self, parent, renderer):
         """ Init the worker thread"""
-        Thread.__init__(self)
+        Thread.__init__(self, name="GimelStudioRenderThread", daemon=True)
         self._parent = parent
+        self._renderer = renderer
+        self._condition = Condition()
+        self._request = None
+        self._cancel = None
+        self._jobID = 0
+        self._running = True
         # Starts the thread running
         self.start()
 
+    def GetJobID(self):
+        """ Returns the id of the newest render request. """
+        return self._jobID
+
+    def Request(self, nodes, scale=1.0):
+        """ Request a render of the node graph. The render in progress,
+        if any, is obsolete and is cancelled.
+
+        :param nodes: dictionary of nodes of the Node Graph
+        :param scale: scale of the render relative to the full resolution
+        :returns: id of the render job
+        """
+        with self._condition:
+            self._jobID += 1
+            # Copy the dictionary and the property values, as nodes may
+            # be added, deleted or edited on the main thread while the
+            # render is running.
+            self._request = (self._jobID, dict(nodes),
+                             SnapshotProperties(nodes), scale)
+            if self._cancel is not None:
+                self._cancel.Cancel()
+            self._condition.notify()
+            return self._jobID
+
+    def Stop(self):
+        """ Cancel the render in progress and stop the thread. """
+        with self._condition:
+            self._running = False
+            self._request = None
+            if self._cancel is not None:
+                self._cancel.Cancel()
+            self._condition.notify()
+
     def run(self):
         """ Run the worker thread """
-        # Code executing in the new thread.
-        render_image = self._parent._renderer.Render(self._parent._nodeGraph.GetNodes())
+        while True:
+            with self._condition:
+                while self._request is None and self._running == True:
+                    self._condition.wait()
+                if self._running != True:
+                    return
+                job_id, nodes, properties, scale = self._request
+                self._request = None
+                self._cancel = cancel = CancelToken()
+
+            try:
+                image = self._renderer.Render(nodes, scale=scale,
+                                              cancel=cancel,
+                                              properties=properties)
+            except Exception as exc:
+                # Keep the worker alive for the next render
+                print('ERROR: PLEASE REPORT THE FOLLOWING ERROR TO THE DEVELOPERS: \n', exc)
+                image = None
+
+            with self._condition:
+                self._cancel = None
+                # Don't bother the UI with a render which is already
+                # out of date.
+                if image is None or self._request is not None:
+                    continue
+                if self._running != True:
+                    return
 
-        # The result returned
-        wx.PostEvent(self._parent, ResultEvent(render_image))
+            # The result returned
+            wx.PostEvent(self._parent, ResultEvent(
+                (job_id, image, self._renderer.GetTime(), scale)
+            ))
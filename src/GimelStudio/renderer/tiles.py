@@ -0,0 +1,518 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: tiles.py
+# AUTHOR(S): Noah Rahm
+# PURPOSE: Render only the regions of the images which reach the output,
+# optionally tile by tile to bound the memory use
+# ----------------------------------------------------------------------------
+
+import math
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from PIL import Image
+
+from GimelStudio.datatypes import RenderImage
+from GimelStudio.node.thumbnails import GetThumbnailsEnabled
+from .plan import HandOverInputs, PruneCachedNodes
+
+
+# Maximum width or height of the node thumbnails
+# stitched together from the rendered tiles.
+PREVIEW_SIZE = 256
+
+
+def ClipRegion(region, bounds):
+    """ Returns the part of the region inside of the bounds. """
+    left = min(max(region[0], bounds[0]), bounds[2])
+    top = min(max(region[1], bounds[1]), bounds[3])
+    return (
+        left,
+        top,
+        max(min(region[2], bounds[2]), left),
+        max(min(region[3], bounds[3]), top)
+    )
+
+
+def UnionRegion(region1, region2):
+    """ Returns the smallest region containing both regions. """
+    if region1 is None:
+        return region2
+    return (
+        min(region1[0], region2[0]),
+        min(region1[1], region2[1]),
+        max(region1[2], region2[2]),
+        max(region1[3], region2[3])
+    )
+
+
+def OffsetRegion(region, origin):
+    """ Move the region so that it is relative to the given origin. """
+    return (
+        region[0] - origin[0],
+        region[1] - origin[1],
+        region[2] - origin[0],
+        region[3] - origin[1]
+    )
+
+
+def ScaleRegion(region, scale):
+    """ Scale the region, rounding outwards so that the scaled region
+    covers all of the pixels of the region.
+    """
+    return (
+        math.floor(region[0] * scale),
+        math.floor(region[1] * scale),
+        math.ceil(region[2] * scale),
+        math.ceil(region[3] * scale)
+    )
+
+
+def GetRegionNodes(eval_info, plan):
+    """ Find the nodes of the plan which can render a region of their
+    image. These are the nodes which don't need their whole input images,
+    have all their parameters connected and only feed other region nodes,
+    starting from the root.
+
+    :param eval_info: EvalInfo object holding the render state
+    :param plan: RenderPlan object
+    :returns: set of node ids
+    """
+    consumers = {}
+    for node in plan.GetSteps():
+        for dep_id in plan.GetDependencies(node.GetId()):
+            consumers.setdefault(dep_id, []).append(node.GetId())
+
+    nodes = set()
+    root = plan.GetRoot()
+    for node in reversed(plan.GetSteps()):
+        node_id = node.GetId()
+        if node is not root:
+            if any(c not in nodes for c in consumers.get(node_id, [])):
+                continue
+
+        # Input nodes are always rendered on the whole image
+        if plan.GetDependencies(node_id) == []:
+            continue
+
+        connected = True
+        for name in node.Parameters:
+            binding = node.Parameters[name].binding
+            if not binding or binding.IsMuted() == True:
+                connected = False
+        if connected == False:
+            continue
+
+        info = eval_info.ForNode(node)
+        if info.GetInputRegion((0, 0, 0, 0)) is not None:
+            nodes.add(node_id)
+    return nodes
+
+
+def PruneRegionNodes(plan, nodes, node_ids):
+    """ Remove the given nodes from the region nodes, as well as the nodes
+    which no longer only feed region nodes as a result.
+
+    :param plan: RenderPlan object
+    :param nodes: set of the ids of the region nodes
+    :param node_ids: set of node ids to remove
+    """
+    nodes.difference_update(node_ids)
+
+    for node in reversed(plan.GetSteps()):
+        node_id = node.GetId()
+        if node_id in nodes and node is not plan.GetRoot():
+            for step in plan.GetSteps():
+                if node_id in plan.GetDependencies(step.GetId()):
+                    if step.GetId() not in nodes:
+                        nodes.discard(node_id)
+                        break
+
+
+def GetDomains(eval_info, plan, nodes, results):
+    """ Work out the region covered by the whole image of the region
+    nodes from the images they are fed with. Nodes fed with images of
+    different sizes can only be rendered on their whole image.
+
+    :param eval_info: EvalInfo object holding the render state
+    :param plan: RenderPlan object
+    :param nodes: set of the ids of the region nodes
+    :param results: render-scoped dictionary of node results
+    :returns: tuple of a dictionary of node id to the region of its
+    whole input images, a dictionary of node id to the region of its
+    whole output image and a set of the ids of the nodes with
+    mismatched input images
+    """
+    inputs = {}
+    domains = {}
+    mismatched = set()
+    for node in plan.GetSteps():
+        node_id = node.GetId()
+        if node_id not in nodes:
+            continue
+
+        input_domains = set()
+        for dep_id in plan.GetDependencies(node_id):
+            if dep_id in nodes:
+                input_domains.add(domains.get(dep_id))
+            else:
+                size = results[dep_id].GetSize()
+                input_domains.add((0, 0, size[0], size[1]))
+
+        if None in input_domains:
+            continue
+        elif len(input_domains) != 1:
+            mismatched.add(node_id)
+        else:
+            inputs[node_id] = input_domains.pop()
+            domains[node_id] = eval_info.ForNode(node).GetOutputRegion(
+                inputs[node_id]
+            )
+    return inputs, domains, mismatched
+
+
+def GetRegions(eval_info, plan, nodes, inputs, region):
+    """ Work backwards from the requested region of the root to find the
+    region each region node has to output and the region of its input
+    images it needs for that.
+
+    :param eval_info: EvalInfo object holding the render state
+    :param plan: RenderPlan object
+    :param nodes: set of the ids of the region nodes
+    :param inputs: dictionary of node id to the region of its whole
+    input images
+    :param region: requested region of the root node
+    :returns: tuple of a dictionary of node id to output region and a
+    dictionary of node id to input region
+    """
+    regions = {plan.GetRoot().GetId(): region}
+    needed = {}
+    for node in reversed(plan.GetSteps()):
+        node_id = node.GetId()
+        if node_id not in nodes:
+            continue
+
+        needed[node_id] = ClipRegion(
+            eval_info.ForNode(node).GetInputRegion(regions[node_id]),
+            inputs[node_id]
+        )
+        for dep_id in plan.GetDependencies(node_id):
+            regions[dep_id] = UnionRegion(regions.get(dep_id), needed[node_id])
+    return regions, needed
+
+
+def RenderRegion(eval_info, plan, nodes, inputs, region, scale=None):
+    """ Render the given region of the root node through the region
+    nodes. Each region node is fed with only the region of its input
+    images it needs, starting at the origin of the images.
+
+    :param eval_info: EvalInfo object holding the render state
+    :param plan: RenderPlan object
+    :param nodes: set of the ids of the region nodes
+    :param inputs: dictionary of node id to the region of its whole
+    input images
+    :param region: region of the root node to render
+    :param scale: scale of the node thumbnails or None to let the nodes
+    set their own thumbnails
+    :returns: tuple of the rendered region as a RenderImage object and a
+    dictionary of node id to the scaled down region for the thumbnails
+    """
+    steps = [node for node in plan.GetSteps() if node.GetId() in nodes]
+    regions, needed = GetRegions(eval_info, plan, nodes, inputs, region)
+
+    remaining = {}
+    for node in steps:
+        for dep_id in plan.GetDependencies(node.GetId()):
+            remaining[dep_id] = remaining.get(dep_id, 0) + 1
+
+    data = {}
+    thumbs = {}
+    for node in steps:
+        node_id = node.GetId()
+
+        images = {}
+        last = []
+        for dep_id in plan.GetDependencies(node_id):
+            if dep_id in nodes:
+                source = data[dep_id]
+            else:
+                source = eval_info.results[dep_id]
+
+            box = OffsetRegion(needed[node_id], source.GetOrigin())
+            if box == (0, 0) + source.GetSize():
+                images[dep_id] = source
+            else:
+                # Cropped images are only used by this node
+                images[dep_id] = source.Crop(box)
+                images[dep_id].SetOrigin(needed[node_id])
+                last.append(dep_id)
+
+            remaining[dep_id] -= 1
+            if remaining[dep_id] == 0:
+                data.pop(dep_id, None)
+                # The tile of the image is only used by this node
+                if dep_id in nodes and dep_id not in last:
+                    last.append(dep_id)
+
+        eval_info.CheckCancelled()
+        HandOverInputs(node, images, last, eval_info.aliases)
+        info = eval_info.ForNode(node)
+        info.results = images
+        info.cache = None
+        output = info.EvaluateNode()
+
+        covered = info.GetOutputRegion(needed[node_id])
+        if covered != regions[node_id]:
+            output = output.Crop(OffsetRegion(regions[node_id], covered))
+        output.SetOrigin(regions[node_id])
+        data[node_id] = output
+
+        if scale is not None:
+            thumbs[node_id] = output.GetImage().crop(
+                OffsetRegion(region, regions[node_id])
+            ).resize((
+                max(round(region[2] * scale) - round(region[0] * scale), 1),
+                max(round(region[3] * scale) - round(region[1] * scale), 1)
+            ))
+
+    return data[plan.GetRoot().GetId()], thumbs
+
+
+def RenderTiles(scheduler, eval_info, plan, nodes, inputs, region,
+                tile_size, progress=None):
+    """ Render the given region of the root node tile by tile and stitch
+    the tiles together. The region nodes only ever hold a tile (plus the
+    pixels around it they need) of their image, so the memory they use is
+    bounded by the tile size and the depth of the graph.
+
+    :returns: RenderImage object of the region
+    """
+    tiles = []
+    for y in range(region[1], region[3], tile_size):
+        for x in range(region[0], region[2], tile_size):
+            tiles.append((x, y, min(x + tile_size, region[2]),
+                          min(y + tile_size, region[3])))
+    if tiles == []:
+        # An empty region has no tiles to take the thumbnails from
+        return RenderRegion(eval_info, plan, nodes, inputs, region)[0]
+
+    width = region[2] - region[0]
+    height = region[3] - region[1]
+    scale = min(1.0, PREVIEW_SIZE / max(width, height, 1))
+    if GetThumbnailsEnabled() != True:
+        # The tiles are rendered without their thumbnails
+        scale = None
+    steps = [node for node in plan.GetSteps() if node.GetId() in nodes]
+    output = None
+    colors = []
+    thumbs = {}
+
+    def Paint(tile, image):
+        nonlocal output
+        if output is None:
+            output = Image.new(image.GetImage().mode, (width, height))
+            for solid_tile, color in colors:
+                output.paste(color, OffsetRegion(solid_tile, region))
+        if image.IsConstant():
+            output.paste(image.GetColor(), OffsetRegion(tile, region))
+        else:
+            output.paste(image.GetImage(), OffsetRegion(tile, region)[:2])
+
+    def Stitch(tile, image, tile_thumbs):
+        if output is None and image.IsConstant():
+            # Solid colour tiles are only painted once a tile of
+            # another colour comes along
+            if colors == [] or colors[0][1] == image.GetColor():
+                colors.append((tile, image.GetColor()))
+            else:
+                Paint(tile, image)
+        else:
+            Paint(tile, image)
+        for node_id in tile_thumbs:
+            thumb = tile_thumbs[node_id]
+            if node_id not in thumbs:
+                thumbs[node_id] = Image.new(thumb.mode, (
+                    max(round(width * scale), 1),
+                    max(round(height * scale), 1)
+                ))
+            thumbs[node_id].paste(thumb, (
+                round(tile[0] * scale) - round(region[0] * scale),
+                round(tile[1] * scale) - round(region[1] * scale)
+            ))
+
+    # The point nodes fused into the steps are locked as well
+    locked = []
+    for node in steps:
+        chain = eval_info.GetChain(node)
+        if chain is None:
+            locked.append(node)
+        else:
+            locked.extend(chain.GetNodes())
+    for node in locked:
+        node.Model.SetThumbLocked(True)
+    try:
+        if scheduler.GetWorkerCount() <= 1:
+            for count, tile in enumerate(tiles, 1):
+                Stitch(tile, *RenderRegion(eval_info, plan, nodes, inputs,
+                                           tile, scale))
+                if progress is not None:
+                    progress(count, len(tiles))
+        else:
+            # Only keep as many tiles in flight as there are workers
+            executor = scheduler.GetExecutor()
+            pending = list(reversed(tiles))
+            running = {}
+            count = 0
+            while pending != [] or running != {}:
+                while pending != [] and len(running) < scheduler.GetWorkerCount():
+                    tile = pending.pop()
+                    future = executor.submit(RenderRegion, eval_info, plan,
+                                             nodes, inputs, tile, scale)
+                    running[future] = tile
+                done, not_done = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tile = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        for future in running:
+                            future.cancel()
+                        raise
+                    Stitch(tile, *result)
+                    count += 1
+                    if progress is not None:
+                        progress(count, len(tiles))
+    finally:
+        for node in locked:
+            node.Model.SetThumbLocked(False)
+
+    for node in steps:
+        if node.GetId() not in thumbs:
+            continue
+        node.NodeSetThumb(thumbs[node.GetId()])
+        for duplicate in eval_info.GetDuplicates(node):
+            duplicate.NodeSetThumb(thumbs[node.GetId()])
+
+    image = RenderImage()
+    if output is None and colors != []:
+        image.SetAsConstant((width, height), colors[0][1])
+    else:
+        image.SetAsImage(output)
+    image.SetOrigin(region)
+    return image
+
+
+def RenderRegions(scheduler, eval_info, plan, tile_size=None, region=None,
+                  progress=None):
+    """ Execute the render plan, only rendering the pixels of each node
+    which reach the requested region of the output. Nodes such as Crop
+    narrow the region needed upstream and nodes such as Blur pad it.
+
+    The nodes which cannot render a region (input nodes, nodes needing
+    their whole input images, etc) are rendered on the whole image first.
+    When there is nothing to save, the rest of the plan is rendered on
+    the whole image as well.
+
+    :param scheduler: RenderScheduler object
+    :param eval_info: EvalInfo object holding the render state
+    :param plan: RenderPlan object to execute
+    :param tile_size: width and height of a tile in pixels or None to
+    render the region at once
+    :param region: region of the output to render or None to render
+    the whole image
+    :param progress: optional callable, called with the number of
+    completed steps and the total number of steps
+    :returns: the evaluated value of the root node of the plan
+    """
+    results = eval_info.results
+    cache = eval_info.cache
+    root = plan.GetRoot()
+    root_id = root.GetId()
+
+    if cache is not None:
+        # Work out the signatures in order so that they don't recurse
+        for node in plan.GetSteps():
+            cache.Signature(node)
+        signature = cache.Signature(root)
+        if region is not None:
+            signature = (signature, tuple(region))
+        image = cache.Get(root, signature)
+        if image is not None:
+            results[root_id] = image
+            return image
+    start_time = time.perf_counter()
+
+    if cache is not None:
+        # The cached outputs are left without dependencies, so they are
+        # fed to the region nodes like the images of input nodes
+        plan = PruneCachedNodes(plan, cache, results)
+    nodes = GetRegionNodes(eval_info, plan)
+    rendered = set()
+    while True:
+        whole = set(
+            node.GetId() for node in plan.GetSteps()
+            if node.GetId() not in nodes and node.GetId() not in rendered
+        )
+        scheduler.Execute(eval_info, plan.Subset(whole))
+        rendered.update(whole)
+        if nodes == set():
+            break
+
+        inputs, domains, mismatched = GetDomains(eval_info, plan, nodes,
+                                                 results)
+        if mismatched == set():
+            break
+        PruneRegionNodes(plan, nodes, mismatched)
+
+    if nodes == set():
+        image = results[root_id]
+        if region is not None:
+            # The root can only be rendered on the whole image
+            target = ClipRegion(region, (0, 0) + image.GetSize())
+            cropped = image.Crop(target)
+            cropped.SetOrigin(target)
+            image = cropped
+    else:
+        domain = domains[root_id]
+        if region is None:
+            target = domain
+        else:
+            target = ClipRegion(region, domain)
+
+        regions, needed = GetRegions(eval_info, plan, nodes, inputs, target)
+        if tile_size is not None:
+            image = RenderTiles(scheduler, eval_info, plan, nodes, inputs,
+                                target, tile_size, progress)
+        elif target == domain and all(needed[i] == inputs[i] for i in nodes):
+            # Nothing to save, render the whole images as usual
+            scheduler.Execute(eval_info, plan.Subset(nodes), progress)
+            image = results[root_id]
+        else:
+            image = RenderRegion(eval_info, plan, nodes, inputs, target)[0]
+            if progress is not None:
+                progress(1, 1)
+
+        # The whole images fed to the region nodes are no longer needed
+        for node_id in nodes:
+            for dep_id in plan.GetDependencies(node_id):
+                if dep_id not in nodes:
+                    results.pop(dep_id, None)
+
+    results[root_id] = image
+    if cache is not None:
+        # Recomputing the root means rendering all of the plan again
+        cache.Set(root, signature, image, time.perf_counter() - start_time)
+    return image
@@ -1,4 +1,4 @@
 from .drawing import (DrawGrid, DrawCheckerBoard, TileBackground)
 from .image import ConvertImageToWx, ExportRenderedImageToFile, GetFileExt
 from .text import TruncateText
-from .misc import PopOpenExplorer, LoadPythonScripts
+from .misc import PopOpenExplorer, LoadPythonScripts, GetFileStamp
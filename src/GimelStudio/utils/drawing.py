@@ -19,7 +19,11 @@
 # ----------------------------------------------------------------------------
 
 
-import wx
+try:
+    import wx
+except ImportError:
+    # Only drawn by the UI
+    wx = None
 
 
 # UNUSED?
@@ -42,3 +42,11 @@ class NodeNotFoundError(Exception):
     def __str__(self):
         return """The node {} could not be found in the registry.
         Maybe you forgot to register it? """.format(self._name)
+
+
+class RenderCancelledError(Exception):
+    """ This exception is raised when a render is cancelled
+    before it has finished. """
+
+    def __str__(self):
+        return "The render was cancelled."
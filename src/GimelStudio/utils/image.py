@@ -18,12 +18,17 @@
 # PURPOSE: Provide utility image manipulation, converting, exporting functions
 # ----------------------------------------------------------------------------
 
-import wx
+try:
+    import wx
+except ImportError:
+    # Only ConvertImageToWx needs wxPython
+    wx = None
+
+import hashlib
 
 from PIL import Image
 import numpy
-from numpy import (amin, amax, ravel, asarray, cast, arange, ones, newaxis,
-                   transpose, iscomplexobj, uint8, issubdtype, array)
+from numpy import iscomplexobj, uint8, issubdtype
 
 
 def ConvertImageToWx(image):
@@ -36,7 +41,7 @@ def ConvertImageToWx(image):
     bitmap = wx.Bitmap.FromBufferRGBA(
         image.size[0],
         image.size[1],
-        image.convert('RGBA').tobytes()
+        ConvertImageMode(image, 'RGBA').tobytes()
     )
     return bitmap
 
@@ -124,17 +129,82 @@ def ExportRenderedImageToFile(rendered_image, export_path,
                             bits=bits, compress_level=compress_level)
 
 
-# -------------------------------------------------------------
-# Below functions are from taken from scipy 0.15.0
-# (scipy.misc.pilutil.py) to support converting from
-# np arrays to PIL image and vice-versa.
-# -------------------------------------------------------------
-# TODO: These don't need to be here. Should be using PIL as these
-# are depreciated!
+def ScaleImage(image, scale):
+    """ Scales the image down for rendering at the given render scale.
+    Whole fractions (1/2, 1/4, etc) use the fast box reduction.
+
+    :param image: ``PIL Image`` object to be scaled
+    :param float scale: render scale relative to the full resolution
+    :returns: scaled ``PIL Image`` object
+    """
+    if scale >= 1.0:
+        return image
+
+    factor = 1.0 / scale
+    if abs(factor - round(factor)) < 1e-6:
+        return image.reduce(int(round(factor)))
+
+    size = (max(int(round(image.size[0] * scale)), 1),
+            max(int(round(image.size[1] * scale)), 1))
+    return image.resize(size, Image.BILINEAR)
+
+
+def ConvertImageMode(image, mode):
+    """ Convert the image to the given mode, unless it already is in that
+    mode (``Image.convert`` copies the image even then).
+
+    :param image: ``PIL Image``
+    :param mode: PIL image mode (e.g: RGBA)
+    :returns: ``PIL Image`` in the given mode
+    """
+    if image.mode == mode:
+        return image
+    return image.convert(mode)
+
+
+def EnhanceTable(degenerate, factor):
+    """ Get the lookup table of ``Image.blend(degenerate, image, factor)``,
+    which the ``ImageEnhance`` classes use, for a channel of the image
+    when that channel of the degenerate image has the given value. The
+    table is computed in single precision, like ``Image.blend`` does, so
+    it gives the same values.
+
+    :param degenerate: value of the channel in the degenerate image
+    :param factor: enhancement factor
+    :returns: uint8 NumPy array of the 256 output values
+    """
+    values = numpy.arange(256, dtype=numpy.float32)
+    base = numpy.float32(degenerate)
+    values = base + numpy.float32(factor) * (values - base)
+    return numpy.clip(values, 0, 255).astype(uint8)
+
+
+def GetConstantPixels(images):
+    """ Get a single pixel image of the colour of each of the given
+    images, if they are all solid colour images of the same size (see
+    ``RenderImage.SetAsConstant``). Nodes which set each pixel from the
+    pixels at the same place in their input images can then work out
+    the colour of their output from these pixels alone.
+
+    :param images: list of RenderImage objects
+    :returns: list of 1x1 RGBA PIL images or None
+    """
+    for image in images:
+        if (image.IsConstant() != True
+                or image.GetSize() != images[0].GetSize()):
+            return None
+    return [Image.new("RGBA", (1, 1), image.GetColor()) for image in images]
+
 
-# Returns a byte-scaled image
 def bytescale(data, cmin=None, cmax=None, high=255, low=0):
-    if data.dtype == uint8:
+    """ Scale the values of the array from [cmin, cmax] (by default the
+    range of the data) to [low, high] and convert it to uint8. uint8
+    arrays are returned as they are unless cmin or cmax is given.
+
+    :param data: NumPy array
+    :returns: uint8 NumPy array
+    """
+    if data.dtype == uint8 and cmin is None and cmax is None:
         return data
 
     if high < low:
@@ -151,151 +221,110 @@ def bytescale(data, cmin=None, cmax=None, high=255, low=0):
     elif cscale == 0:
         cscale = 1
 
-    scale = float(high - low) / cscale
-    bytedata = (data * 1.0 - cmin) * scale + 0.4999
-    bytedata[bytedata > high] = high
-    bytedata[bytedata < 0] = 0
-    return cast[uint8](bytedata) + cast[uint8](low)
-
-
-def ArrayFromImage(im, flatten=0):
-    """
-    Return a copy of a PIL image as a numpy array.
-
-    Parameters
-    ----------
-    im : PIL image
-        Input image.
-    flatten : bool
-        If true, convert the output to grey-scale.
-
-    Returns
-    -------
-    fromimage : ndarray
-        The different colour bands/channels are stored in the
-        third dimension, such that a grey-image is MxN, an
-        RGB-image MxNx3 and an RGBA-image MxNx4.
-
+    # Work on a single float copy of the data, in place
+    if issubdtype(data.dtype, numpy.floating):
+        bytedata = numpy.array(data)
+    else:
+        bytedata = data.astype(numpy.float64)
+    bytedata -= cmin
+    bytedata *= float(high - low) / cscale
+    bytedata += 0.4999
+    numpy.clip(bytedata, 0, high, out=bytedata)
+    bytedata = bytedata.astype(uint8)
+    if low != 0:
+        bytedata += uint8(low)
+    return bytedata
+
+
+def ArrayFromImage(im, flatten=False):
+    """ Get the pixels of a PIL image as a NumPy array.
+
+    The array has the dtype of the image mode (uint8 for L, RGB and RGBA
+    images) and a (height, width) shape for single channel images or a
+    (height, width, channels) shape, with the channels in the order of
+    the image mode (e.g: RGBA). It is read-only, as it may share its memory
+    with the image, so copy it before modifying it in place.
+
+    :param im: ``PIL Image``
+    :param flatten: if True, convert the image to grey-scale floats first
+    :returns: read-only NumPy array
     """
     if not Image.isImageType(im):
         raise TypeError("Input is not a PIL image.")
     if flatten:
         im = im.convert('F')
     elif im.mode == '1':
-        # workaround for crash in PIL, see #1613.
-        im.convert('L')
+        im = im.convert('L')
+
+    array = numpy.asarray(im)
+    if array.flags.writeable:
+        array.flags.writeable = False
+    return array
+
+
+def ArrayToImage(arr, mode=None, cmin=None, cmax=None, high=255, low=0):
+    """ Get a PIL image of the pixels of a NumPy array.
+
+    The array must have a (height, width) shape for a grey-scale (L)
+    image, or a (height, width, 3) or (height, width, 4) shape for an RGB
+    or RGBA image. uint8 arrays are used as they are: contiguous 2-D and
+    RGBA arrays are wrapped without copying, so the array must not be
+    modified in place afterwards. Arrays of other types are byte-scaled
+    from [cmin, cmax] (by default the range of the data) to [low, high].
+
+    :param arr: NumPy array
+    :param mode: optional PIL image mode to convert the image to. The
+    image is only converted if it is in another mode.
+    :param cmin: value mapped to low when byte-scaling
+    :param cmax: value mapped to high when byte-scaling
+    :returns: ``PIL Image``
+    """
+    data = numpy.asarray(arr)
+    if iscomplexobj(data):
+        raise ValueError("Cannot convert a complex-valued array.")
+
+    if data.ndim == 2:
+        image_mode = 'L'
+    elif data.ndim == 3 and data.shape[2] == 3:
+        image_mode = 'RGB'
+    elif data.ndim == 3 and data.shape[2] == 4:
+        image_mode = 'RGBA'
+    else:
+        raise ValueError("'arr' does not have a suitable array shape for "
+                         "any mode.")
 
-    return array(im)
+    data = numpy.ascontiguousarray(bytescale(data, cmin, cmax, high, low))
+    size = (data.shape[1], data.shape[0])
+    image = Image.frombuffer(image_mode, size, data, 'raw', image_mode, 0, 1)
 
+    if mode is not None:
+        return ConvertImageMode(image, mode)
+    return image
 
-def ArrayToImage(arr, high=255, low=0, cmin=None, cmax=None, pal=None,
-                 mode=None, channel_axis=None):
-    """Takes a numpy array and returns a PIL image.
-    The mode of the PIL image depends on the array shape and the `pal` and
-    `mode` keywords.
 
-    For 2-D arrays, if `pal` is a valid (N,3) byte-array giving the RGB values
-    (from 0 to 255) then ``mode='P'``, otherwise ``mode='L'``, unless mode
-    is given as 'F' or 'I' in which case a float and/or integer array is made.
+def HashArray(array):
+    """ Get a hash of the contents of a NumPy array, to tell whether two
+    images are identical. The memory of the array is hashed where it is,
+    without copying it (views which are not contiguous are hashed one row
+    at a time). The shape and type of the array are part of the hash.
 
-    Notes
-    -----
-    For 3-D arrays, the `channel_axis` argument tells which dimension of the
-    array holds the channel data.
+    :param array: NumPy array
+    :returns: hexadecimal hash
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update("{}{}".format(array.shape, array.dtype.str).encode("utf-8"))
+    if array.flags.c_contiguous:
+        hasher.update(array)
+    else:
+        for row in array:
+            hasher.update(numpy.ascontiguousarray(row))
+    return hasher.hexdigest()
 
-    For 3-D arrays if one of the dimensions is 3, the mode is 'RGB'
-    by default or 'YCbCr' if selected.
 
-    The numpy array must be either 2 dimensional or 3 dimensional.
+def HashImage(image):
+    """ Get a hash of the pixels of a PIL image. See ``HashArray``.
 
+    :param image: ``PIL Image``
+    :returns: hexadecimal hash
     """
-    data = asarray(arr)
-    if iscomplexobj(data):
-        raise ValueError("Cannot convert a complex-valued array.")
-    shape = list(data.shape)
-    valid = len(shape) == 2 or ((len(shape) == 3) and
-                                ((3 in shape) or (4 in shape)))
-    if not valid:
-        raise ValueError("'arr' does not have a suitable array shape for "
-                         "any mode.")
-    if len(shape) == 2:
-        shape = (shape[1], shape[0])  # columns show up first
-        if mode == 'F':
-            data32 = data.astype(numpy.float32)
-            image = Image.frombytes(mode, shape, data32.tostring())
-            return image
-        if mode in [None, 'L', 'P']:
-            bytedata = bytescale(data, high=high, low=low,
-                                 cmin=cmin, cmax=cmax)
-            image = Image.frombytes('L', shape, bytedata.tostring())
-            if pal is not None:
-                image.putpalette(asarray(pal, dtype=uint8).tostring())
-                # Becomes a mode='P' automagically.
-            elif mode == 'P':  # default gray-scale
-                pal = (arange(0, 256, 1, dtype=uint8)[:, newaxis] *
-                       ones((3,), dtype=uint8)[newaxis, :])
-                image.putpalette(asarray(pal, dtype=uint8).tostring())
-            return image
-        if mode == '1':  # high input gives threshold for 1
-            bytedata = (data > high)
-            image = Image.frombytes('1', shape, bytedata.tostring())
-            return image
-        if cmin is None:
-            cmin = amin(ravel(data))
-        if cmax is None:
-            cmax = amax(ravel(data))
-        data = (data * 1.0 - cmin) * (high - low) / (cmax - cmin) + low
-        if mode == 'I':
-            data32 = data.astype(numpy.uint32)
-            image = Image.frombytes(mode, shape, data32.tostring())
-        else:
-            raise ValueError(_errstr)
-        return image
-
-    # if here then 3-d array with a 3 or a 4 in the shape length.
-    # Check for 3 in datacube shape --- 'RGB' or 'YCbCr'
-    if channel_axis is None:
-        if (3 in shape):
-            ca = numpy.flatnonzero(asarray(shape) == 3)[0]
-        else:
-            ca = numpy.flatnonzero(asarray(shape) == 4)
-            if len(ca):
-                ca = ca[0]
-            else:
-                raise ValueError("Could not find channel dimension.")
-    else:
-        ca = channel_axis
-
-    numch = shape[ca]
-    if numch not in [3, 4]:
-        raise ValueError("Channel axis dimension is not valid.")
-
-    bytedata = bytescale(data, high=high, low=low, cmin=cmin, cmax=cmax)
-    if ca == 2:
-        strdata = bytedata.tostring()
-        shape = (shape[1], shape[0])
-    elif ca == 1:
-        strdata = transpose(bytedata, (0, 2, 1)).tostring()
-        shape = (shape[2], shape[0])
-    elif ca == 0:
-        strdata = transpose(bytedata, (1, 2, 0)).tostring()
-        shape = (shape[2], shape[1])
-    if mode is None:
-        if numch == 3:
-            mode = 'RGB'
-        else:
-            mode = 'RGBA'
-
-    if mode not in ['RGB', 'RGBA', 'YCbCr', 'CMYK']:
-        raise ValueError(_errstr)
-
-    if mode in ['RGB', 'YCbCr']:
-        if numch != 3:
-            raise ValueError("Invalid array shape for mode.")
-    if mode in ['RGBA', 'CMYK']:
-        if numch != 4:
-            raise ValueError("Invalid array shape for mode.")
-
-    # Here we know data and mode is correct
-    image = Image.frombytes(mode, shape, strdata)
-    return image
+    return HashArray(ArrayFromImage(image))
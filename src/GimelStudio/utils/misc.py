@@ -37,6 +37,21 @@ def PopOpenExplorer(path):
         subprocess.Popen(["xdg-open", path])
 
 
+def GetFileStamp(path):
+    """ Returns the modification time and size of the file, so that
+    changes to it can be detected without reading it.
+
+    :param path: file path
+    :returns: tuple of the modification time in nanoseconds and the size
+    in bytes or (None, None) if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return (None, None)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
 def LoadPythonScripts(directory):
     """ Loads python scripts from the given directory. """
 
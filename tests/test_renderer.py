@@ -0,0 +1,282 @@
+# ----------------------------------------------------------------------------
+# Gimel Studio Copyright 2019-2021 by Noah Rahm and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# FILE: test_renderer.py
+# AUTHOR(S): Gimel Studio contributors
+# PURPOSE: Regression tests for the renderer
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import pickle
+
+import numpy
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from GimelStudio import meta
+import GimelStudio.node_importer
+from GimelStudio.project import (SnapshotNodeGraph, RestoreNodeGraph,
+                                 SerializeNodeGraph, DeserializeNodeGraph)
+from GimelStudio.registry import CreateNode
+from GimelStudio.renderer import Renderer
+
+# Don't leave node outputs on disk between the tests
+meta.ENABLE_DISK_SPILL = False
+
+
+def MakeNode(node_type, **properties):
+    node = CreateNode(None, node_type, (0, 0), None)
+    for idname in properties:
+        node.Properties[idname].value = properties[idname]
+    return node
+
+
+def MakeGraph(*nodes):
+    """ Bind each node to the "Image" parameter of the next one and
+    return the nodes dictionary of the graph.
+    """
+    for node, consumer in zip(nodes, nodes[1:]):
+        consumer.Parameters["Image"].binding = node
+    return {node.GetId(): node for node in nodes}
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = str(tmp_path / "image.png")
+    pixels = numpy.random.RandomState(0).randint(0, 255, (300, 400, 4),
+                                                 numpy.uint8)
+    Image.fromarray(pixels).save(path)
+    return path
+
+
+def test_tiled_render_of_empty_crop(image_path):
+    # Cropping past the right edge of the image leaves no pixels, so
+    # there are no tiles to take the node thumbnails from
+    results = []
+    for tile_size in (None, 64):
+        graph = MakeGraph(
+            MakeNode("corenode_image", **{"File Path": image_path}),
+            MakeNode("corenode_crop", Method="Rectangle", X=900, Y=10,
+                     Width=100, Height=100),
+            MakeNode("corenode_brightness", Amount=1.3),
+            MakeNode("corenode_outputcomposite")
+        )
+        renderer = Renderer(None)
+        renderer.SetTileSize(tile_size)
+        results.append(numpy.asarray(renderer.Render(graph)))
+    assert results[0].shape == results[1].shape
+
+
+def test_proxy_render_of_region(image_path):
+    # The region is given in full resolution pixels, so a proxy render
+    # of a region shows the same part of the image as a full render
+    def Render(region, scale):
+        graph = MakeGraph(
+            MakeNode("corenode_image", **{"File Path": image_path}),
+            MakeNode("corenode_blur", **{"Filter Type": "Gaussian",
+                                         "Kernel X": 4, "Kernel Y": 4}),
+            MakeNode("corenode_brightness", Amount=1.3),
+            MakeNode("corenode_outputcomposite")
+        )
+        return Renderer(None).Render(graph, region, scale)
+
+    region = (51, 33, 251, 171)
+    full = Render(region, 1.0)
+    proxy = Render(region, 0.5)
+    assert proxy.size == (101, 70)
+    assert abs(proxy.size[0] - full.size[0] / 2) <= 1
+    assert abs(proxy.size[1] - full.size[1] / 2) <= 1
+
+    # The scaled region is rounded outwards to whole proxy pixels
+    whole = Render(None, 0.5)
+    expected = numpy.asarray(whole.crop((25, 16, 126, 86)))
+    assert numpy.array_equal(numpy.asarray(proxy), expected)
+
+
+def test_cache_budget_keeps_input_of_edited_node():
+    # With room for two outputs, the cached input of the edited node
+    # must not be evicted by re-evaluating the nodes upstream of it
+    nodes = [MakeNode("corenode_noiseimage", Size=[500, 500])]
+    for index in range(4):
+        nodes.append(MakeNode("corenode_blur", **{"Filter Type": "Gaussian"}))
+    graph = MakeGraph(*nodes + [MakeNode("corenode_outputcomposite")])
+
+    renderer = Renderer(None)
+    renderer.GetCache().SetBudget(2 * 500 * 500 * 4)
+    renderer.Render(graph)
+    for kernel in (2, 3, 4):
+        nodes[-1].Properties["Kernel X"].value = kernel
+        nodes[-1].Model.SetDirty(True)
+        hits = renderer.GetCache().GetStats()["hits"]
+        renderer.Render(graph)
+        assert renderer.GetCache().GetStats()["hits"] == hits + 1
+
+
+def MakeDiamond(image_path):
+    """ Return the nodes dictionary of a graph where the image feeds two
+    branches which are blended back together.
+    """
+    image = MakeNode("corenode_image", **{"File Path": image_path})
+    blur = MakeNode("corenode_blur", **{"Filter Type": "Gaussian",
+                                        "Kernel X": 3, "Kernel Y": 3})
+    contrast = MakeNode("corenode_contrast", Amount=1.5)
+    mix = MakeNode("corenode_mix", **{"Blend Mode": "Screen"})
+    output = MakeNode("corenode_outputcomposite")
+    blur.Parameters["Image"].binding = image
+    contrast.Parameters["Image"].binding = image
+    mix.Parameters["Image"].binding = blur
+    mix.Parameters["Overlay"].binding = contrast
+    output.Parameters["Image"].binding = mix
+    return {node.GetId(): node for node in (image, blur, contrast, mix,
+                                            output)}
+
+
+@pytest.mark.parametrize("tile_size", [None, 64])
+def test_parallel_render_matches_serial_render(image_path, tile_size):
+    results = []
+    for workers in (1, 4):
+        renderer = Renderer(None)
+        renderer.SetWorkerCount(workers)
+        renderer.SetTileSize(tile_size)
+        results.append(numpy.asarray(renderer.Render(MakeDiamond(image_path))))
+    assert numpy.array_equal(results[0], results[1])
+
+
+def test_merged_duplicates_render_the_same_image(image_path, monkeypatch):
+    def Render(merge):
+        monkeypatch.setattr(meta, "MERGE_DUPLICATE_NODES", merge)
+        image = MakeNode("corenode_image", **{"File Path": image_path})
+        first = MakeNode("corenode_blur", **{"Filter Type": "Gaussian"})
+        second = MakeNode("corenode_blur", **{"Filter Type": "Gaussian"})
+        mix = MakeNode("corenode_mix", **{"Blend Mode": "Difference"})
+        output = MakeNode("corenode_outputcomposite")
+        first.Parameters["Image"].binding = image
+        second.Parameters["Image"].binding = image
+        mix.Parameters["Image"].binding = first
+        mix.Parameters["Overlay"].binding = second
+        output.Parameters["Image"].binding = mix
+        renderer = Renderer(None)
+        result = renderer.Render({node.GetId(): node for node in (
+            image, first, second, mix, output)})
+        return numpy.asarray(result), renderer.GetMergedCount()
+
+    merged, count = Render(True)
+    assert count == 1
+    unmerged, count = Render(False)
+    assert count == 0
+    assert numpy.array_equal(merged, unmerged)
+
+
+def test_random_nodes_are_not_merged(monkeypatch):
+    monkeypatch.setattr(meta, "MERGE_DUPLICATE_NODES", True)
+    first = MakeNode("corenode_noiseimage", Size=[64, 64])
+    second = MakeNode("corenode_noiseimage", Size=[64, 64])
+    mix = MakeNode("corenode_mix", **{"Blend Mode": "Difference"})
+    output = MakeNode("corenode_outputcomposite")
+    mix.Parameters["Image"].binding = first
+    mix.Parameters["Overlay"].binding = second
+    output.Parameters["Image"].binding = mix
+    renderer = Renderer(None)
+    renderer.Render({node.GetId(): node for node in (first, second, mix,
+                                                     output)})
+    assert renderer.GetMergedCount() == 0
+
+
+@pytest.mark.parametrize("tile_size", [None, 64])
+def test_fused_point_nodes_render_the_same_image(image_path, monkeypatch,
+                                                 tile_size):
+    def Render(fuse):
+        monkeypatch.setattr(meta, "FUSE_POINT_NODES", fuse)
+        graph = MakeGraph(
+            MakeNode("corenode_image", **{"File Path": image_path}),
+            MakeNode("corenode_brightness", Amount=1.2),
+            MakeNode("corenode_contrast", Amount=1.4),
+            MakeNode("corenode_invert"),
+            MakeNode("corenode_outputcomposite")
+        )
+        renderer = Renderer(None)
+        renderer.SetTileSize(tile_size)
+        result = renderer.Render(graph)
+        return numpy.asarray(result).astype(int), renderer.GetFusedCount()
+
+    fused, count = Render(True)
+    assert count > 0
+    unfused, count = Render(False)
+    assert count == 0
+    assert fused.shape == unfused.shape
+    assert numpy.abs(fused - unfused).max() <= 1
+
+
+@pytest.mark.parametrize("tile_size", [None, 64])
+def test_fused_geometric_nodes_render_the_same_image(image_path, monkeypatch,
+                                                     tile_size):
+    def Render(fuse):
+        monkeypatch.setattr(meta, "FUSE_GEOMETRIC_NODES", fuse)
+        graph = MakeGraph(
+            MakeNode("corenode_image", **{"File Path": image_path}),
+            MakeNode("corenode_crop", Method="Rectangle", X=30, Y=20,
+                     Width=300, Height=200),
+            MakeNode("corenode_flip", Direction="Vertical"),
+            MakeNode("corenode_crop", Method="Rectangle", X=10, Y=40,
+                     Width=250, Height=120),
+            MakeNode("corenode_flip", Direction="Horizontal"),
+            MakeNode("corenode_outputcomposite")
+        )
+        renderer = Renderer(None)
+        renderer.SetTileSize(tile_size)
+        result = renderer.Render(graph)
+        return numpy.asarray(result).astype(int), renderer.GetFusedCount()
+
+    fused, count = Render(True)
+    assert count > 0
+    unfused, count = Render(False)
+    assert count == 0
+    assert fused.shape == unfused.shape
+    assert numpy.abs(fused - unfused).max() <= 1
+
+
+def test_node_graph_snapshot_round_trip(image_path):
+    graph = MakeDiamond(image_path)
+    expected = numpy.asarray(Renderer(None).Render(MakeDiamond(image_path)))
+    snapshot = SnapshotNodeGraph(graph)
+
+    def Describe(nodes):
+        # The nodes get new ids, so describe each one by its type, its
+        # property values and the types of the nodes bound to it
+        description = []
+        for node in nodes.values():
+            properties = node.Model.GetData().GetProperties()
+            bindings = dict(
+                (name, param.binding.GetType() if param.binding else None)
+                for name, param in node.Parameters.items()
+            )
+            description.append(repr((node.GetType(),
+                                     sorted(properties.items()),
+                                     sorted(bindings.items()))))
+        return sorted(description)
+
+    for restored in (
+        RestoreNodeGraph(pickle.loads(pickle.dumps(snapshot))),
+        DeserializeNodeGraph(json.loads(json.dumps(
+            SerializeNodeGraph(graph))))
+    ):
+        assert set(restored).isdisjoint(graph)
+        assert Describe(restored) == Describe(graph)
+        result = numpy.asarray(Renderer(None).Render(restored))
+        assert numpy.array_equal(result, expected)